@@ -16,7 +16,23 @@ pyinstaller --noconfirm --onefile --windowed --name "MeshtasticGUI" \
     --add-data "$CTK_PATH:customtkinter/" \
     --add-data "chess_ui.py:." \
     --add-data "chess_engine.py:." \
+    --add-data "chess_ai.py:." \
+    --add-data "chess_book.py:." \
+    --add-data "polyglot_keys.py:." \
+    --add-data "chess_protocol.py:." \
+    --add-data "chess_delivery.py:." \
+    --add-data "chat_store.py:." \
+    --add-data "chat_history.py:." \
     --add-data "mesh_interface.py:." \
+    --add-data "mesh_capture.py:." \
+    --add-data "mesh_scheduler.py:." \
+    --add-data "mesh_coalesce.py:." \
+    --add-data "mesh_dispatch.py:." \
+    --add-data "mesh_events.py:." \
+    --add-data "mesh_compress.py:." \
+    --add-data "mesh_fragment.py:." \
+    --add-data "mesh_positions.py:." \
+    --add-data "gui_panels.py:." \
     --add-data "gui.py:." \
     main.py
 
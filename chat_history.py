@@ -0,0 +1,220 @@
+"""Chat, trace and node history kept in SQLite across restarts.
+
+All writes go through one background thread that batches them into a
+single transaction every BATCH_DELAY seconds (or BATCH_MAX rows), with the
+database in WAL mode so reads from the GUI thread never wait on it. Reads
+are indexed page queries - the newest PAGE_SIZE messages of a conversation,
+then the page before that, and so on - so opening the app costs the same
+whether the database holds a day or a year of traffic.
+
+Message text is also indexed with FTS5 (kept in step by a trigger, so
+every write updates it) for ranked search() across all conversations.
+
+Node ids are stored as given (int or '!hex' string); the id columns have
+no declared type so SQLite keeps them that way.
+"""
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".meshtastic-desktop", "history.db")
+
+PAGE_SIZE = 50
+BATCH_MAX = 500
+BATCH_DELAY = 0.5 # seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    conv NOT NULL,
+    sender,
+    recipient,
+    text TEXT NOT NULL,
+    time REAL NOT NULL,
+    is_self INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_conv ON messages (kind, conv, id);
+CREATE INDEX IF NOT EXISTS messages_time ON messages (time);
+CREATE TABLE IF NOT EXISTS conversations (
+    kind TEXT NOT NULL,
+    conv NOT NULL,
+    last_time REAL NOT NULL,
+    PRIMARY KEY (kind, conv)
+);
+CREATE TABLE IF NOT EXISTS traces (
+    id INTEGER PRIMARY KEY,
+    node NOT NULL,
+    route TEXT NOT NULL,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS traces_node ON traces (node, id);
+CREATE TABLE IF NOT EXISTS nodes (
+    node PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+# External-content index over messages.text; the trigger keeps it current
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE messages_fts USING fts5 (
+    text, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+SEARCH_LIMIT = 100
+# Only the newest this many matches get ranked - scoring every message that
+# contains a common word would take a noticeable fraction of a second
+SEARCH_WINDOW = 5000
+
+_INSERT_MESSAGE = "INSERT INTO messages (kind, conv, sender, recipient, text, time, is_self) VALUES (?, ?, ?, ?, ?, ?, ?)"
+_TOUCH_CONVERSATION = ("INSERT INTO conversations (kind, conv, last_time) VALUES (?, ?, ?) "
+                       "ON CONFLICT (kind, conv) DO UPDATE SET last_time = MAX(last_time, excluded.last_time)")
+
+
+def fts_query(text):
+    """User input -> FTS5 query: all words must match, the last one as a
+    prefix (so results show up while typing). Words are quoted so
+    punctuation and FTS keywords (AND, NEAR, ...) are taken literally."""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{w}"' for w in words) + "*"
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL") # Safe with WAL; a crash loses at most the last batch
+    return conn
+
+
+class ChatHistory:
+    def __init__(self, path=HISTORY_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._read = _connect(path)
+        self._read.executescript(SCHEMA)
+        self.fts = self._setup_fts()
+        self._read_lock = threading.Lock()
+        # Anything this session writes gets a bigger id than this, which is
+        # where paging back into older history starts
+        self.session_start = self._read.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # --- Writes (queued) ---
+
+    def add_message(self, kind, conv, msg):
+        self._queue.put((_INSERT_MESSAGE, (kind, conv, msg.sender, msg.to, msg.text, msg.time, int(msg.is_self))))
+        self._queue.put((_TOUCH_CONVERSATION, (kind, conv, msg.time)))
+
+    def add_trace(self, node, route, when):
+        self._queue.put(("INSERT INTO traces (node, route, time) VALUES (?, ?, ?)", (node, json.dumps(route), when)))
+
+    def save_node(self, node_id, node, when):
+        self._queue.put(("INSERT OR REPLACE INTO nodes (node, data, updated) VALUES (?, ?, ?)",
+                         (node_id, json.dumps(node, default=str), when)))
+
+    # --- Reads ---
+
+    def conversations(self):
+        """[(kind, conv), ...], most recently active first."""
+        return self._query("SELECT kind, conv FROM conversations ORDER BY last_time DESC")
+
+    def messages(self, kind, conv, before_id, limit=PAGE_SIZE, before_time=None):
+        """Up to `limit` messages older than row before_id (None = any) and
+        sent before before_time (if given), oldest first, as (id, sender,
+        recipient, text, time, is_self) rows."""
+        rows = self._query("SELECT id, sender, recipient, text, time, is_self FROM messages "
+                           "WHERE kind = ? AND conv = ? AND id < ? AND time < ? ORDER BY id DESC LIMIT ?",
+                           (kind, conv, 2 ** 63 - 1 if before_id is None else before_id,
+                            float('inf') if before_time is None else before_time, limit))
+        rows.reverse()
+        return rows
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """Best matches for text across all conversations (bm25 over the
+        newest SEARCH_WINDOW matches), as (kind, conv, sender, text, time,
+        is_self) rows."""
+        query = fts_query(text)
+        if not query or not self.fts:
+            return []
+        return self._query("SELECT m.kind, m.conv, m.sender, m.text, m.time, m.is_self "
+                           "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                           "WHERE messages_fts MATCH ?1 AND messages_fts.rowid >= COALESCE("
+                           "(SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?1 ORDER BY rowid DESC LIMIT 1 OFFSET ?3), 0) "
+                           "ORDER BY rank LIMIT ?2", (query, limit, SEARCH_WINDOW - 1))
+
+    def latest_traces(self):
+        """{node: route} with each node's most recent trace."""
+        rows = self._query("SELECT node, route FROM traces WHERE id IN (SELECT MAX(id) FROM traces GROUP BY node)")
+        return {node: json.loads(route) for node, route in rows}
+
+    def nodes(self):
+        return {node: json.loads(data) for node, data in self._query("SELECT node, data FROM nodes")}
+
+    def _setup_fts(self):
+        if self._read.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+            return True
+        try:
+            self._read.executescript(FTS_SCHEMA)
+            # Index whatever was written before search existed
+            with self._read:
+                self._read.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            print(f"Message search disabled (no FTS5?): {e}")
+            return False
+        return True
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._read.execute(sql, params).fetchall()
+
+    def close(self):
+        """Write out whatever is queued and stop."""
+        self._queue.put(None)
+        self._thread.join(timeout=30)
+        with self._read_lock:
+            self._read.close()
+
+    def _run(self):
+        conn = _connect(self.path)
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Gather whatever else arrives shortly, then write it all in one transaction
+            deadline = time.monotonic() + BATCH_DELAY
+            try:
+                while len(batch) < BATCH_MAX:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            try:
+                with conn:
+                    for sql, params in batch:
+                        conn.execute(sql, params)
+            except sqlite3.Error as e:
+                print(f"History write failed ({len(batch)} rows lost): {e}")
+        conn.close()
@@ -0,0 +1,150 @@
+"""In-memory chat history with a cap per conversation.
+
+Each conversation is a ring buffer of compact ChatMessage records. Messages
+get an absolute index (0 for the first added this session, negative for
+older history paged in with prepend()) that stays valid as old ones fall
+off the front, so a reader can ask for "everything from index n" or just
+the tail without copying the whole history.
+
+Older history the user pages in goes in front of the ring while it has
+room and into a separate `older` list once it is full; that list isn't
+capped (the user asked for those pages) and continues the same indexes,
+so `first`..`end` is everything held.
+"""
+
+MAX_MESSAGES = 1000 # Per conversation
+
+
+class ChatMessage:
+    __slots__ = ('sender', 'to', 'text', 'time', 'is_self', 'db_id')
+
+    def __init__(self, sender, to, text, time, is_self=False, db_id=None):
+        self.sender = sender
+        self.to = to
+        self.text = text
+        self.time = time
+        self.is_self = is_self
+        self.db_id = db_id # Row id if loaded from chat_history, else None
+
+    def __repr__(self):
+        return f"ChatMessage({self.sender} -> {self.to}: {self.text!r})"
+
+
+class Conversation:
+    __slots__ = ('_items', 'older', 'start', 'end', 'version')
+
+    def __init__(self, cap=MAX_MESSAGES):
+        self._items = [None] * cap
+        self.older = [] # Paged-in history before the ring, oldest first
+        self.start = 0 # Absolute index of the oldest message in the ring
+        self.end = 0 # Absolute index of the next message
+        self.version = 0 # Bumped on every change
+
+    def __len__(self):
+        return self.end - self.first
+
+    @property
+    def first(self):
+        """Absolute index of the oldest message held (ring or older)."""
+        return self.start - len(self.older)
+
+    def append(self, msg):
+        cap = len(self._items)
+        if self.end - self.start == cap:
+            if self.older:
+                # Keep the paged-in history joined up with the ring
+                self.older.append(self._items[self.start % cap])
+            self._items[self.start % cap] = None
+            self.start += 1
+        self._items[self.end % cap] = msg
+        self.end += 1
+        self.version += 1
+
+    def prepend(self, msgs):
+        """Put older messages (oldest first) in front of what we hold: into
+        the ring while it has room, the rest into `older`. Returns how many
+        were added (all of them)."""
+        cap = len(self._items)
+        fit = 0 if self.older else min(cap - (self.end - self.start), len(msgs))
+        for msg in reversed(msgs[len(msgs) - fit:]):
+            self.start -= 1
+            self._items[self.start % cap] = msg
+        if fit < len(msgs):
+            self.older[:0] = msgs[:len(msgs) - fit]
+        if msgs:
+            self.version += 1
+        return len(msgs)
+
+    def oldest(self):
+        if self.older:
+            return self.older[0]
+        return self._items[self.start % len(self._items)] if self.end > self.start else None
+
+    def range(self, start, stop=None):
+        """Messages with absolute index in [start, stop), clipped to what is held."""
+        first = self.first
+        start = max(start, first)
+        stop = self.end if stop is None else min(stop, self.end)
+        if start >= stop:
+            return []
+        msgs = self.older[start - first:max(min(stop, self.start) - first, 0)]
+        cap = len(self._items)
+        msgs.extend(self._items[i % cap] for i in range(max(start, self.start), stop))
+        return msgs
+
+    def tail(self, n):
+        return self.range(self.end - n)
+
+
+class ChatStore:
+    def __init__(self, cap=MAX_MESSAGES):
+        self.cap = cap
+        self.channels = {} # channel index -> Conversation
+        self.dms = {} # other node's id -> Conversation
+        self._ids = {} # Node ids, so every message from a node shares one object
+
+    def conversations(self, kind):
+        """'channel' or 'dm' (the GUI's tab types) -> that dict"""
+        return self.channels if kind == 'channel' else self.dms
+
+    def get(self, kind, key, create=False):
+        conversations = self.conversations(kind)
+        conv = conversations.get(key)
+        if conv is None and create:
+            conv = conversations[self.intern(key)] = Conversation(self.cap)
+        return conv
+
+    def intern(self, node_id):
+        return self._ids.setdefault(node_id, node_id)
+
+    def add(self, conversations, key, msg):
+        key = self.intern(key)
+        msg.sender = self.intern(msg.sender)
+        conv = conversations.get(key)
+        if conv is None:
+            conv = conversations[key] = Conversation(self.cap)
+        conv.append(msg)
+        return msg
+
+    def load_older(self, history, kind, key, count):
+        """Page up to `count` messages older than anything held in from a
+        chat_history.ChatHistory. Returns how many were added (0 = no more)."""
+        conv = self.get(kind, key, create=True)
+        oldest = conv.oldest()
+        if oldest is not None and oldest.db_id is not None:
+            rows = history.messages(kind, key, oldest.db_id, count)
+        elif conv.first > 0:
+            # Some of this session's messages have already fallen out of the
+            # ring; they have no row id here, so go by time
+            rows = history.messages(kind, key, None, count, before_time=oldest.time)
+        else:
+            rows = history.messages(kind, key, history.session_start + 1, count) # Nothing older loaded yet
+        msgs = [ChatMessage(self.intern(sender), to, text, t, bool(is_self), db_id)
+                for db_id, sender, to, text, t, is_self in rows]
+        return conv.prepend(msgs)
+
+    def add_channel(self, index, msg):
+        return self.add(self.channels, index, msg)
+
+    def add_dm(self, node_id, msg):
+        return self.add(self.dms, node_id, msg)
@@ -0,0 +1,409 @@
+"""Computer opponent for the Game tab.
+
+Iterative-deepening alpha-beta (negamax) with a transposition table keyed
+by the engine's Zobrist hash, move ordering (hash move, MVV-LVA captures,
+killers, history) and a capture-only quiescence search. The search runs in
+a separate process (SearchWorker) so the Tk main loop never waits on it;
+progress and the final move come back through a queue.
+"""
+import multiprocessing
+import queue
+import time
+
+import chess_book
+from chess_engine import (GameState, START_FEN, code_to_uci, EMPTY, PIECE_CODES,
+                          WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING,
+                          MOVE_FLAGS, MOVE_PROMOTION, MOVE_EN_PASSANT)
+
+INF = 1000000
+MATE = 100000
+MAX_DEPTH = 64
+
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+
+# Piece-square tables from White's point of view, listed rank 8 first
+# (so entry [sq ^ 56] is White's bonus on bitboard square sq).
+_PST = {
+    PAWN: (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0),
+    KNIGHT: (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50),
+    BISHOP: (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20),
+    ROOK: (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0),
+    QUEEN: (
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20),
+    KING: (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20),
+}
+_KING_ENDGAME = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50)
+
+
+def _square_values(table, value):
+    # [color][sq] -> material + placement
+    return ([value + table[sq ^ 56] for sq in range(64)],
+            [value + table[sq] for sq in range(64)])
+
+
+SQUARE_VALUES = [_square_values(_PST[p], PIECE_VALUES[p]) for p in range(6)]
+KING_ENDGAME_VALUES = _square_values(_KING_ENDGAME, 0)
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+TT_SIZE = 1 << 20
+
+
+def evaluate(gs):
+    """Static score in centipawns from the side to move's point of view."""
+    score = 0
+    pieces = gs.pieces
+    endgame = not (pieces[WHITE][QUEEN] or pieces[BLACK][QUEEN]) or \
+        (pieces[WHITE][ROOK] | pieces[WHITE][BISHOP] | pieces[WHITE][KNIGHT] |
+         pieces[BLACK][ROOK] | pieces[BLACK][BISHOP] | pieces[BLACK][KNIGHT]).bit_count() <= 2
+    for color in (WHITE, BLACK):
+        total = 0
+        for ptype in range(6):
+            bb = pieces[color][ptype]
+            if ptype == KING and endgame:
+                values = KING_ENDGAME_VALUES[color]
+            else:
+                values = SQUARE_VALUES[ptype][color]
+            while bb:
+                bit = bb & -bb
+                total += values[bit.bit_length() - 1]
+                bb ^= bit
+        score += total if color == WHITE else -total
+    return score if gs.white_to_move else -score
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Searcher:
+    """One search context. Keep it across moves of a game so the
+    transposition table and history scores carry over."""
+
+    def __init__(self):
+        self.tt = {}
+        self.history = {}
+        self.nodes = 0
+        self.deadline = 0.0
+        self.stop_event = None
+        self.timed_out = False
+        self.full_root = True
+
+    def search(self, gs, time_limit, on_info=None, max_depth=MAX_DEPTH, stop_event=None, root_moves=None):
+        """Iterative deepening until the time budget runs out. Returns the
+        best move code of the deepest completed iteration (0 if none).
+
+        root_moves restricts the search to a subset of the legal moves (used
+        by the root-split parallel search in chess_parallel). timed_out is
+        left True if the last iteration was cut short."""
+        self.nodes = 0
+        self.deadline = time.perf_counter() + time_limit
+        self.stop_event = stop_event
+        self.killers = [[0, 0] for _ in range(MAX_DEPTH + 1)]
+        self.timed_out = False
+        if len(self.tt) > TT_SIZE:
+            self.tt.clear()
+
+        # With a subset, a single move still needs a real score to compare
+        self.full_root = only_move = root_moves is None
+        root_moves = list(root_moves) if root_moves else gs.generate_moves()
+        if not root_moves:
+            return 0
+        only_move = only_move and len(root_moves) == 1
+        best_move = root_moves[0]
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self._root(gs, depth, root_moves, best_move)
+            except SearchTimeout:
+                self.timed_out = True
+                break
+            best_move = move
+            if on_info:
+                on_info({'depth': depth, 'score': score, 'move': code_to_uci(move), 'nodes': self.nodes})
+            if abs(score) >= MATE - MAX_DEPTH or only_move:
+                break
+        return best_move
+
+    def _check_time(self):
+        if time.perf_counter() > self.deadline or (self.stop_event and self.stop_event.is_set()):
+            raise SearchTimeout()
+
+    def _root(self, gs, depth, moves, best_move):
+        # Previous iteration's best move goes first
+        moves.sort(key=lambda m: (m != best_move, -self.history.get(m, 0)))
+        alpha = -INF
+        best = moves[0]
+        for move in moves:
+            gs.push(move)
+            try:
+                score = -self._negamax(gs, depth - 1, -INF, -alpha, 1)
+            finally:
+                gs.pop()
+            if score > alpha:
+                alpha = score
+                best = move
+        if self.full_root: # a subset's best isn't the position's score
+            self.tt[gs.zobrist] = (depth, alpha, EXACT, best)
+        return alpha, best
+
+    def _negamax(self, gs, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self._check_time()
+        if gs.halfmove_clock >= 100 or gs.repetition_count() > 1:
+            return 0
+
+        key = gs.zobrist
+        entry = self.tt.get(key)
+        tt_move = 0
+        if entry:
+            e_depth, e_score, e_flag, tt_move = entry
+            if e_depth >= depth:
+                e_score = _score_from_tt(e_score, ply)
+                if e_flag == EXACT:
+                    return e_score
+                if e_flag == LOWER and e_score >= beta:
+                    return e_score
+                if e_flag == UPPER and e_score <= alpha:
+                    return e_score
+
+        if depth <= 0 or ply >= MAX_DEPTH:
+            return self._quiesce(gs, alpha, beta, ply)
+
+        moves = gs.generate_moves()
+        if not moves:
+            return -MATE + ply if gs.in_check() else 0
+        self._order(gs, moves, tt_move, ply)
+
+        orig_alpha = alpha
+        best = -INF
+        best_move = 0
+        for move in moves:
+            gs.push(move)
+            try:
+                score = -self._negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                gs.pop()
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not _is_tactical(gs, move):
+                            killers = self.killers[ply]
+                            if killers[0] != move:
+                                killers[1] = killers[0]
+                                killers[0] = move
+                            self.history[move] = self.history.get(move, 0) + depth * depth
+                        break
+
+        flag = EXACT
+        if best <= orig_alpha:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        self.tt[key] = (depth, _score_to_tt(best, ply), flag, best_move)
+        return best
+
+    def _quiesce(self, gs, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self._check_time()
+        stand_pat = evaluate(gs)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        squares = gs.squares
+        captures = [m for m in gs.generate_moves() if _is_tactical(gs, m)]
+        captures.sort(key=lambda m: -_mvv_lva(squares, m))
+        for move in captures:
+            gs.push(move)
+            try:
+                score = -self._quiesce(gs, -beta, -alpha, ply + 1)
+            finally:
+                gs.pop()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _order(self, gs, moves, tt_move, ply):
+        squares = gs.squares
+        killers = self.killers[ply]
+        history = self.history
+
+        def key(move):
+            if move == tt_move:
+                return -10000000
+            if _is_tactical(gs, move):
+                return -1000000 - _mvv_lva(squares, move)
+            if move == killers[0]:
+                return -900000
+            if move == killers[1]:
+                return -800000
+            return -history.get(move, 0)
+        moves.sort(key=key)
+
+
+def _is_tactical(gs, move):
+    return gs.squares[(move >> 6) & 63] != EMPTY or move & MOVE_FLAGS in (MOVE_PROMOTION, MOVE_EN_PASSANT)
+
+
+def _mvv_lva(squares, move):
+    victim = squares[(move >> 6) & 63]
+    value = PIECE_VALUES[PIECE_CODES[victim][1]] if victim != EMPTY else PIECE_VALUES[PAWN]
+    if move & MOVE_FLAGS == MOVE_PROMOTION:
+        value += PIECE_VALUES[QUEEN]
+    return value * 10 - PIECE_VALUES[PIECE_CODES[squares[move & 63]][1]] // 100
+
+
+def _score_to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score >= MATE - MAX_DEPTH:
+        return score + ply
+    if score <= -MATE + MAX_DEPTH:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    if score >= MATE - MAX_DEPTH:
+        return score - ply
+    if score <= -MATE + MAX_DEPTH:
+        return score + ply
+    return score
+
+
+# --- Worker process ---
+
+def _worker_main(jobs, results, stop_event):
+    searcher = Searcher()
+    # Mapped once per worker; a probe only touches a few pages
+    book = chess_book.open_book()
+    endgame = chess_book.open_endgame()
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, fen, codes, time_limit = job
+        stop_event.clear()
+        gs = GameState(fen)
+        for code in codes:
+            gs.push(code)
+
+        hit = chess_book.lookup(gs, book, endgame)
+        if hit:
+            code, source, result = hit
+            score = 0 if not result else (MATE - result if result > 0 else -MATE - result)
+            results.put((job_id, 'info', {'depth': 0, 'score': score, 'move': code_to_uci(code), 'nodes': 0, 'source': source}))
+            results.put((job_id, 'bestmove', code_to_uci(code)))
+            continue
+
+        def on_info(info):
+            results.put((job_id, 'info', info))
+        best = searcher.search(gs, time_limit, on_info, stop_event=stop_event)
+        results.put((job_id, 'bestmove', code_to_uci(best) if best else None))
+
+
+class SearchWorker:
+    """A long-lived search process (spawned once, reused for every move).
+    Positions in the opening book / endgame table are answered without
+    searching (see chess_book).
+
+    submit() queues a search of the given position; poll() returns whatever
+    messages have arrived since, without blocking:
+        (job_id, 'info', {'depth', 'score', 'move', 'nodes'})
+        (job_id, 'bestmove', uci or None)
+    A 'bestmove' always follows once the time budget is spent.
+    """
+
+    def __init__(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.jobs = ctx.Queue()
+        self.results = ctx.Queue()
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(target=_worker_main, args=(self.jobs, self.results, self.stop_event), daemon=True)
+        self.process.start()
+        self.job_id = 0
+
+    def submit(self, gs, time_limit):
+        self.job_id += 1
+        self.jobs.put((self.job_id, gs.start_fen, gs.move_codes(), time_limit))
+        return self.job_id
+
+    def stop(self):
+        """Cut the current search short; it still answers with a bestmove."""
+        self.stop_event.set()
+
+    def poll(self):
+        messages = []
+        while True:
+            try:
+                messages.append(self.results.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close(self):
+        self.stop_event.set()
+        self.jobs.put(None)
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
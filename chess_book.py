@@ -0,0 +1,255 @@
+"""Opening book and endgame table lookups over memory-mapped files.
+
+Both files are flat arrays of 16-byte big-endian records sorted by the
+position's Zobrist key (GameState.zobrist uses the Polyglot keys):
+
+    opening book   key u64 | move u16 | weight u16 | learn u32   (Polyglot .bin)
+    endgame table  key u64 | move u16 | result i16 | unused u32
+
+An endgame result is in plies from the side to move's point of view:
++n mates in n, -n gets mated in n, 0 is a draw. Lookups binary search the
+mapping directly, so opening a file costs the same whatever its size and
+only the pages actually touched are ever read.
+
+    python chess_book.py probe --fen "<fen>"
+    python chess_book.py build-endgame endgame.bin positions.txt --depth 8
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from chess_engine import (GameState, START_FEN, code_to_uci, KING, KNIGHT, PIECE_CODES,
+                          MOVE_FLAGS, MOVE_PROMOTION, MOVE_CASTLING)
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BOOK_PATH = os.path.join(DATA_DIR, "book.bin")
+ENDGAME_PATH = os.path.join(DATA_DIR, "endgame.bin")
+
+RECORD_SIZE = 16
+
+
+class MappedTable:
+    """Sorted 16-byte records behind an mmap, searched by key."""
+    record = struct.Struct(">QHHI")
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self.count = size // RECORD_SIZE
+        # mmap refuses empty files; an empty table just never hits
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b""
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.count:
+            self._mm.close()
+        self._file.close()
+
+    def _key_at(self, i):
+        return struct.unpack_from(">Q", self._mm, i * RECORD_SIZE)[0]
+
+    def records(self, key):
+        """All records for key, in file order."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        unpack = self.record.unpack_from
+        found = []
+        while lo < self.count:
+            rec = unpack(self._mm, lo * RECORD_SIZE)
+            if rec[0] != key:
+                break
+            found.append(rec)
+            lo += 1
+        return found
+
+
+class PolyglotBook(MappedTable):
+    def moves(self, gs):
+        """[(move code, weight), ...] for the position, best weight first."""
+        found = []
+        for _, raw, weight, _ in self.records(gs.zobrist):
+            code = decode_move(gs, raw)
+            if code is not None:
+                found.append((code, weight))
+        found.sort(key=lambda m: -m[1])
+        return found
+
+    def pick(self, gs, rng=random):
+        """A book move chosen in proportion to its weight (None if out of book)."""
+        moves = [(code, weight) for code, weight in self.moves(gs) if weight]
+        if not moves:
+            return None
+        total = sum(weight for _, weight in moves)
+        n = rng.randrange(total)
+        for code, weight in moves:
+            n -= weight
+            if n < 0:
+                return code
+
+
+class EndgameTable(MappedTable):
+    record = struct.Struct(">QHhI")
+
+    def probe(self, gs):
+        """(move code, result in plies) for a stored position, else None."""
+        for _, raw, result, _ in self.records(gs.zobrist):
+            code = decode_move(gs, raw)
+            if code is not None:
+                return code, result
+        return None
+
+
+def open_table(cls, path):
+    """Map a table if the file exists; None (not an error) otherwise."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return cls(path)
+    except OSError as e:
+        print(f"Could not open {path}: {e}")
+        return None
+
+
+def open_book(path=BOOK_PATH):
+    return open_table(PolyglotBook, path)
+
+
+def open_endgame(path=ENDGAME_PATH):
+    return open_table(EndgameTable, path)
+
+
+def lookup(gs, book=None, endgame=None, rng=random):
+    """Instant answer for a known position: (code, source, result) or None.
+    The endgame table wins over the book since its answers are exact."""
+    if endgame:
+        hit = endgame.probe(gs)
+        if hit:
+            return hit[0], "endgame", hit[1]
+    if book:
+        code = book.pick(gs, rng)
+        if code is not None:
+            return code, "book", None
+    return None
+
+
+# --- Polyglot move encoding ---
+# to file bits 0-2, to rank 3-5, from file 6-8, from rank 9-11, promotion
+# 12-14 (1 = knight ... 4 = queen). Castling is written as king takes rook.
+
+def decode_move(gs, raw):
+    """Polyglot move -> legal move code for gs, or None."""
+    frm = (raw >> 6) & 63
+    to = raw & 63
+    promotion = (raw >> 12) & 7
+    piece = gs.squares[frm]
+    if piece != "--" and PIECE_CODES[piece][1] == KING and abs(to - frm) in (3, 4) and (to >> 3) == (frm >> 3):
+        to = frm + 2 if to > frm else frm - 2
+    for code in gs.generate_moves():
+        if code & 0xFFF != frm | to << 6:
+            continue
+        if code & MOVE_FLAGS == MOVE_PROMOTION:
+            if ((code >> 12) & 3) + KNIGHT != promotion:
+                continue
+        elif promotion:
+            continue
+        return code
+    return None
+
+
+def encode_move(code):
+    """Legal move code -> Polyglot move."""
+    frm = code & 63
+    to = (code >> 6) & 63
+    raw = frm << 6
+    if code & MOVE_FLAGS == MOVE_CASTLING:
+        to = (to & 56) | (7 if to > frm else 0) # king takes own rook
+    elif code & MOVE_FLAGS == MOVE_PROMOTION:
+        raw |= (((code >> 12) & 3) + KNIGHT) << 12
+    return raw | to
+
+
+def write_table(path, records, record=MappedTable.record):
+    """Write (key, move, value, extra) records sorted by key."""
+    records = sorted(records, key=lambda r: (r[0], r[1]))
+    with open(path, "wb") as f:
+        for rec in records:
+            f.write(record.pack(*rec))
+    return len(records)
+
+
+def build_endgame(fens, depth=8, time_limit=30.0, out=sys.stdout):
+    """Solve each position with the AI search and keep the forced mates.
+    The whole mating line is stored (both sides' moves), so a game that
+    reaches the first position is answered from the table all the way."""
+    from chess_ai import Searcher, MATE, MAX_DEPTH
+    records = {}
+    searcher = Searcher()
+    for fen in fens:
+        gs = GameState(fen)
+        while gs.zobrist not in records:
+            infos = []
+            code = searcher.search(gs, time_limit, infos.append, max_depth=depth)
+            if not code or not infos or abs(infos[-1]['score']) < MATE - MAX_DEPTH:
+                break
+            score = infos[-1]['score']
+            plies = MATE - abs(score)
+            records[gs.zobrist] = (gs.zobrist, encode_move(code), plies if score > 0 else -plies, 0)
+            gs.push(code)
+        print(f"{fen}: {'mate' if GameState(fen).zobrist in records else 'no forced mate found'}", file=out)
+    return list(records.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Opening book / endgame table tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    probe = sub.add_parser("probe", help="Show book and endgame entries for a position")
+    probe.add_argument("--fen", default=START_FEN)
+    probe.add_argument("--book", default=BOOK_PATH)
+    probe.add_argument("--endgame", default=ENDGAME_PATH)
+    build = sub.add_parser("build-endgame", help="Build an endgame table from a file of FENs (one per line)")
+    build.add_argument("output")
+    build.add_argument("fens")
+    build.add_argument("--depth", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    if args.command == "probe":
+        gs = GameState(args.fen)
+        print(f"key {gs.zobrist:016x}")
+        book = open_book(args.book)
+        if book:
+            for code, weight in book.moves(gs):
+                print(f"book    {code_to_uci(code)}  weight {weight}")
+        endgame = open_endgame(args.endgame)
+        if endgame:
+            hit = endgame.probe(gs)
+            if hit:
+                print(f"endgame {code_to_uci(hit[0])}  result {hit[1]:+d} plies")
+        return 0
+
+    with open(args.fens) as f:
+        fens = [line.strip() for line in f if line.strip()]
+    records = build_endgame(fens, args.depth)
+    n = write_table(args.output, records, EndgameTable.record)
+    print(f"Wrote {n} positions to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""Reliable, in-order delivery of chess_protocol messages over the mesh.
+
+Each (peer, game) pair is a stream with its own sequence numbers. The
+receiver acks every data packet with the highest seq it has in order plus
+a 16-bit bitmap of what it holds beyond that (selective ack), drops
+duplicates, and hands messages up strictly in order. The sender keeps
+unacked messages and retransmits with exponential backoff.
+
+Retries are bounded: only the oldest unacked message of a stream is ever
+retransmitted, any two retransmissions are at least RETRY_SPACING apart
+across all streams, and a message is given up after MAX_ATTEMPTS.
+
+A single background thread does all transmitting, so callers never block
+on the radio.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+from chess_protocol import GameMessage, ACK
+
+# A DM over a few LongFast hops plus the ack back often takes 5-10 s
+RTO_INITIAL = 10.0
+RTO_MAX = 80.0
+MAX_ATTEMPTS = 5 # Including the first send
+RETRY_SPACING = 3.0
+WINDOW = 16 # How far past the next expected seq we accept (= ack bitmap width)
+
+
+class _Outgoing:
+    __slots__ = ('target', 'msg', 'attempts', 'due')
+
+    def __init__(self, target, msg):
+        self.target = target
+        self.msg = msg
+        self.attempts = 0
+        self.due = 0.0
+
+
+class _Stream:
+    __slots__ = ('next_seq', 'unacked', 'recv_next', 'recv_buffer')
+
+    def __init__(self):
+        self.next_seq = 1
+        self.unacked = {} # seq -> _Outgoing
+        self.recv_next = 1 # Next seq we can hand up
+        self.recv_buffer = {} # seq -> msg received ahead of a gap
+
+
+class ReliableChannel:
+    """transmit(target, msg) puts one message on the air; deliver(msg, sender)
+    gets each incoming message once, in order; on_failed(target, msg) is
+    called when a message is given up on. Both callbacks run on the
+    channel's thread (deliver runs on the caller of receive()).
+
+    peer_key(peer) -> the key a peer's streams are filed under. We may name
+    a node differently from what its packets carry ('!deadbeef' vs
+    3735928559); pass mesh_interface.node_num so acks find their stream."""
+
+    def __init__(self, transmit, deliver, on_failed=None, clock=time.monotonic, peer_key=str):
+        self.transmit = transmit
+        self.deliver = deliver
+        self.on_failed = on_failed
+        self.clock = clock
+        self.peer_key = peer_key
+        self.streams = {}
+        self._outbox = deque() # Acks and first sends, oldest first
+        self._last_retry = -RETRY_SPACING
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _stream(self, peer, game_id):
+        key = (self.peer_key(peer), game_id)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = _Stream()
+        return stream
+
+    def send(self, target, msg):
+        with self._cond:
+            stream = self._stream(target, msg.game_id)
+            msg.seq = stream.next_seq
+            stream.next_seq += 1
+            out = _Outgoing(target, msg)
+            stream.unacked[msg.seq] = out
+            self._outbox.append(out)
+            self._cond.notify()
+
+    def receive(self, msg, sender):
+        """Feed every incoming protocol message here."""
+        if msg.kind == ACK:
+            self._on_ack(msg, sender)
+            return
+        ready = []
+        with self._cond:
+            stream = self._stream(sender, msg.game_id)
+            seq = msg.seq
+            if seq - stream.recv_next >= WINDOW:
+                return # Too far ahead to buffer - the sender will retry
+            if seq >= stream.recv_next and seq not in stream.recv_buffer:
+                stream.recv_buffer[seq] = msg
+                while stream.recv_next in stream.recv_buffer:
+                    ready.append(stream.recv_buffer.pop(stream.recv_next))
+                    stream.recv_next += 1
+            # Ack duplicates too: the first ack may be what got lost
+            bitmap = 0
+            for s in stream.recv_buffer:
+                bitmap |= 1 << (s - stream.recv_next)
+            self._outbox.append(_Outgoing(sender, GameMessage(ACK, msg.game_id, seq=stream.recv_next - 1, bitmap=bitmap)))
+            self._cond.notify()
+        for m in ready:
+            self.deliver(m, sender)
+
+    def _on_ack(self, ack, sender):
+        with self._cond:
+            stream = self.streams.get((self.peer_key(sender), ack.game_id))
+            if stream is None:
+                return
+            for seq in list(stream.unacked):
+                offset = seq - ack.seq - 1
+                if seq <= ack.seq or (offset < WINDOW and ack.bitmap >> offset & 1):
+                    del stream.unacked[seq]
+            self._cond.notify()
+
+    def pending(self, peer, game_id):
+        """Number of messages still waiting for an ack."""
+        with self._cond:
+            stream = self.streams.get((self.peer_key(peer), game_id))
+            return len(stream.unacked) if stream else 0
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _backoff(self, attempts):
+        return min(RTO_INITIAL * 2 ** (attempts - 1), RTO_MAX) * random.uniform(0.8, 1.2)
+
+    def _collect(self, now):
+        """Under the lock: what to put on the air now, what has failed and
+        how long we may sleep."""
+        to_send = []
+        failed = []
+        while self._outbox:
+            out = self._outbox.popleft()
+            if out.msg.kind != ACK:
+                if out.msg.seq not in self._stream(out.target, out.msg.game_id).unacked:
+                    continue # Acked before it even went out
+                out.attempts = 1
+                out.due = now + self._backoff(1)
+            to_send.append(out)
+
+        wake = now + RTO_MAX
+        for stream in self.streams.values():
+            if not stream.unacked:
+                continue
+            out = stream.unacked[min(stream.unacked)]
+            if out.due > now:
+                wake = min(wake, out.due)
+            elif out.attempts >= MAX_ATTEMPTS:
+                # Give up on the whole stream - later moves depend on this one
+                failed.extend(stream.unacked.values())
+                stream.unacked.clear()
+            elif now - self._last_retry >= RETRY_SPACING:
+                self._last_retry = now
+                out.attempts += 1
+                out.due = now + self._backoff(out.attempts)
+                to_send.append(out)
+                wake = min(wake, out.due)
+            else:
+                wake = min(wake, self._last_retry + RETRY_SPACING)
+        return to_send, failed, wake
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = self.clock()
+                to_send, failed, wake = self._collect(now)
+                if not to_send and not failed:
+                    self._cond.wait(timeout=max(wake - now, 0.05))
+                    continue
+            for out in to_send:
+                try:
+                    self.transmit(out.target, out.msg)
+                except Exception as e:
+                    print(f"Game message send failed: {e}")
+            for out in failed:
+                print(f"Giving up on {out.msg} to {out.target}")
+                if self.on_failed:
+                    self.on_failed(out.target, out.msg)
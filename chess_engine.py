@@ -1,192 +1,793 @@
 
+# Bitboard chess engine.
+#
+# Squares are numbered a1 = 0 ... h8 = 63 (one bit per square in a 64-bit int).
+# The UI still thinks in (row, col) with row 0 = rank 8, so GameState.board
+# exposes that view and Move keeps its row/col attributes.
+
+from polyglot_keys import POLYGLOT_RANDOM
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+PIECE_CHARS = "PNBRQK"
+COLOR_CHARS = "wb"
+EMPTY = "--"
+
+# "wP" -> (WHITE, PAWN) and back
+PIECE_CODES = {COLOR_CHARS[c] + PIECE_CHARS[p]: (c, p) for c in range(2) for p in range(6)}
+PIECE_NAMES = [[COLOR_CHARS[c] + PIECE_CHARS[p] for p in range(6)] for c in range(2)]
+
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_3 = RANK_1 << 16
+RANK_6 = RANK_1 << 40
+RANK_8 = RANK_1 << 56
+NOT_FILE_A = FULL ^ FILE_A
+NOT_FILE_H = FULL ^ FILE_H
+BACK_RANKS = RANK_1 | RANK_8
+
+PROMOTION_ORDER = (QUEEN, KNIGHT, ROOK, BISHOP)
+
+# Move codes are 16-bit ints:
+#   bits 0-5 from square, 6-11 to square,
+#   bits 12-13 promotion piece (KNIGHT..QUEEN minus KNIGHT),
+#   bits 14-15 special move flag.
+MOVE_NORMAL = 0
+MOVE_PROMOTION = 1 << 14
+MOVE_EN_PASSANT = 2 << 14
+MOVE_CASTLING = 3 << 14
+MOVE_FLAGS = 3 << 14
+
+# Castling rights bits, and the rights that survive a move touching a square
+CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ = 1, 2, 4, 8
+CASTLE_ALL = 15
+CASTLE_KEEP = [CASTLE_ALL] * 64
+CASTLE_KEEP[0] = CASTLE_ALL ^ CASTLE_WQ
+CASTLE_KEEP[7] = CASTLE_ALL ^ CASTLE_WK
+CASTLE_KEEP[4] = CASTLE_ALL ^ (CASTLE_WK | CASTLE_WQ)
+CASTLE_KEEP[56] = CASTLE_ALL ^ CASTLE_BQ
+CASTLE_KEEP[63] = CASTLE_ALL ^ CASTLE_BK
+CASTLE_KEEP[60] = CASTLE_ALL ^ (CASTLE_BK | CASTLE_BQ)
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def square_index(row, col):
+    return (7 - row) * 8 + col
+
+
+# --- Zobrist keys ---
+# Polyglot's own table (12 x 64 piece keys, 4 castling, 8 en passant files,
+# 1 side to move), so GameState.zobrist can index Polyglot opening books.
+
+_ZOBRIST = POLYGLOT_RANDOM
+# Polyglot piece kinds go black pawn, white pawn, black knight, ...
+ZOBRIST_PIECES = [[_ZOBRIST[64 * (2 * p + (c == WHITE)):64 * (2 * p + (c == WHITE)) + 64] for p in range(6)]
+                  for c in range(2)]
+ZOBRIST_CASTLING = [0] * 16
+for _rights in range(16):
+    for _i, _right in enumerate((CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ)):
+        if _rights & _right:
+            ZOBRIST_CASTLING[_rights] ^= _ZOBRIST[768 + _i]
+ZOBRIST_EP = _ZOBRIST[772:780]
+ZOBRIST_TURN = _ZOBRIST[780]
+
+
+# --- Precomputed attack tables ---
+
+def _step_attacks(deltas):
+    table = []
+    for sq in range(64):
+        r, f = sq >> 3, sq & 7
+        bb = 0
+        for dr, df in deltas:
+            if 0 <= r + dr < 8 and 0 <= f + df < 8:
+                bb |= 1 << ((r + dr) * 8 + f + df)
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _step_attacks(((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)))
+KING_ATTACKS = _step_attacks(((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)))
+PAWN_ATTACKS = [_step_attacks(((1, -1), (1, 1))), _step_attacks(((-1, -1), (-1, 1)))]
+
+
+def _ray(sq, dr, df, occ):
+    r, f = sq >> 3, sq & 7
+    bb = 0
+    r += dr
+    f += df
+    while 0 <= r < 8 and 0 <= f < 8:
+        bit = 1 << (r * 8 + f)
+        bb |= bit
+        if occ & bit:
+            break
+        r += dr
+        f += df
+    return bb
+
+
+def _line_tables(directions):
+    """For each square, the relevant occupancy mask of one line (rank, file or
+    diagonal) and a dict mapping every occupancy of that mask to the attacks
+    along the line. A slider's attacks are then a couple of dict lookups."""
+    masks = []
+    tables = []
+    (dr1, df1), (dr2, df2) = directions
+    for sq in range(64):
+        mask = 0
+        for dr, df in directions:
+            # Every square of the ray except the far end, which never blocks
+            r, f = (sq >> 3) + dr, (sq & 7) + df
+            while 0 <= r + dr < 8 and 0 <= f + df < 8:
+                mask |= 1 << (r * 8 + f)
+                r += dr
+                f += df
+        table = {}
+        sub = 0
+        while True:
+            table[sub] = _ray(sq, dr1, df1, sub) | _ray(sq, dr2, df2, sub)
+            sub = (sub - mask) & mask
+            if sub == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+RANK_MASKS, RANK_TABLES = _line_tables(((0, 1), (0, -1)))
+FILE_MASKS, FILE_TABLES = _line_tables(((1, 0), (-1, 0)))
+DIAG_MASKS, DIAG_TABLES = _line_tables(((1, 1), (-1, -1)))
+ANTI_MASKS, ANTI_TABLES = _line_tables(((1, -1), (-1, 1)))
+
+
+def _between_table():
+    # BETWEEN[a][b]: squares strictly between a and b on a shared line, else 0
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for dr, df in ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)):
+            r, f = (sq >> 3) + dr, (sq & 7) + df
+            between = 0
+            while 0 <= r < 8 and 0 <= f < 8:
+                table[sq][r * 8 + f] = between
+                between |= 1 << (r * 8 + f)
+                r += dr
+                f += df
+    return table
+
+
+BETWEEN = _between_table()
+
+
+# Empty-board slider reach, to skip lookups when no slider is even aligned
+ROOK_RAYS = [RANK_TABLES[sq][0] | FILE_TABLES[sq][0] for sq in range(64)]
+BISHOP_RAYS = [DIAG_TABLES[sq][0] | ANTI_TABLES[sq][0] for sq in range(64)]
+
+
+def rook_attacks(sq, occ):
+    return RANK_TABLES[sq][occ & RANK_MASKS[sq]] | FILE_TABLES[sq][occ & FILE_MASKS[sq]]
+
+
+def bishop_attacks(sq, occ):
+    return DIAG_TABLES[sq][occ & DIAG_MASKS[sq]] | ANTI_TABLES[sq][occ & ANTI_MASKS[sq]]
+
+
+# Expanding a target bitboard into moves bit by bit is the slowest part of
+# generation in Python, and the same (origin, targets) pairs come up again and
+# again, so expanded lists are memoised. Bounded by clearing when full.
+_MOVE_LIST_CACHE = {}
+_MOVE_LIST_CACHE_SIZE = 1 << 16
+_SQUARES_CACHE = {}
+
+
+def _move_list(frm, targets):
+    key = targets << 6 | frm
+    moves = _MOVE_LIST_CACHE.get(key)
+    if moves is None:
+        moves = []
+        while targets:
+            bit = targets & -targets
+            moves.append(frm | (bit.bit_length() - 1) << 6)
+            targets ^= bit
+        moves = tuple(moves)
+        if len(_MOVE_LIST_CACHE) >= _MOVE_LIST_CACHE_SIZE:
+            _MOVE_LIST_CACHE.clear()
+        _MOVE_LIST_CACHE[key] = moves
+    return moves
+
+
+def _bit_squares(bb):
+    # Square indices of a piece bitboard
+    squares = []
+    key = bb
+    while bb:
+        bit = bb & -bb
+        squares.append(bit.bit_length() - 1)
+        bb ^= bit
+    squares = tuple(squares)
+    if len(_SQUARES_CACHE) >= _MOVE_LIST_CACHE_SIZE:
+        _SQUARES_CACHE.clear()
+    _SQUARES_CACHE[key] = squares
+    return squares
+
+
+def _pawn_move_list(targets, delta):
+    # Pawn target sets are keyed by direction instead of origin square.
+    # Arrivals on the back rank expand into the four promotions.
+    key = -(targets << 6 | (delta + 16))
+    moves = _MOVE_LIST_CACHE.get(key)
+    if moves is None:
+        moves = []
+        while targets:
+            bit = targets & -targets
+            to = bit.bit_length() - 1
+            code = (to + delta) | to << 6
+            if bit & BACK_RANKS:
+                for promo in PROMOTION_ORDER:
+                    moves.append(code | MOVE_PROMOTION | (promo - KNIGHT) << 12)
+            else:
+                moves.append(code)
+            targets ^= bit
+        moves = tuple(moves)
+        if len(_MOVE_LIST_CACHE) >= _MOVE_LIST_CACHE_SIZE:
+            _MOVE_LIST_CACHE.clear()
+        _MOVE_LIST_CACHE[key] = moves
+    return moves
+
+
 class GameState:
-    def __init__(self):
-        # 8x8 Board
-        # "bR" = black Rook, "wP" = white Pawn, "--" = empty
-        self.board = [
-            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-            ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
-            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
-        ]
+    def __init__(self, fen=START_FEN):
+        # Bitboards per colour and piece type, plus a square -> piece mailbox
+        # ("wP", "bK", "--") for fast lookups of what sits on a square.
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupancy = [0, 0]
+        self.squares = [EMPTY] * 64
+        self.zobrist = 0
         self.white_to_move = True
+        self.castling = CASTLE_ALL
+        self.ep_square = None # Square a pawn just skipped over, if any
+        self.halfmove_clock = 0 # Plies since the last capture or pawn move
+        # One (move code, captured, castling, ep_square, halfmove_clock,
+        # zobrist) tuple per push(), enough to undo it without board copies
+        self.history = []
         self.move_log = []
+        self.checkmate = False
+        self.stalemate = False
         self.start_row = -1
         self.start_col = -1
+        self.set_fen(fen)
+
+    def set_fen(self, fen):
+        """Load a position from FEN (the move counters are optional)."""
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"Bad FEN: {fen!r}")
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupancy = [0, 0]
+        self.squares = [EMPTY] * 64
+        for rank, row in enumerate(fields[0].split('/')):
+            sq = (7 - rank) * 8
+            for ch in row:
+                if ch.isdigit():
+                    sq += int(ch)
+                else:
+                    self._put(sq, ('w' if ch.isupper() else 'b') + ch.upper())
+                    sq += 1
+        self.white_to_move = fields[1] == 'w'
+        self.castling = 0
+        for ch, right in zip("KQkq", (CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ)):
+            if ch in fields[2]:
+                self.castling |= right
+        self.ep_square = None
+        if fields[3] != '-':
+            self.ep_square = Move.files_to_cols[fields[3][0]] + (int(fields[3][1]) - 1) * 8
+        self.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        self.zobrist = self.compute_hash()
+        self.start_fen = fen
+        self.history = []
+        self.move_log = []
+
+    def move_codes(self):
+        """Codes of every move played since the starting FEN, oldest first;
+        with start_fen they rebuild the position, repetition history included."""
+        return [entry[0] for entry in self.history]
+
+    @property
+    def board(self):
+        """8x8 view of the position, row 0 = rank 8 (read-only copy)."""
+        sqs = self.squares
+        return [sqs[r * 8:r * 8 + 8] for r in range(7, -1, -1)]
+
+    def _put(self, sq, piece):
+        color, ptype = PIECE_CODES[piece]
+        bit = 1 << sq
+        self.pieces[color][ptype] |= bit
+        self.occupancy[color] |= bit
+        self.squares[sq] = piece
+        self.zobrist ^= ZOBRIST_PIECES[color][ptype][sq]
+
+    def _remove(self, sq):
+        piece = self.squares[sq]
+        if piece != EMPTY:
+            color, ptype = PIECE_CODES[piece]
+            bit = 1 << sq
+            self.pieces[color][ptype] ^= bit
+            self.occupancy[color] ^= bit
+            self.squares[sq] = EMPTY
+            self.zobrist ^= ZOBRIST_PIECES[color][ptype][sq]
+        return piece
 
     def make_move(self, move):
-        self.board[move.start_row][move.start_col] = "--"
-        self.board[move.end_row][move.end_col] = move.piece_moved
+        self.push(move.code)
+        move.piece_captured = self.history[-1][1]
         self.move_log.append(move)
+
+    def undo_move(self):
+        """Take back the last make_move(); returns the Move, or None."""
+        if not self.move_log:
+            return None
+        self.pop()
+        return self.move_log.pop()
+
+    def push(self, code):
+        """Play a move code from generate_moves(). The bare form of
+        make_move() for search and perft: no Move object, no move_log entry."""
+        start = code & 63
+        end = (code >> 6) & 63
+        flag = code & MOVE_FLAGS
+        piece = self.squares[start]
+        color, ptype = PIECE_CODES[piece]
+        ep_square = self.ep_square
+        captured_sq = end
+        if flag == MOVE_EN_PASSANT:
+            # The captured pawn sits behind the target square
+            captured_sq = end - 8 if color == WHITE else end + 8
+        self.history.append((code, self.squares[captured_sq], self.castling, ep_square, self.halfmove_clock, self.zobrist))
+        # Side, en passant and castling keys; _put/_remove do the piece keys
+        keys = ZOBRIST_TURN
+        if ep_square is not None and self._ep_hashed(ep_square, color ^ 1):
+            keys ^= ZOBRIST_EP[ep_square & 7]
+
+        captured = self._remove(captured_sq)
+        self._remove(start)
+        if flag == MOVE_PROMOTION:
+            piece = PIECE_NAMES[color][KNIGHT + (code >> 12 & 3)]
+        elif flag == MOVE_CASTLING:
+            # Bring the rook across the king
+            rook_from, rook_to = (start + 3, start + 1) if end > start else (start - 4, start - 1)
+            self._put(rook_to, self._remove(rook_from))
+        self._put(end, piece)
+
+        self.ep_square = None
+        if ptype == PAWN and abs(end - start) == 16:
+            self.ep_square = (start + end) >> 1
+            if self._ep_hashed(self.ep_square, color):
+                keys ^= ZOBRIST_EP[end & 7]
+        castling = self.castling & CASTLE_KEEP[start] & CASTLE_KEEP[end]
+        keys ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+        self.castling = castling
+        self.zobrist ^= keys
+        self.halfmove_clock = 0 if ptype == PAWN or captured != EMPTY else self.halfmove_clock + 1
         self.white_to_move = not self.white_to_move
-        
-        # Pawn Promotion (Auto-Queen for simplicity)
-        if move.piece_moved == 'wP' and move.end_row == 0:
-            self.board[move.end_row][move.end_col] = 'wQ'
-        if move.piece_moved == 'bP' and move.end_row == 7:
-            self.board[move.end_row][move.end_col] = 'bQ'
+
+    def pop(self):
+        """Undo the last push()."""
+        code, captured, castling, ep_square, halfmove_clock, zobrist = self.history.pop()
+        start = code & 63
+        end = (code >> 6) & 63
+        flag = code & MOVE_FLAGS
+        self.white_to_move = not self.white_to_move
+        piece = self._remove(end)
+        if flag == MOVE_PROMOTION:
+            piece = piece[0] + 'P'
+        self._put(start, piece)
+        if flag == MOVE_EN_PASSANT:
+            self._put(end - 8 if piece[0] == 'w' else end + 8, captured)
+        elif flag == MOVE_CASTLING:
+            rook_from, rook_to = (start + 3, start + 1) if end > start else (start - 4, start - 1)
+            self._put(rook_from, self._remove(rook_to))
+        elif captured != EMPTY:
+            self._put(end, captured)
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        self.zobrist = zobrist
+
+    def _ep_hashed(self, ep_square, mover):
+        # Like Polyglot, the en passant file only enters the hash when an
+        # enemy pawn actually stands ready to capture
+        return bool(PAWN_ATTACKS[mover][ep_square] & self.pieces[mover ^ 1][PAWN])
+
+    def compute_hash(self):
+        """Zobrist key from scratch; push()/pop() keep self.zobrist in step."""
+        h = 0
+        for sq, piece in enumerate(self.squares):
+            if piece != EMPTY:
+                color, ptype = PIECE_CODES[piece]
+                h ^= ZOBRIST_PIECES[color][ptype][sq]
+        h ^= ZOBRIST_CASTLING[self.castling]
+        if self.ep_square is not None and self._ep_hashed(self.ep_square, BLACK if self.white_to_move else WHITE):
+            h ^= ZOBRIST_EP[self.ep_square & 7]
+        if self.white_to_move:
+            h ^= ZOBRIST_TURN
+        return h
+
+    def repetition_count(self):
+        """How often the current position has occurred, by Zobrist key. Only
+        positions since the last capture or pawn move can repeat, and only
+        every second ply has the same side to move."""
+        history = self.history
+        n = len(history)
+        count = 1
+        for i in range(n - 2, max(n - self.halfmove_clock, 0) - 1, -2):
+            if history[i][5] == self.zobrist:
+                count += 1
+        return count
+
+    def draw_reason(self):
+        if self.halfmove_clock >= 100:
+            return "fifty-move rule"
+        if self.repetition_count() >= 3:
+            return "threefold repetition"
+        return None
 
     def get_valid_moves(self):
-        # Full validation roughly
-        moves = self.get_all_possible_moves()
-        # Filter strictly if needed (check logic omitted for simplicity to prevent infinite recursion in basic implementation)
-        # For a "fun" tab, pseudo-legal is often acceptable, but let's try to be decent.
+        """Legal moves as a MoveSet: `move in moves` is a set lookup, and
+        moves.from_square(sq) lists the moves of one piece."""
+        moves = MoveSet(self.generate_moves(), self.squares)
+        self.checkmate = False
+        self.stalemate = False
+        if not moves:
+            if self.in_check():
+                self.checkmate = True
+            else:
+                self.stalemate = True
         return moves
 
     def get_all_possible_moves(self):
+        return self.get_valid_moves()
+
+    def attackers_to(self, sq, occ, color):
+        """Bitboard of `color` pieces attacking `sq` given occupancy `occ`."""
+        their = self.pieces[color]
+        return ((PAWN_ATTACKS[color ^ 1][sq] & their[PAWN])
+                | (KNIGHT_ATTACKS[sq] & their[KNIGHT])
+                | (KING_ATTACKS[sq] & their[KING])
+                | (bishop_attacks(sq, occ) & (their[BISHOP] | their[QUEEN]))
+                | (rook_attacks(sq, occ) & (their[ROOK] | their[QUEEN])))
+
+    def square_attacked(self, sq, occ, color):
+        """Whether `color` attacks `sq`; cheap tests first, sliders only when
+        one stands on a line through the square."""
+        their = self.pieces[color]
+        if (KNIGHT_ATTACKS[sq] & their[KNIGHT] or PAWN_ATTACKS[color ^ 1][sq] & their[PAWN]
+                or KING_ATTACKS[sq] & their[KING]):
+            return True
+        sliders = their[ROOK] | their[QUEEN]
+        if sliders & ROOK_RAYS[sq] and sliders & (RANK_TABLES[sq][occ & RANK_MASKS[sq]] | FILE_TABLES[sq][occ & FILE_MASKS[sq]]):
+            return True
+        sliders = their[BISHOP] | their[QUEEN]
+        if sliders & BISHOP_RAYS[sq] and sliders & (DIAG_TABLES[sq][occ & DIAG_MASKS[sq]] | ANTI_TABLES[sq][occ & ANTI_MASKS[sq]]):
+            return True
+        return False
+
+    def in_check(self):
+        us = WHITE if self.white_to_move else BLACK
+        king_sq = self.pieces[us][KING].bit_length() - 1
+        return bool(self.attackers_to(king_sq, self.occupancy[0] | self.occupancy[1], us ^ 1))
+
+    def generate_moves(self):
+        """Legal moves for the side to move as move codes (see MOVE_FLAGS).
+
+        Checks and pins are worked out once for the position: every move
+        must land on the check mask (checker + blocking squares), and a
+        pinned piece may only move along its pin ray."""
+        us = WHITE if self.white_to_move else BLACK
+        them = us ^ 1
+        own = self.pieces[us]
+        their = self.pieces[them]
+        friendly = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occ = friendly | enemy
+        not_friendly = FULL ^ friendly
         moves = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                turn = self.board[r][c][0]
-                if (turn == 'w' and self.white_to_move) or (turn == 'b' and not self.white_to_move):
-                    piece = self.board[r][c][1]
-                    if piece == 'P':
-                        self.get_pawn_moves(r, c, moves)
-                    elif piece == 'R':
-                        self.get_rook_moves(r, c, moves)
-                    elif piece == 'N':
-                        self.get_knight_moves(r, c, moves)
-                    elif piece == 'B':
-                        self.get_bishop_moves(r, c, moves)
-                    elif piece == 'Q':
-                        self.get_queen_moves(r, c, moves)
-                    elif piece == 'K':
-                        self.get_king_moves(r, c, moves)
+        append = moves.append
+        extend = moves.extend
+        cached = _MOVE_LIST_CACHE.get
+        squares_of = _SQUARES_CACHE.get
+        attacked = self.square_attacked
+
+        # King moves: the king itself must not shield the squares behind it
+        king_sq = own[KING].bit_length() - 1
+        king_bit = 1 << king_sq
+        targets = KING_ATTACKS[king_sq] & not_friendly
+        occ_no_king = occ ^ king_bit
+        while targets:
+            bit = targets & -targets
+            to = bit.bit_length() - 1
+            if not attacked(to, occ_no_king, them):
+                append(king_sq | to << 6)
+            targets ^= bit
+
+        checkers = self.attackers_to(king_sq, occ, them)
+        if checkers & (checkers - 1):
+            return moves # Double check: only the king can move
+        if checkers:
+            check_mask = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+        else:
+            check_mask = FULL
+            self._castling_moves(us, occ, moves)
+
+        # Pins: enemy sliders that see the king through exactly one own piece
+        pinned = 0
+        pin_rays = {}
+        snipers = 0
+        sliders = their[ROOK] | their[QUEEN]
+        if sliders & ROOK_RAYS[king_sq]:
+            snipers = rook_attacks(king_sq, enemy) & sliders
+        sliders = their[BISHOP] | their[QUEEN]
+        if sliders & BISHOP_RAYS[king_sq]:
+            snipers |= bishop_attacks(king_sq, enemy) & sliders
+        while snipers:
+            bit = snipers & -snipers
+            snipers ^= bit
+            ray = BETWEEN[king_sq][bit.bit_length() - 1]
+            blockers = ray & occ
+            if blockers and not blockers & (blockers - 1) and blockers & friendly:
+                pinned |= blockers
+                pin_rays[blockers.bit_length() - 1] = ray | bit
+
+        target_mask = not_friendly & check_mask
+
+        # Pawns, set-wise for the free ones: one target bitboard per direction
+        pawns = own[PAWN]
+        free = pawns & ~pinned
+        empty = FULL ^ occ
+        if us == WHITE:
+            single = (free << 8) & empty
+            double = ((single & RANK_3) << 8) & empty
+            left = ((free & NOT_FILE_A) << 7) & enemy
+            right = ((free & NOT_FILE_H) << 9) & enemy
+            push = -8
+            lcap, rcap = -7, -9
+        else:
+            single = (free >> 8) & empty
+            double = ((single & RANK_6) >> 8) & empty
+            left = ((free & NOT_FILE_A) >> 9) & enemy
+            right = ((free & NOT_FILE_H) >> 7) & enemy
+            push = 8
+            lcap, rcap = 9, 7
+        if checkers:
+            single &= check_mask
+            double &= check_mask
+            left &= check_mask
+            right &= check_mask
+        if single:
+            extend(cached(-(single << 6 | (push + 16))) or _pawn_move_list(single, push))
+        if double:
+            extend(cached(-(double << 6 | (push * 2 + 16))) or _pawn_move_list(double, push * 2))
+        if left:
+            extend(cached(-(left << 6 | (lcap + 16))) or _pawn_move_list(left, lcap))
+        if right:
+            extend(cached(-(right << 6 | (rcap + 16))) or _pawn_move_list(right, rcap))
+        if pawns & pinned:
+            self._pinned_pawn_moves(us, pawns & pinned, pin_rays, occ, enemy, check_mask, moves)
+        if self.ep_square is not None:
+            self._en_passant_moves(us, king_sq, occ, moves)
+
+        # Pieces: attacks & target mask, expanded through the move list cache.
+        # Slider lookups are inlined; this loop is the hot path of any search.
+        for frm in squares_of(own[KNIGHT] & ~pinned) or _bit_squares(own[KNIGHT] & ~pinned):
+            targets = KNIGHT_ATTACKS[frm] & target_mask
+            if targets:
+                extend(cached(targets << 6 | frm) or _move_list(frm, targets))
+        for frm in squares_of(own[BISHOP] | own[QUEEN]) or _bit_squares(own[BISHOP] | own[QUEEN]):
+            targets = (DIAG_TABLES[frm][occ & DIAG_MASKS[frm]] | ANTI_TABLES[frm][occ & ANTI_MASKS[frm]]) & target_mask
+            if targets and (1 << frm) & pinned:
+                targets &= pin_rays[frm]
+            if targets:
+                extend(cached(targets << 6 | frm) or _move_list(frm, targets))
+        for frm in squares_of(own[ROOK] | own[QUEEN]) or _bit_squares(own[ROOK] | own[QUEEN]):
+            targets = (RANK_TABLES[frm][occ & RANK_MASKS[frm]] | FILE_TABLES[frm][occ & FILE_MASKS[frm]]) & target_mask
+            if targets and (1 << frm) & pinned:
+                targets &= pin_rays[frm]
+            if targets:
+                extend(cached(targets << 6 | frm) or _move_list(frm, targets))
         return moves
 
-    def get_pawn_moves(self, r, c, moves):
-        if self.white_to_move:
-            if self.board[r-1][c] == "--": # 1 sq move
-                moves.append(Move((r, c), (r-1, c), self.board))
-                if r == 6 and self.board[r-2][c] == "--": # 2 sq move
-                    moves.append(Move((r, c), (r-2, c), self.board))
-            if c-1 >= 0: # Capture Left
-                if self.board[r-1][c-1][0] == 'b':
-                    moves.append(Move((r, c), (r-1, c-1), self.board))
-            if c+1 <= 7: # Capture Right
-                if self.board[r-1][c+1][0] == 'b':
-                    moves.append(Move((r, c), (r-1, c+1), self.board))
-        else: # Black
-            if r+1 < 8:
-                if self.board[r+1][c] == "--":
-                    moves.append(Move((r, c), (r+1, c), self.board))
-                    if r == 1 and self.board[r+2][c] == "--":
-                        moves.append(Move((r, c), (r+2, c), self.board))
-                if c-1 >= 0:
-                    if self.board[r+1][c-1][0] == 'w':
-                        moves.append(Move((r, c), (r+1, c-1), self.board))
-                if c+1 <= 7:
-                    if self.board[r+1][c+1][0] == 'w':
-                        moves.append(Move((r, c), (r+1, c+1), self.board))
-
-    def get_rook_moves(self, r, c, moves):
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
-        enemy_color = "b" if self.white_to_move else "w"
-        for d in directions:
-            for i in range(1, 8):
-                end_row = r + d[0] * i
-                end_col = c + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece == "--":
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                    elif end_piece[0] == enemy_color:
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                        break
-                    else: # Friendly
-                        break
-                else:
-                    break
-
-    def get_bishop_moves(self, r, c, moves):
-        directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
-        enemy_color = "b" if self.white_to_move else "w"
-        for d in directions:
-            for i in range(1, 8):
-                end_row = r + d[0] * i
-                end_col = c + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece == "--":
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                    elif end_piece[0] == enemy_color:
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                        break
-                    else:
-                        break
-                else: break
-
-    def get_knight_moves(self, r, c, moves):
-        knight_moves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        ally_color = "w" if self.white_to_move else "b"
-        for m in knight_moves:
-            end_row = r + m[0]
-            end_col = c + m[1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:
-                    moves.append(Move((r, c), (end_row, end_col), self.board))
-
-    def get_queen_moves(self, r, c, moves):
-        self.get_rook_moves(r, c, moves)
-        self.get_bishop_moves(r, c, moves)
-
-    def get_king_moves(self, r, c, moves):
-        king_moves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
-        ally_color = "w" if self.white_to_move else "b"
-        for i in range(8):
-            end_row = r + king_moves[i][0]
-            end_col = c + king_moves[i][1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:
-                    moves.append(Move((r, c), (end_row, end_col), self.board))
+    def _castling_moves(self, us, occ, moves):
+        # Only called when not in check
+        rights = self.castling
+        if us == WHITE:
+            king_side, queen_side, king_sq = CASTLE_WK, CASTLE_WQ, 4
+        else:
+            king_side, queen_side, king_sq = CASTLE_BK, CASTLE_BQ, 60
+        them = us ^ 1
+        attacked = self.square_attacked
+        if rights & king_side and not occ & (0x60 << (king_sq - 4)):
+            if not attacked(king_sq + 1, occ, them) and not attacked(king_sq + 2, occ, them):
+                moves.append(king_sq | (king_sq + 2) << 6 | MOVE_CASTLING)
+        if rights & queen_side and not occ & (0x0E << (king_sq - 4)):
+            if not attacked(king_sq - 1, occ, them) and not attacked(king_sq - 2, occ, them):
+                moves.append(king_sq | (king_sq - 2) << 6 | MOVE_CASTLING)
+
+    def _pinned_pawn_moves(self, us, pawns, pin_rays, occ, enemy, check_mask, moves):
+        # Rare enough to do pawn by pawn
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            frm = bit.bit_length() - 1
+            allowed = pin_rays[frm] & check_mask
+            push = 8 if us == WHITE else -8
+            one = 1 << (frm + push)
+            if not one & occ:
+                if one & allowed:
+                    moves.extend(_pawn_move_list(one, -push))
+                if (frm >> 3) == (1 if us == WHITE else 6):
+                    two = 1 << (frm + 2 * push)
+                    if not two & occ and two & allowed:
+                        moves.extend(_pawn_move_list(two, -2 * push))
+            captures = PAWN_ATTACKS[us][frm] & enemy & allowed
+            while captures:
+                cbit = captures & -captures
+                captures ^= cbit
+                moves.extend(_pawn_move_list(cbit, frm - (cbit.bit_length() - 1)))
+
+    def _en_passant_moves(self, us, king_sq, occ, moves):
+        # Checked by playing it out on the occupancy: this covers evasions and
+        # the horizontal pin where both pawns leave the king's rank at once.
+        ep = self.ep_square
+        them = us ^ 1
+        their = self.pieces[them]
+        captured_bit = 1 << (ep - 8 if us == WHITE else ep + 8)
+        candidates = PAWN_ATTACKS[them][ep] & self.pieces[us][PAWN]
+        while candidates:
+            bit = candidates & -candidates
+            candidates ^= bit
+            after = (occ ^ bit ^ captured_bit) | (1 << ep)
+            if ((rook_attacks(king_sq, after) & (their[ROOK] | their[QUEEN]))
+                    or (bishop_attacks(king_sq, after) & (their[BISHOP] | their[QUEEN]))
+                    or (KNIGHT_ATTACKS[king_sq] & their[KNIGHT])
+                    or (PAWN_ATTACKS[us][king_sq] & their[PAWN] & ~captured_bit)):
+                continue
+            moves.append((bit.bit_length() - 1) | ep << 6 | MOVE_EN_PASSANT)
 
     def move_from_uci(self, uci_str):
-        # e2e4 -> Move object
+        # e2e4 / e7e8q -> Move object
         if len(uci_str) < 4: return None
         start_sq = uci_str[:2]
         end_sq = uci_str[2:4]
-        
-        # files_to_cols is in Move class but not static?
-        # Let's access via Move class dicts
+
         c1 = Move.files_to_cols.get(start_sq[0])
         r1 = Move.ranks_to_rows.get(start_sq[1])
         c2 = Move.files_to_cols.get(end_sq[0])
         r2 = Move.ranks_to_rows.get(end_sq[1])
-        
+
         if c1 is not None and r1 is not None and c2 is not None and r2 is not None:
-            return Move((r1, c1), (r2, c2), self.board)
+            promotion = None
+            if len(uci_str) > 4:
+                promotion = PIECE_CHARS.find(uci_str[4].upper())
+                if promotion not in PROMOTION_ORDER:
+                    return None
+            start = square_index(r1, c1)
+            end = square_index(r2, c2)
+            squares = self.squares
+            return Move.from_code(encode_move(start, end, squares[start], squares[end], promotion), squares)
         return None
 
 
+def encode_move(start, end, piece, captured, promotion=None):
+    """Move code for `piece` going from `start` to `end` over `captured`
+    ("--" if empty). Pawns reaching the last rank default to a queen."""
+    code = start | end << 6
+    if piece[1:] == 'P':
+        if (1 << end) & BACK_RANKS:
+            code |= MOVE_PROMOTION | ((promotion or QUEEN) - KNIGHT) << 12
+        elif (end - start) % 8 and captured == EMPTY:
+            code |= MOVE_EN_PASSANT
+    elif piece[1:] == 'K' and abs(end - start) == 2:
+        code |= MOVE_CASTLING
+    return code
+
+
+def code_to_uci(code):
+    """UCI string for a move code from generate_moves()."""
+    start = code & 63
+    end = (code >> 6) & 63
+    uci = "abcdefgh"[start & 7] + str((start >> 3) + 1) + "abcdefgh"[end & 7] + str((end >> 3) + 1)
+    if code & MOVE_FLAGS == MOVE_PROMOTION:
+        uci += "nbrq"[code >> 12 & 3]
+    return uci
+
+
 class Move:
     ranks_to_rows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
     rows_to_ranks = {v: k for k, v in ranks_to_rows.items()}
     files_to_cols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     cols_to_files = {v: k for k, v in files_to_cols.items()}
 
-    def __init__(self, start_sq, end_sq, board):
-        self.start_row = start_sq[0]
-        self.start_col = start_sq[1]
-        self.end_row = end_sq[0]
-        self.end_col = end_sq[1]
-        self.piece_moved = board[self.start_row][self.start_col]
-        self.piece_captured = board[self.end_row][self.end_col]
-        
-        self.move_id = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
+    # The move itself is the 16-bit code; the piece names are for the UI
+    __slots__ = ('code', 'piece_moved', 'piece_captured')
+
+    def __init__(self, start_sq, end_sq, board, promotion=None):
+        self.piece_moved = board[start_sq[0]][start_sq[1]]
+        self.piece_captured = board[end_sq[0]][end_sq[1]]
+        self.code = encode_move(square_index(start_sq[0], start_sq[1]), square_index(end_sq[0], end_sq[1]),
+                                self.piece_moved, self.piece_captured, promotion)
+
+    @classmethod
+    def from_code(cls, code, squares):
+        """Build a Move from a move code and the engine's mailbox."""
+        move = cls.__new__(cls)
+        move.code = code
+        move.piece_moved = squares[code & 63]
+        if code & MOVE_FLAGS == MOVE_EN_PASSANT:
+            move.piece_captured = ('b' if move.piece_moved[0] == 'w' else 'w') + 'P'
+        else:
+            move.piece_captured = squares[(code >> 6) & 63]
+        return move
+
+    start = property(lambda self: self.code & 63)
+    end = property(lambda self: (self.code >> 6) & 63)
+    move_id = property(lambda self: self.code)
+
+    @property
+    def promotion(self):
+        """Promotion piece type (KNIGHT..QUEEN), or 0."""
+        if self.code & MOVE_FLAGS == MOVE_PROMOTION:
+            return KNIGHT + (self.code >> 12 & 3)
+        return 0
+
+    # Row/col view for the UI (row 0 = rank 8)
+    start_row = property(lambda self: 7 - ((self.code & 63) >> 3))
+    start_col = property(lambda self: self.code & 7)
+    end_row = property(lambda self: 7 - ((self.code >> 9) & 7))
+    end_col = property(lambda self: (self.code >> 6) & 7)
 
     def __eq__(self, other):
         if isinstance(other, Move):
-            return self.move_id == other.move_id
+            return self.code == other.code
         return False
 
+    def __hash__(self):
+        return self.code
+
     def get_chess_notation(self):
-        return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
+        return code_to_uci(self.code)
 
     def get_rank_file(self, r, c):
         return self.cols_to_files[c] + self.rows_to_ranks[r]
+
+
+class MoveSet:
+    """The legal moves of one position, stored as move codes. Membership is
+    a set lookup; Move objects are only built for what is asked for."""
+    __slots__ = ('codes', 'squares', '_by_origin')
+
+    def __init__(self, codes, squares):
+        self.codes = set(codes)
+        self.squares = list(squares) # Snapshot: the Moves describe this position
+        self._by_origin = None
+
+    def __contains__(self, move):
+        return move.code in self.codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        squares = self.squares
+        return (Move.from_code(code, squares) for code in self.codes)
+
+    def from_square(self, sq):
+        """Moves of the piece on bitboard square `sq`."""
+        if self._by_origin is None:
+            by_origin = {}
+            for code in self.codes:
+                by_origin.setdefault(code & 63, []).append(code)
+            self._by_origin = by_origin
+        squares = self.squares
+        return [Move.from_code(code, squares) for code in self._by_origin.get(sq, ())]
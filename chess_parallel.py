@@ -0,0 +1,156 @@
+"""Root-split parallelism for perft and search.
+
+Python runs one search per core at best (GIL), so anything heavy is split
+at the root: every legal root move becomes its own task in a process pool
+and the results are merged back in root move order, so the output never
+depends on which worker happened to finish first.
+
+    python chess_parallel.py --workers 8 --time 10           # analyse start position
+    python chess_parallel.py --fen "<fen>" --depth 6         # fixed depth (repeatable)
+    python chess_perft.py --workers 8 --depth 5              # parallel perft suite
+
+A workers value of 0 (or None) means one per CPU core.
+"""
+import argparse
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_engine import GameState, START_FEN, code_to_uci
+from chess_ai import Searcher, MATE, MAX_DEPTH
+from chess_perft import perft as serial_perft
+
+
+def worker_count(workers=None):
+    return workers or os.cpu_count() or 1
+
+
+def make_pool(workers=None):
+    """Process pool for the functions below. Reuse one across calls - spawning
+    workers costs far more than a shallow perft."""
+    return ProcessPoolExecutor(max_workers=worker_count(workers),
+                               mp_context=multiprocessing.get_context("spawn"))
+
+
+def _replay(fen, codes):
+    gs = GameState(fen)
+    for code in codes:
+        gs.push(code)
+    return gs
+
+
+def _run(task, jobs, workers, pool):
+    # Executor.map yields in submission order regardless of completion order
+    if pool is not None:
+        return list(pool.map(task, *zip(*jobs)))
+    with make_pool(min(worker_count(workers), len(jobs))) as own_pool:
+        return list(own_pool.map(task, *zip(*jobs)))
+
+
+# --- Perft ---
+
+def _perft_task(fen, codes, root, depth):
+    gs = _replay(fen, codes)
+    gs.push(root)
+    return serial_perft(gs, depth - 1)
+
+
+def divide(gs, depth, workers=None, pool=None):
+    """Same as chess_perft.divide, one task per root move."""
+    moves = gs.generate_moves()
+    if depth < 1 or not moves:
+        return []
+    fen, codes = gs.start_fen, gs.move_codes()
+    counts = _run(_perft_task, [(fen, codes, move, depth) for move in moves], workers, pool)
+    return [(code_to_uci(move), nodes) for move, nodes in zip(moves, counts)]
+
+
+def perft(gs, depth, workers=None, pool=None):
+    if depth < 2:
+        return serial_perft(gs, depth) # not worth a round trip
+    return sum(nodes for _, nodes in divide(gs, depth, workers, pool))
+
+
+# --- Search ---
+
+def _search_task(fen, codes, root_moves, time_limit, max_depth):
+    # Fresh Searcher per task so a fixed-depth result is reproducible
+    gs = _replay(fen, codes)
+    searcher = Searcher()
+    iterations = []
+    searcher.search(gs, time_limit, iterations.append, max_depth=max_depth, root_moves=root_moves)
+    # A slice that stopped early (mate found / max depth) counts as final
+    return iterations, not searcher.timed_out
+
+
+def search(gs, time_limit, workers=None, pool=None, max_depth=MAX_DEPTH):
+    """Root-split iterative deepening. The legal moves are dealt round-robin
+    into one slice per worker, each slice is searched with a full window,
+    and the best score at the deepest depth every slice completed wins
+    (ties go to the earlier root move). Returns a dict with 'move' (uci or
+    None), 'score', 'depth', 'nodes'."""
+    moves = gs.generate_moves()
+    if not moves:
+        return {'move': None, 'score': 0, 'depth': 0, 'nodes': 0}
+    n = min(worker_count(workers), len(moves))
+    slices = [moves[i::n] for i in range(n)]
+    fen, codes = gs.start_fen, gs.move_codes()
+    results = _run(_search_task, [(fen, codes, s, time_limit, max_depth) for s in slices], n, pool)
+
+    # Deepest depth every unfinished slice reached; finished slices keep
+    # their last (final) answer for any deeper depth
+    unfinished = [its[-1]['depth'] if its else 0 for its, finished in results if not finished]
+    depth = min(unfinished) if unfinished else max(its[-1]['depth'] for its, _ in results if its)
+
+    order = {code_to_uci(move): i for i, move in enumerate(moves)}
+    best = None
+    nodes = 0
+    for iterations, _ in results:
+        if iterations:
+            nodes += iterations[-1]['nodes']
+        done = [it for it in iterations if it['depth'] <= depth]
+        if not done:
+            continue
+        it = done[-1]
+        key = (-it['score'], order[it['move']])
+        if best is None or key < best[0]:
+            best = (key, it)
+    if best is None:
+        # Nothing finished depth 1 in time - any legal move beats none
+        return {'move': code_to_uci(moves[0]), 'score': 0, 'depth': 0, 'nodes': nodes}
+    it = best[1]
+    return {'move': it['move'], 'score': it['score'], 'depth': depth, 'nodes': nodes}
+
+
+def format_score(score):
+    if abs(score) >= MATE - MAX_DEPTH:
+        plies = MATE - abs(score)
+        return f"mate {(plies + 1) // 2 if score > 0 else -((plies + 1) // 2)}"
+    return f"cp {score}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel root-split search for chess_engine")
+    parser.add_argument("--fen", default=START_FEN, help="Position to analyse")
+    parser.add_argument("--time", type=float, default=5.0, help="Seconds per search")
+    parser.add_argument("--depth", type=int, help="Stop at this depth (results are then reproducible)")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (0 = one per core)")
+    args = parser.parse_args(argv)
+
+    gs = GameState(args.fen)
+    n = worker_count(args.workers)
+    time_limit = args.time if not args.depth else float("inf")
+    with make_pool(n) as pool:
+        t0 = time.perf_counter()
+        result = search(gs, time_limit, n, pool, max_depth=args.depth or MAX_DEPTH)
+        elapsed = time.perf_counter() - t0
+    nps = result['nodes'] / elapsed if elapsed > 0 else 0
+    print(f"bestmove {result['move']}  {format_score(result['score'])}  depth {result['depth']}  "
+          f"nodes {result['nodes']}  {elapsed:.2f}s  {nps:.0f} nps  ({n} workers)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
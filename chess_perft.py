@@ -0,0 +1,135 @@
+"""Perft for chess_engine: counts leaf nodes of the legal move tree.
+
+Known node counts catch move generation bugs, and nodes/sec is the
+baseline any engine optimisation has to beat.
+
+    python chess_perft.py                         # reference suite
+    python chess_perft.py --depth 5               # deeper suite run
+    python chess_perft.py --fen "<fen>" --depth 3 --divide
+    python chess_perft.py --min-nps 150000        # exit 1 if slower
+    python chess_perft.py --workers 0 --depth 5   # root moves split over all cores
+"""
+import argparse
+import sys
+import time
+
+from chess_engine import GameState, START_FEN, code_to_uci
+
+# (name, fen, node counts for depth 1, 2, ...) - chessprogramming.org perft
+# results; "middlegame" counts were cross-checked against python-chess
+REFERENCE_POSITIONS = [
+    ("start", START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("talkchess", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P3/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [47, 1845, 81467]),
+]
+
+# Depth used per position by the default suite run (kept to a few seconds)
+DEFAULT_DEPTHS = {"start": 4, "kiwipete": 3, "endgame": 4, "promotions": 3, "talkchess": 3, "middlegame": 3}
+
+
+def perft(gs, depth):
+    """Leaf nodes at `depth`; the last ply is bulk-counted."""
+    moves = gs.generate_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    push, pop = gs.push, gs.pop
+    for move in moves:
+        push(move)
+        nodes += perft(gs, depth - 1)
+        pop()
+    return nodes
+
+
+def divide(gs, depth):
+    """Per root move node counts: [(uci, nodes), ...]."""
+    results = []
+    for move in gs.generate_moves():
+        gs.push(move)
+        results.append((code_to_uci(move), perft(gs, depth - 1)))
+        gs.pop()
+    return results
+
+
+def run_suite(depth=None, out=sys.stdout, pool=None):
+    """Run the reference positions; returns (all_ok, total_nodes, seconds).
+    With a pool (chess_parallel.make_pool) each position is split at the root."""
+    all_ok = True
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected in REFERENCE_POSITIONS:
+        d = min(depth or DEFAULT_DEPTHS[name], len(expected))
+        gs = GameState(fen)
+        t0 = time.perf_counter()
+        if pool is not None:
+            import chess_parallel
+            nodes = chess_parallel.perft(gs, d, pool=pool)
+        else:
+            nodes = perft(gs, d)
+        elapsed = time.perf_counter() - t0
+        ok = nodes == expected[d - 1]
+        all_ok = all_ok and ok
+        total_nodes += nodes
+        total_time += elapsed
+        status = "ok" if ok else f"FAIL (expected {expected[d - 1]})"
+        print(f"{name:<11} depth {d}: {nodes:>9} nodes {elapsed:7.2f}s {nodes / elapsed:>9.0f} nps  {status}", file=out)
+    return all_ok, total_nodes, total_time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft for chess_engine")
+    parser.add_argument("--fen", help="Position to search (default: reference suite)")
+    parser.add_argument("--depth", type=int, help="Search depth")
+    parser.add_argument("--divide", action="store_true", help="Print node counts per root move")
+    parser.add_argument("--min-nps", type=float, help="Fail if throughput drops below this many nodes/sec")
+    parser.add_argument("--workers", type=int, help="Split root moves over this many processes (0 = one per core)")
+    args = parser.parse_args(argv)
+
+    pool = None
+    if args.workers is not None:
+        import chess_parallel
+        pool = chess_parallel.make_pool(args.workers)
+        # The first task starts the workers; keep spawn time out of the timings
+        pool.submit(chess_parallel.worker_count, 1).result()
+
+    if args.fen or args.divide:
+        gs = GameState(args.fen or START_FEN)
+        depth = args.depth or 3
+        t0 = time.perf_counter()
+        if args.divide:
+            results = chess_parallel.divide(gs, depth, pool=pool) if pool else divide(gs, depth)
+            for uci, nodes in results:
+                print(f"{uci}: {nodes}")
+            nodes = sum(n for _, n in results)
+            print(f"\nMoves: {len(results)}")
+        else:
+            nodes = chess_parallel.perft(gs, depth, pool=pool) if pool else perft(gs, depth)
+        elapsed = time.perf_counter() - t0
+        ok = True
+    else:
+        ok, nodes, elapsed = run_suite(args.depth, pool=pool)
+    if pool:
+        pool.shutdown()
+
+    nps = nodes / elapsed if elapsed > 0 else float("inf")
+    print(f"Nodes: {nodes}  Time: {elapsed:.2f}s  NPS: {nps:.0f}")
+    if not ok:
+        print("Node counts do not match the reference values")
+        return 1
+    if args.min_nps and nps < args.min_nps:
+        print(f"Throughput below threshold ({nps:.0f} < {args.min_nps:.0f} nps)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
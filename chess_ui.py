@@ -1,9 +1,19 @@
 
 import customtkinter
 import subprocess
-import json
-from pubsub import pub
-from chess_engine import GameState, Move
+import time
+import chess_protocol
+from chess_delivery import ReliableChannel
+from chess_protocol import GameMessage, INVITE, ACCEPT, MOVE, RESIGN, ACK
+from mesh_interface import node_num
+from mesh_scheduler import PRIORITY_CONTROL, PRIORITY_GAME
+from chess_engine import GameState, Move, square_index, KNIGHT, BISHOP, ROOK, QUEEN
+from chess_ai import SearchWorker
+
+LOCAL_OPTION = "Local (Both Sides)"
+COMPUTER_OPTION = "Computer"
+AI_TIME_OPTIONS = ["1s", "3s", "10s", "30s"]
+AI_GRACE = 10 # extra seconds before we give up waiting (first search also spawns the worker)
 
 class ChessBoardFrame(customtkinter.CTkFrame):
     def __init__(self, master, mesh_interface=None, width=400, height=500):
@@ -19,9 +29,27 @@ class ChessBoardFrame(customtkinter.CTkFrame):
         self.opponent_id = None
         self.my_color = "w" # 'w' or 'b'
         self.pending_invite = None # Node ID of pending invite
+        self.pending_game_id = None
+        self.game_id = None # Ties packets to the current game
+        
+        # Computer Opponent (search runs in its own process, see chess_ai)
+        self.vs_ai = False
+        self.ai_worker = None
+        self.ai_job = None
+        self.ai_deadline = 0
+        self.ai_last_info = None
+        
+        # Acks, retries and dedup for game messages; on_chess_packet only
+        # sees each message once and in order
+        # Deliveries happen on the GUI thread (game packets are dispatched
+        # from MeshInterface.process_events); give-ups come from the
+        # channel's thread, so hop back before touching widgets
+        self.delivery = ReliableChannel(self.transmit_game, self.on_chess_packet, self.on_delivery_failed,
+                                        peer_key=node_num)
         
-        # Subscribe to chess events
-        pub.subscribe(self.on_chess_packet, 'chess.packet')
+        # Game packets arrive on their own port
+        if self.mesh_interface:
+            self.mesh_interface.dispatcher.register(chess_protocol.CHESS_PORTNUM, self.on_game_packet)
         
         # Piece Map (Unicode)
         self.pieces = {
@@ -47,9 +75,9 @@ class ChessBoardFrame(customtkinter.CTkFrame):
         self.lbl_status.pack(pady=2)
         
         # Opponent Selector
-        self.opponent_options = ["Local (Both Sides)"]
+        self.opponent_options = [LOCAL_OPTION, COMPUTER_OPTION]
         self.var_opponent = customtkinter.StringVar(value=self.opponent_options[0])
-        self.combo_opponent = customtkinter.CTkComboBox(self.header_frame, variable=self.var_opponent, values=self.opponent_options, width=160)
+        self.combo_opponent = customtkinter.CTkComboBox(self.header_frame, variable=self.var_opponent, values=self.opponent_options, width=160, command=self.on_opponent_selected)
         self.combo_opponent.pack(side="left", padx=5)
         
         # Invite/Refresh
@@ -59,6 +87,11 @@ class ChessBoardFrame(customtkinter.CTkFrame):
         self.btn_refresh = customtkinter.CTkButton(self.header_frame, text="⟳", width=30, command=self.refresh_nodes)
         self.btn_refresh.pack(side="left", padx=2)
         
+        # Computer think time per move
+        self.var_ai_time = customtkinter.StringVar(value="3s")
+        self.opt_ai_time = customtkinter.CTkOptionMenu(self.header_frame, variable=self.var_ai_time, values=AI_TIME_OPTIONS, width=60)
+        self.opt_ai_time.pack(side="left", padx=2)
+        
         self.btn_accept = customtkinter.CTkButton(self.header_frame, text="Accept Invite", width=80, fg_color="green", command=self.accept_invite)
         # Hidden by default
         
@@ -73,7 +106,7 @@ class ChessBoardFrame(customtkinter.CTkFrame):
     def refresh_nodes(self):
         if not self.mesh_interface: return
         nodes = self.mesh_interface.get_nodes()
-        opts = ["Local (Both Sides)"]
+        opts = [LOCAL_OPTION, COMPUTER_OPTION]
         for nid, data in nodes.items():
             name = data.get('user', {}).get('shortName', str(nid))
             opts.append(f"{name} ({nid})")
@@ -83,24 +116,35 @@ class ChessBoardFrame(customtkinter.CTkFrame):
 
     def get_selected_node_id(self):
         val = self.var_opponent.get()
-        if "Local" in val: return None
-        # Extract ID from "Name (ID)"
+        if val in (LOCAL_OPTION, COMPUTER_OPTION): return None
+        # Extract ID from "Name (ID)" - as a node number, like packets carry
         try:
-            return val.split('(')[-1].strip(')')
+            return node_num(val.split('(')[-1].strip(')'))
         except:
             return None
 
+    def on_opponent_selected(self, choice):
+        if choice == LOCAL_OPTION and self.vs_ai:
+            self.stop_ai()
+            self.vs_ai = False
+            self.status_var.set("Local game")
+
     def send_invite(self):
+        if self.var_opponent.get() == COMPUTER_OPTION:
+            self.start_ai_game()
+            return
         target = self.get_selected_node_id()
         if not target:
             self.status_var.set("Select a node first!")
             return
             
         # Send Invite JSON
-        payload = {"chess": "invite"}
-        self.send_json(target, payload)
+        self.game_id = chess_protocol.new_game_id()
+        self.send_game(target, GameMessage(INVITE, self.game_id))
         self.status_var.set(f"Invite sent to {target}...")
         self.opponent_id = target
+        self.stop_ai()
+        self.vs_ai = False
         self.is_multiplayer = True # Tentative
         self.my_color = "w" # Inviter plays White
 
@@ -108,10 +152,12 @@ class ChessBoardFrame(customtkinter.CTkFrame):
         if not self.pending_invite: return
         
         # Send Accept
-        payload = {"chess": "accept"}
-        self.send_json(self.pending_invite, payload)
+        self.game_id = self.pending_game_id
+        self.send_game(self.pending_invite, GameMessage(ACCEPT, self.game_id))
         
         self.opponent_id = self.pending_invite
+        self.stop_ai()
+        self.vs_ai = False
         self.is_multiplayer = True
         self.my_color = "b" # Accepter plays Black
         self.status_var.set(f"Accepted! Playing vs {self.opponent_id}")
@@ -124,69 +170,164 @@ class ChessBoardFrame(customtkinter.CTkFrame):
         self.update_pieces()
         self.draw_board() # Re-draw for orientation
 
-    def send_json(self, target, payload):
+    def send_game(self, target, msg):
         if not self.mesh_interface: return
-        import threading
-        
-        def _send():
-            json_str = json.dumps(payload)
-            # Send as DM
-            try:
-                 target_id = int(target)
-            except:
-                 target_id = target
-            self.mesh_interface.send_message(json_str, destinationId=target_id)
-            
-        threading.Thread(target=_send, daemon=True).start()
+        self.delivery.send(target, msg)
+
+    def transmit_game(self, target, msg):
+        # Runs on the delivery thread (first send and retries); only queues the packet
+        data = chess_protocol.encode(msg)
+        # Send as DM on the chess port
+        try:
+             target_id = int(target)
+        except:
+             target_id = target
+        priority = PRIORITY_CONTROL if msg.kind == ACK else PRIORITY_GAME
+        self.mesh_interface.send_data(data, destinationId=target_id, portNum=chess_protocol.CHESS_PORTNUM, priority=priority)
+
+    def on_game_packet(self, packet):
+        msg = chess_protocol.decode(packet.payload)
+        if msg:
+            self.delivery.receive(msg, packet.sender)
+
+    def on_delivery_failed(self, target, msg):
+        if self.mesh_interface:
+            self.mesh_interface.call_soon(self.on_game_send_failed, target, msg)
+
+    def on_game_send_failed(self, target, msg):
+        if msg.game_id == self.game_id:
+            self.status_var.set(f"No answer from {target} - game message not delivered")
 
     def on_chess_packet(self, payload, sender):
-        # Handle Incoming JSON
-        type = payload.get('chess')
-        if type == 'invite':
+        # payload is a chess_protocol.GameMessage
+        if payload.kind == INVITE:
             self.pending_invite = sender
+            self.pending_game_id = payload.game_id
             
             # Lookup Name
             name = str(sender)
             if self.mesh_interface:
-                nodes = self.mesh_interface.get_nodes()
-                if sender in nodes:
-                     user = nodes[sender].get('user', {})
-                     name = user.get('longName') or user.get('shortName') or name
-                else:
-                     # Try string ID match if dict keys are diff type
-                     for nid, data in nodes.items():
-                          if str(nid) == str(sender):
-                               user = data.get('user', {})
-                               name = user.get('longName') or user.get('shortName') or name
-                               break
+                name = self.mesh_interface.directory.long_name(sender)
             
             self.status_var.set(f"Invite from {name}!")
             self.btn_accept.configure(text=f"Play vs {name}")
             self.btn_accept.pack(side="right", padx=5)
             
-        elif type == 'accept':
-            if str(sender) == str(self.opponent_id):
+        elif payload.game_id != self.game_id or node_num(sender) != node_num(self.opponent_id):
+            return # Not our current game
+            
+        elif payload.kind == ACCEPT:
+            if self.is_multiplayer:
                 self.status_var.set(f"{sender} accepted! You are White.")
                 # Start game
                 self.game_state = GameState()
                 self.valid_moves = self.game_state.get_valid_moves()
                 self.update_pieces()
                 
-        elif type == 'move':
-            # Apply Move
-            uci = payload.get('u')
-            if uci:
-                move = self.game_state.move_from_uci(uci)
-                if move and move in self.valid_moves:
-                    self.game_state.make_move(move)
-                    self.play_sound(move.piece_captured != "--")
-                    self.valid_moves = self.game_state.get_valid_moves()
-                    self.update_pieces()
-                    self.status_var.set("Your Turn")
+        elif payload.kind == MOVE:
+            # Only the opponent's own moves, and only on their turn
+            their_turn = self.game_state.white_to_move != (self.my_color == 'w')
+            if their_turn and payload.move in self.valid_moves.codes:
+                move = Move.from_code(payload.move, self.valid_moves.squares)
+                self.game_state.make_move(move)
+                self.play_sound(move.piece_captured != "--")
+                self.valid_moves = self.game_state.get_valid_moves()
+                self.update_pieces()
+                self.status_var.set(self.game_over_text() or "Your Turn")
                 
-        elif type == 'resign':
+        elif payload.kind == RESIGN:
              self.status_var.set("Opponent Resigned!")
 
+    # --- Computer Opponent ---
+
+    def start_ai_game(self):
+        # Player is White, the computer answers as Black
+        self.stop_ai()
+        self.vs_ai = True
+        self.is_multiplayer = False
+        self.opponent_id = None
+        self.my_color = "w"
+        self.game_state = GameState()
+        self.valid_moves = self.game_state.get_valid_moves()
+        self.selected_sq = ()
+        self.player_clicks = []
+        self.draw_board()
+        self.highlight_squares()
+        self.status_var.set("Playing the Computer - you are White")
+
+    def start_ai_search(self):
+        if self.ai_worker is None:
+            self.ai_worker = SearchWorker()
+        budget = float(self.var_ai_time.get().rstrip("s"))
+        self.ai_job = self.ai_worker.submit(self.game_state, budget)
+        self.ai_deadline = time.time() + budget + AI_GRACE
+        self.ai_last_info = None
+        self.status_var.set("Computer is thinking...")
+        self.after(100, self.poll_ai)
+
+    def poll_ai(self):
+        if not self.vs_ai or self.ai_job is None: return
+        for job_id, kind, data in self.ai_worker.poll():
+            if job_id != self.ai_job:
+                continue # Leftover from an abandoned search
+            if kind == 'info':
+                self.ai_last_info = data
+                if data.get('source'):
+                    self.status_var.set(f"Computer plays {data['move']} ({data['source']})")
+                else:
+                    self.status_var.set(f"Computer is thinking... depth {data['depth']} ({data['move']})")
+            elif kind == 'bestmove':
+                self.ai_job = None
+                self.apply_ai_move(data or (self.ai_last_info or {}).get('move'))
+                return
+        
+        if time.time() > self.ai_deadline:
+            if not self.ai_worker.process.is_alive():
+                # Worker died - fall back to whatever it told us last
+                print("AI worker exited unexpectedly")
+                self.ai_worker = None
+                self.ai_job = None
+                self.apply_ai_move((self.ai_last_info or {}).get('move'))
+                return
+            self.ai_worker.stop() # Search answers with its best move so far
+        self.after(100, self.poll_ai)
+
+    def apply_ai_move(self, uci):
+        move = self.game_state.move_from_uci(uci) if uci else None
+        if not move or move not in self.valid_moves:
+            self.status_var.set("Computer could not find a move")
+            return
+        self.game_state.make_move(move)
+        self.play_sound(move.piece_captured != "--")
+        self.valid_moves = self.game_state.get_valid_moves()
+        self.update_pieces()
+        self.highlight_squares()
+        self.status_var.set(self.game_over_text() or "Your Turn")
+
+    def stop_ai(self):
+        if self.ai_worker and self.ai_job is not None:
+            self.ai_worker.stop()
+        self.ai_job = None
+
+    def close(self):
+        # Called on app exit
+        self.delivery.close()
+        if self.ai_worker:
+            self.ai_worker.close()
+            self.ai_worker = None
+
+    def game_over_text(self):
+        # Mate/stalemate are set by get_valid_moves(); draws come from the Zobrist history
+        if self.game_state.checkmate:
+            winner = "Black" if self.game_state.white_to_move else "White"
+            return f"Checkmate! {winner} wins"
+        if self.game_state.stalemate:
+            return "Stalemate - Draw"
+        reason = self.game_state.draw_reason()
+        if reason:
+            return f"Draw by {reason}"
+        return None
+
     def draw_board(self):
         # Clear existing
         for widget in self.board_frame.winfo_children():
@@ -231,9 +372,10 @@ class ChessBoardFrame(customtkinter.CTkFrame):
         self.update_pieces()
 
     def update_pieces(self):
+        board = self.game_state.board # A fresh 8x8 copy per read - take it once
         for r in range(8):
             for c in range(8):
-                piece = self.game_state.board[r][c]
+                piece = board[r][c]
                 symbol = self.pieces.get(piece, "")
                 self.buttons[r][c].configure(text=symbol, text_color="black")
                 
@@ -252,19 +394,19 @@ class ChessBoardFrame(customtkinter.CTkFrame):
         # Highlight moves
         if self.selected_sq:
             r, c = self.selected_sq
-            for move in self.valid_moves:
-                if move.start_row == r and move.start_col == c:
-                    self.buttons[move.end_row][move.end_col].configure(fg_color="#82C26E") 
+            for move in self.valid_moves.from_square(square_index(r, c)):
+                self.buttons[move.end_row][move.end_col].configure(fg_color="#82C26E")
 
     def on_square_clicked(self, r, c):
-        # Turn Check for Multiplayer
-        if self.is_multiplayer:
+        board = self.game_state.board
+        # Turn Check for Multiplayer / Computer
+        if self.is_multiplayer or self.vs_ai:
             is_white_turn = self.game_state.white_to_move
             if (self.my_color == 'w' and not is_white_turn) or (self.my_color == 'b' and is_white_turn):
-                self.status_var.set("Wait for opponent...")
+                self.status_var.set("Computer is thinking..." if self.vs_ai else "Wait for opponent...")
                 return
             # Prevent moving opponent pieces
-            piece = self.game_state.board[r][c]
+            piece = board[r][c]
             if not self.selected_sq: # Starting selection
                  if piece == "--": return
                  # Only select my pieces
@@ -280,15 +422,18 @@ class ChessBoardFrame(customtkinter.CTkFrame):
             self.player_clicks.append(self.selected_sq)
             
         if len(self.player_clicks) == 2:
-            move = Move(self.player_clicks[0], self.player_clicks[1], self.game_state.board)
+            move = Move(self.player_clicks[0], self.player_clicks[1], board)
+            if move.promotion and move in self.valid_moves:
+                # Queen unless the player picks something else
+                move = Move(self.player_clicks[0], self.player_clicks[1], board,
+                            promotion=self.ask_promotion(move.piece_moved[0]))
             if move in self.valid_moves:
                 self.game_state.make_move(move)
                 self.play_sound(move.piece_captured != "--")
                 
                 # Send Move if Multiplayer
                 if self.is_multiplayer:
-                     uci = move.get_chess_notation()
-                     self.send_json(self.opponent_id, {"chess": "move", "u": uci})
+                     self.send_game(self.opponent_id, GameMessage(MOVE, self.game_id, move.code))
                 
                 self.valid_moves = self.game_state.get_valid_moves()
                 self.selected_sq = ()
@@ -296,13 +441,36 @@ class ChessBoardFrame(customtkinter.CTkFrame):
                 self.update_pieces()
                 
                 turn = "White" if self.game_state.white_to_move else "Black"
-                self.status_var.set(f"{turn}'s Turn")
+                self.status_var.set(self.game_over_text() or f"{turn}'s Turn")
+                
+                if self.vs_ai and not self.game_over_text():
+                    self.start_ai_search()
                 
             else:
                 self.player_clicks = [self.selected_sq]
                 
         self.highlight_squares()
 
+    def ask_promotion(self, color):
+        """Modal piece picker for a pawn reaching the last rank. Returns
+        KNIGHT..QUEEN; closing the window means a queen."""
+        choice = [QUEEN]
+        dialog = customtkinter.CTkToplevel(self)
+        dialog.title("Promote to")
+        dialog.resizable(False, False)
+        
+        def pick(ptype):
+            choice[0] = ptype
+            dialog.destroy()
+        
+        for ptype, letter in ((QUEEN, 'Q'), (ROOK, 'R'), (BISHOP, 'B'), (KNIGHT, 'N')):
+            customtkinter.CTkButton(dialog, text=self.pieces[color + letter], width=60, height=60, font=("Arial", 30),
+                                    command=lambda p=ptype: pick(p)).pack(side="left", padx=5, pady=10)
+        dialog.transient(self.winfo_toplevel())
+        dialog.after(10, dialog.grab_set) # Toplevels need to be mapped before grabbing
+        self.wait_window(dialog)
+        return choice[0]
+
     def play_sound(self, is_capture):
         sound = "Hero" if is_capture else "Tink"
         try:
@@ -2,10 +2,22 @@ import customtkinter
 import tkintermapview
 import mesh_interface
 from chess_ui import ChessBoardFrame
-import threading
 import time
+from collections import deque
 from datetime import datetime
-from mesh_interface import MeshInterface
+from mesh_interface import MeshInterface, node_num
+from gui_panels import PanelScheduler
+import mesh_positions
+
+# Messages shown per chat tab (older ones stay in the store)
+CHAT_DISPLAY_LIMIT = 200
+# How often queued radio events are handled when the queue is idle
+EVENT_POLL_MS = 50
+# Clock and panel scheduler tick
+GUI_TICK_MS = 250
+# Nodes listed (nearest first) on the Traceroute tab, and how many more
+# each "Show more" adds
+TRACE_LIST_LIMIT = 100
 
 customtkinter.set_appearance_mode("Dark")
 customtkinter.set_default_color_theme("blue")
@@ -58,7 +70,7 @@ class App(customtkinter.CTk):
         self.label_chutil.grid(row=0, column=7, padx=10, pady=10)
 
         # --- Tab View ---
-        self.tab_view = customtkinter.CTkTabview(self)
+        self.tab_view = customtkinter.CTkTabview(self, command=self.on_tab_changed)
         self.tab_view.grid(row=1, column=0, sticky="nsew", padx=20, pady=20)
         
         self.tab_view.grid(row=1, column=0, sticky="nsew", padx=20, pady=20)
@@ -80,12 +92,16 @@ class App(customtkinter.CTk):
         self.tab_messages.grid_columnconfigure(1, weight=1) # Chat area expands
         self.tab_messages.grid_rowconfigure(0, weight=1)
 
-        self.sidebar_ui_buttons = {} # key: type_id, val: widget
+        self.sidebar_ui_buttons = {} # key: (type, id), val: widget
         
         # 1. Sidebar (Channels & DMs)
         self.chat_sidebar = customtkinter.CTkScrollableFrame(self.tab_messages, width=200, corner_radius=0)
         self.chat_sidebar.grid(row=0, column=0, rowspan=2, sticky="nsew")
         
+        self.entry_search = customtkinter.CTkEntry(self.chat_sidebar, placeholder_text="Search messages...")
+        self.entry_search.pack(pady=(10, 0), padx=5, fill="x")
+        self.entry_search.bind("<Return>", self.search_messages_event)
+        
         self.lbl_channels = customtkinter.CTkLabel(self.chat_sidebar, text="CHANNELS", font=("Roboto", 12, "bold"), text_color="gray", anchor="w")
         self.lbl_channels.pack(pady=(10, 5), padx=10, fill="x")
         self.channel_buttons_frame = customtkinter.CTkFrame(self.chat_sidebar, fg_color="transparent")
@@ -106,6 +122,11 @@ class App(customtkinter.CTk):
         # Or just rely on tab name. Tab name must be unique. 
         # Let's use names like "Channel: Primary" or "DM: User"
         self.active_chat_tabs = [] 
+        # Formatting caches for chat lines: sender -> display name (dropped
+        # whenever the node list changes) and minute -> "HH:MM"
+        self.sender_names = {}
+        self.sender_names_version = None
+        self.time_labels = {}
 
         self.chat_entry_frame = customtkinter.CTkFrame(self.tab_messages, fg_color="transparent")
         self.chat_entry_frame.grid(row=1, column=1, sticky="ew", padx=10, pady=10)
@@ -188,8 +209,11 @@ class App(customtkinter.CTk):
         self.map_markers = {}
 
         # Start Update Loop
+        self.clock_text = None
+        self.setup_panels()
         self.refresh_ports()
         self.update_gui_loop()
+        self.process_mesh_events()
 
     def refresh_ports(self):
         ports = self.mesh_interface.get_available_ports()
@@ -232,8 +256,33 @@ class App(customtkinter.CTk):
     def update_gui_loop(self):
         # Update Time
         now = datetime.now().strftime("%H:%M:%S")
-        self.label_time.configure(text=f"Time: {now}")
-
+        if now != self.clock_text:
+            self.clock_text = now
+            self.label_time.configure(text=f"Time: {now}")
+
+        # Panels on the visible tab redraw when their data changed (see
+        # setup_panels); hidden ones wait until they're shown
+        self.panels.tick()
+
+        # Schedule next update - sooner while a chunked redraw is under way
+        self.after(20 if self.panels.busy() else GUI_TICK_MS, self.update_gui_loop)
+
+    def setup_panels(self):
+        self.panels = PanelScheduler(self.tab_view, self.mesh_interface.version)
+        self.panels.add('top_bar', self.update_top_bar, domains=('telemetry',))
+        self.panels.add('sidebar', self.update_sidebar, tab="Messages", domains=('chats', 'nodes', 'channels'), interval=1.0)
+        # Each chat tab checks its own conversation's version
+        self.panels.add('chat', self.update_chat_tabs, tab="Messages", max_age=0)
+        self.panels.add('trace', self.update_trace_tab, tab="Traceroute", domains=('nodes', 'traces'), interval=1.0)
+        # "Last heard" ages even when nothing arrives
+        self.panels.add('nodes', self.update_nodes_tab, tab="Nearby Nodes", domains=('nodes',), interval=1.0, max_age=5.0, max_work=50)
+        self.panels.add('map', self.update_map_tab, tab="Map", domains=('nodes',), interval=2.0, max_work=100)
+
+    def on_tab_changed(self):
+        # Catch the newly shown tab up right away
+        self.panels.tick()
+
+    def update_top_bar(self):
         # Update Node Info
         my_info = self.mesh_interface.get_my_info()
         if my_info:
@@ -259,30 +308,23 @@ class App(customtkinter.CTk):
                     if sats is not None:
                          self.label_sats.configure(text=f"Sats: {sats}")
 
-        # Update Sidebar (Channels & DMs)
-        self.update_sidebar()
-        
-        # Update current chat view (if active tab)
-        self.update_chat_tabs()
-        # self.update_chat_display() # New method uses tabs
-
-        # Update Traceroute display if active
-        self.update_trace_tab() # Split UI update
-
-
-        # Update Nodes List & Map
-        nodes = self.mesh_interface.get_nodes()
-        self.update_nodes_tab(nodes)
-        self.update_map_tab(nodes)
-
-        # Schedule next update
-        self.after(2000, self.update_gui_loop)
+    def process_mesh_events(self):
+        # Packets are queued by the radio thread and handled here, on the Tk
+        # thread, a bounded batch at a time
+        handled = self.mesh_interface.process_events()
+        busy = self.mesh_interface.events.pending() > 0
+        if handled and not busy:
+            self.panels.tick() # Show new data now, not at the next tick
+        self.after(1 if busy else EVENT_POLL_MS, self.process_mesh_events)
 
-    def update_nodes_tab(self, nodes):
+    def update_nodes_tab(self):
         # Clear existing? Or update intelligently. For simplicity, we can clear and redraw if list changes size, or just update values.
         # Let's just create rows if they don't exist.
+        # A generator: the panel scheduler runs it a few rows per tick.
+        nodes = self.mesh_interface.get_nodes()
         
         for node_id, node_data in nodes.items():
+            yield
             user = node_data.get('user', {})
             short_name = user.get('shortName', node_id)
             long_name = user.get('longName', 'Unknown')
@@ -321,8 +363,11 @@ class App(customtkinter.CTk):
                 ui['lbl_snr'].configure(text=f"SNR: {snr:.2f}")
                 ui['lbl_lh'].configure(text=f"Last Heard: {lh_str}")
 
-    def update_map_tab(self, nodes):
+    def update_map_tab(self):
+        # Generator, like update_nodes_tab
+        nodes = self.mesh_interface.get_nodes()
         for node_id, node_data in nodes.items():
+            yield
             if 'position' in node_data:
                 pos = node_data['position']
                 lat = pos.get('latitude')
@@ -360,8 +405,8 @@ class App(customtkinter.CTk):
         # Remove old buttons
         to_remove = []
         for key in self.sidebar_ui_buttons:
-            type, id = key.split('_')
-            if type == 'channel' and int(id) not in current_channel_ids:
+            type, id = key
+            if type == 'channel' and id not in current_channel_ids:
                 to_remove.append(key)
         for key in to_remove:
             self.sidebar_ui_buttons[key].destroy()
@@ -371,7 +416,7 @@ class App(customtkinter.CTk):
         for ch in channels:
             idx = ch['index']
             name = ch['name']
-            key = f"channel_{idx}"
+            key = ('channel', idx)
             
             if key not in self.sidebar_ui_buttons:
                 btn = customtkinter.CTkButton(self.channel_buttons_frame, text=f"# {name}", 
@@ -385,37 +430,28 @@ class App(customtkinter.CTk):
             # We can highlight if open? 
 
         # DMS
-        nodes = self.mesh_interface.get_nodes()
-        dm_ids = set(self.mesh_interface.chats['dms'].keys())
-        # Also include nodes that we just know about? User requested "Direct Messages list"
-        # Usually only active chats or favorites.
-        # But for now, let's list active chats + known nodes.
-        # Merging lists.
-        all_ids = dm_ids.union(set(nodes.keys()))
+        # Active chats + every node we know of, one button per node number
+        directory = self.mesh_interface.directory
+        all_ids = set(directory.nodes)
+        for key in self.mesh_interface.chats.dms:
+            num = node_num(key)
+            all_ids.add(key if num is None else num)
         
         # Remove old
         to_remove = []
         for key in self.sidebar_ui_buttons:
-            type, id_str = key.split('_', 1) # split only once
-            if type == 'dm':
-                try:
-                    nid = int(id_str) # ID is int
-                except:
-                    nid = id_str # ID is string
-                if nid not in all_ids:
-                    to_remove.append(key)
+            type, nid = key
+            if type == 'dm' and nid not in all_ids:
+                to_remove.append(key)
         for key in to_remove:
             self.sidebar_ui_buttons[key].destroy()
             del self.sidebar_ui_buttons[key]
             
         # Add new
         for nid in all_ids:
-            name = nid
-            if nid in nodes:
-                name = nodes[nid].get('user', {}).get('longName', nid)
-            
-            key = f"dm_{nid}"
+            key = ('dm', nid)
             if key not in self.sidebar_ui_buttons:
+                name = directory.long_name(nid)
                 btn = customtkinter.CTkButton(self.dm_buttons_frame, text=f"@ {name}", 
                                               fg_color="transparent", text_color=("gray10", "gray90"), anchor="w",
                                               command=lambda i=nid, n=name: self.open_chat_tab('dm', i, n))
@@ -432,10 +468,18 @@ class App(customtkinter.CTk):
         except ValueError:
             # Create it
             self.chat_tabs.add(tab_name)
+            # Older history is paged in from disk on request
+            btn_older = customtkinter.CTkButton(self.chat_tabs.tab(tab_name), text="Load older messages", height=24,
+                                                fg_color="transparent", command=lambda t=tab_name: self.load_older_messages(t))
+            btn_older.pack(fill="x", padx=5, pady=(5, 0))
             # Add Textbox inside
             txt = customtkinter.CTkTextbox(self.chat_tabs.tab(tab_name), state="disabled")
             txt.pack(expand=True, fill="both", padx=5, pady=5)
-            self.active_chat_tabs.append({'name': tab_name, 'type': type, 'id': id, 'widget': txt})
+            tab_info = {'name': tab_name, 'type': type, 'id': id, 'widget': txt,
+                        'btn_older': btn_older, 'limit': CHAT_DISPLAY_LIMIT}
+            self.active_chat_tabs.append(tab_info)
+            # Start with the latest page from last time
+            self.mesh_interface.load_older(type, id)
             
         # Switch to it
         self.chat_tabs.set(tab_name)
@@ -445,39 +489,134 @@ class App(customtkinter.CTk):
         self.update_chat_tabs(force_scroll=True)
 
     def update_chat_tabs(self, force_scroll=False):
-        # Update ALL open tabs
+        # Only the chat tab on screen is drawn; the others catch up when selected.
+        # Each tab remembers which messages it shows (absolute indexes, see
+        # chat_store) and only inserts the ones it hasn't got yet, so the cost
+        # is per new message rather than per message held, and the user's
+        # scroll position and selection survive.
+        current = self.chat_tabs.get()
         for tab_info in self.active_chat_tabs:
-            type = tab_info['type']
-            id = tab_info['id']
+            if tab_info['name'] != current:
+                continue
             widget = tab_info['widget']
-            
-            # Get messages
-            msgs = []
-            if type == 'channel':
-                msgs = self.mesh_interface.chats['channels'].get(id, [])
-            else:
-                msgs = self.mesh_interface.chats['dms'].get(id, [])
-                
-            # Render (simple full redraw for now)
-            # Optimization: check if count changed
-            
+            conv = self.mesh_interface.chats.get(tab_info['type'], tab_info['id'])
+            version = (conv.version if conv else 0, tab_info['limit'])
+            if tab_info.get('version') == version:
+                if force_scroll:
+                    widget.see("end")
+                continue # Nothing new in this conversation
+            tab_info['version'] = version
+            if conv is None:
+                continue
+
+            # Keep following new messages only if we were at the bottom
+            follow = force_scroll or widget.yview()[1] >= 0.999
+            first = max(conv.first, conv.end - tab_info['limit']) # Oldest message to show
+            shown_start, shown_end = tab_info.get('shown', (first, first))
+            lines = tab_info.setdefault('lines', deque()) # Text lines per shown message
+
             widget.configure(state="normal")
-            widget.delete("1.0", "end")
-            
-            for m in msgs:
-                 sender_name = m['from']
-                 nodes = self.mesh_interface.get_nodes()
-                 if m['is_self']:
-                     sender_name = "Me"
-                 elif m['from'] in nodes:
-                     sender_name = nodes[m['from']].get('user', {}).get('shortName', m['from'])
-                 
-                 t_str = datetime.fromtimestamp(m['time']).strftime("%H:%M")
-                 widget.insert("end", f"[{t_str}] {sender_name}: {m['text']}\n")
-                 
+            if shown_end < conv.first:
+                # Fell behind by more than the store holds - start over
+                widget.delete("1.0", "end")
+                lines.clear()
+                shown_start = shown_end = first
+            if first < shown_start:
+                # Older history was loaded: put it above what we have
+                older = [self.format_chat_line(m) for m in conv.range(first, shown_start)]
+                widget.insert("1.0", "".join(older))
+                lines.extendleft(line.count("\n") for line in reversed(older))
+                shown_start = first
+            if shown_end < conv.end:
+                newer = [self.format_chat_line(m) for m in conv.range(shown_end)]
+                widget.insert("end", "".join(newer))
+                lines.extend(line.count("\n") for line in newer)
+                shown_end = conv.end
+            if shown_start < first:
+                # Retention: drop the lines of messages past the limit
+                drop = sum(lines.popleft() for _ in range(first - shown_start))
+                widget.delete("1.0", f"{drop + 1}.0")
+                shown_start = first
             widget.configure(state="disabled")
-            if force_scroll:
-                 widget.see("end")
+            tab_info['shown'] = (shown_start, shown_end)
+            if follow:
+                widget.see("end")
+
+    def format_chat_line(self, m):
+        return f"[{self.time_label(m.time)}] {self.sender_name(m)}: {m.text}\n"
+
+    def time_label(self, when):
+        minute = int(when // 60)
+        label = self.time_labels.get(minute)
+        if label is None:
+            if len(self.time_labels) > 10000:
+                self.time_labels.clear()
+            label = self.time_labels[minute] = datetime.fromtimestamp(minute * 60).strftime("%H:%M")
+        return label
+
+    def sender_name(self, m):
+        if m.is_self:
+            return "Me"
+        version = self.mesh_interface.version('nodes')
+        if version != self.sender_names_version:
+            self.sender_names.clear()
+            self.sender_names_version = version
+        name = self.sender_names.get(m.sender)
+        if name is None:
+            name = self.sender_names[m.sender] = self.mesh_interface.directory.short_name(m.sender)
+        return name
+
+    def search_messages_event(self, event=None):
+        query = self.entry_search.get().strip()
+        if not query:
+            return
+        t0 = time.perf_counter()
+        hits = self.mesh_interface.search_messages(query)
+        elapsed = (time.perf_counter() - t0) * 1000
+        
+        # Results go in their own tab, reused for each search
+        tab_name = "🔍 Search"
+        try:
+            self.chat_tabs.tab(tab_name)
+        except ValueError:
+            self.chat_tabs.add(tab_name)
+            self.search_results = customtkinter.CTkTextbox(self.chat_tabs.tab(tab_name), state="disabled")
+            self.search_results.pack(expand=True, fill="both", padx=5, pady=5)
+        self.chat_tabs.set(tab_name)
+        
+        directory = self.mesh_interface.directory
+        channels = {ch['index']: ch['name'] for ch in self.mesh_interface.get_channels()}
+        widget = self.search_results
+        widget.configure(state="normal")
+        widget.delete("1.0", "end")
+        widget.insert("end", f"{len(hits)} results for \"{query}\" ({elapsed:.0f} ms)\n\n")
+        for kind, conv, sender, text, t, is_self in hits:
+            if kind == 'channel':
+                where = f"#{channels.get(conv, conv)}"
+            else:
+                where = f"@{directory.short_name(conv)}"
+            sender_name = "Me" if is_self else directory.short_name(sender)
+            t_str = datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M")
+            widget.insert("end", f"[{t_str}] {where} {sender_name}: {text}\n")
+        widget.configure(state="disabled")
+
+    def load_older_messages(self, tab_name):
+        for tab_info in self.active_chat_tabs:
+            if tab_info['name'] != tab_name:
+                continue
+            conv = self.mesh_interface.chats.get(tab_info['type'], tab_info['id'])
+            held = len(conv) if conv else 0
+            if tab_info['limit'] < held:
+                # Show what is already in memory first
+                tab_info['limit'] = min(tab_info['limit'] + CHAT_DISPLAY_LIMIT, held)
+                self.update_chat_tabs()
+                return
+            added = self.mesh_interface.load_older(tab_info['type'], tab_info['id'])
+            if added:
+                tab_info['limit'] = held + added
+                self.update_chat_tabs()
+            else:
+                tab_info['btn_older'].configure(text="No older messages", state="disabled")
 
     def select_chat(self, type, id, name):
         # Deprecated legacy redirect
@@ -510,6 +649,12 @@ class App(customtkinter.CTk):
         customtkinter.CTkLabel(self.frame_trace_config, text="Destination ID/Name:").pack(side="left", padx=5)
         self.entry_trace_dest = customtkinter.CTkEntry(self.frame_trace_config, width=150)
         self.entry_trace_dest.pack(side="left", padx=5)
+        self.entry_trace_dest.bind("<Return>", lambda e: self.start_trace_event())
+        
+        # Trace whatever is typed (id, name or the start of one)
+        self.btn_trace_entry = customtkinter.CTkButton(self.frame_trace_config, text="Trace", width=60,
+                                                       command=self.start_trace_event)
+        self.btn_trace_entry.pack(side="left", padx=5)
         
         self.btn_start_trace = customtkinter.CTkButton(self.frame_trace_config, text="Start Trace to Selected", 
                                                        command=self.start_trace_selected)
@@ -524,48 +669,29 @@ class App(customtkinter.CTk):
         self.trace_display.pack(expand=True, fill="both", padx=5, pady=5)
         
         self.trace_selected_node = None
+        self.trace_list_limit = TRACE_LIST_LIMIT
 
     def update_trace_tab(self):
         # 1. Update Node List (Left)
-        nodes = self.mesh_interface.get_nodes()
+        # Nearest first (vectorized, cached until someone moves - see
+        # mesh_positions), then SNR. Only the nearest page gets buttons, so
+        # thousands of nodes don't mean thousands of widgets; "Show more"
+        # adds the next page.
+        directory = self.mesh_interface.directory
         node_list = []
-        
-        # Get my position for distance calc
-        my_lat = None
-        my_lon = None
-        if self.mesh_interface.interface and hasattr(self.mesh_interface.interface, 'localNode'):
-             p = getattr(self.mesh_interface.interface.localNode, 'position', {})
-             if 'latitude' in p and 'longitude' in p:
-                  my_lat = p['latitude']
-                  my_lon = p['longitude']
-        
-        for nid, data in nodes.items():
-            user = data.get('user', {})
-            short_name = user.get('shortName', str(nid))
-            long_name = user.get('longName', f"Node {nid}")
-            snr = data.get('snr', -100)
-            
-            # Calculate Distance
-            dist = 999999999
+        total = len(self.mesh_interface.positions)
+        for nid, dist, heading, snr in self.mesh_interface.nodes_by_distance(self.trace_list_limit):
             dist_str = ""
-            if my_lat and 'position' in data:
-                 pos = data['position']
-                 if 'latitude' in pos and 'longitude' in pos:
-                      d_m = self.mesh_interface.haversine(my_lat, my_lon, pos['latitude'], pos['longitude'])
-                      dist = d_m
-                      dist_str = f"{d_m/1000:.1f}km"
-            
-            node_list.append({'id': nid, 'name': short_name, 'long': long_name, 'snr': snr, 'dist': dist, 'dist_str': dist_str})
-            
-        # Sort by Distance ASC, then SNR DESC
-        node_list.sort(key=lambda x: (x['dist'], -x['snr']))
+            if dist != float('inf'):
+                dist_str = f"{dist/1000:.1f}km {mesh_positions.compass(heading)}"
+            node_list.append({'id': nid, 'long': directory.long_name(nid), 'snr': snr, 'dist_str': dist_str})
         
         # Check if list changed (Simple hash of IDs and SNRs/Dist)
         # Or faster: just IDs? No, SNR updates matter?
         # User said "make it static, we dont have to keep refreshing".
         # Let's only update if the LIST OF IDs changes, or if manually requested?
         # Compromise: Check if the set of IDs and their order is identical.
-        current_signature = [(n['id'], n['dist_str'], n['snr']) for n in node_list]
+        current_signature = [(n['id'], n['long'], n['dist_str'], n['snr']) for n in node_list] + [total]
         
         if not hasattr(self, '_last_trace_node_sig') or self._last_trace_node_sig != current_signature:
              self._last_trace_node_sig = current_signature
@@ -584,6 +710,12 @@ class App(customtkinter.CTk):
                  btn = customtkinter.CTkButton(self.trace_nodes_frame, text=info, 
                                                command=lambda nid=n['id']: self.select_trace_node(nid))
                  btn.pack(fill="x", pady=2)
+                 
+             if total > len(node_list):
+                 btn_more = customtkinter.CTkButton(self.trace_nodes_frame, fg_color="transparent",
+                                                    text=f"Show more ({total - len(node_list)} farther nodes)",
+                                                    command=self.show_more_trace_nodes)
+                 btn_more.pack(fill="x", pady=2)
             
         # 2. Update Report (Right)
         if self.trace_selected_node:
@@ -614,15 +746,16 @@ class App(customtkinter.CTk):
                       self.trace_display.insert("end", new_text)
                  self.trace_display.configure(state="disabled")
 
+    def show_more_trace_nodes(self):
+        self.trace_list_limit += TRACE_LIST_LIMIT
+        self.update_trace_tab()
+
     def select_trace_node(self, nid):
         self.trace_selected_node = nid
+        self.panels.invalidate('trace') # Show its report on the next refresh
         
         # UI Feedback: Update Entry and Label
-        # Find name if possible
-        nodes = self.mesh_interface.get_nodes()
-        name = str(nid)
-        if nid in nodes:
-             name = nodes[nid].get('user', {}).get('shortName', str(nid))
+        name = self.mesh_interface.directory.short_name(nid)
              
         self.entry_trace_dest.delete(0, "end")
         self.entry_trace_dest.insert(0, name) # Or ID if preferred, but name is friendlier
@@ -633,8 +766,8 @@ class App(customtkinter.CTk):
 
     def start_trace_selected(self):
         if self.trace_selected_node:
-             # Thread the sending to prevent UI freeze
-             threading.Thread(target=self.mesh_interface.send_trace_route, args=(self.trace_selected_node,)).start()
+             # Queued on the interface's send thread - never blocks the UI
+             self.mesh_interface.send_trace_route(self.trace_selected_node)
              
              # UI Feedback & Countdown
              self.btn_start_trace.configure(state="disabled", text="Tracing... (30s)")
@@ -667,53 +800,29 @@ class App(customtkinter.CTk):
         if text:
             target = self.current_chat_target
             if target['type'] == 'channel':
-                self.mesh_interface.send_message(text, channelIndex=target['id'])
+                future = self.mesh_interface.send_message(text, channelIndex=target['id'])
             else:
-                self.mesh_interface.send_message(text, destinationId=target['id'])
+                future = self.mesh_interface.send_message(text, destinationId=target['id'])
+            if future.done() and future.exception():
+                print(f"Message not sent: {future.exception()}")
+                return # Leave the text in the box
                 
             self.entry_message.delete(0, "end")
-            self.update_chat_display(force_scroll=True)
+            self.update_chat_tabs(force_scroll=True)
 
     def start_trace_event(self):
         target = self.entry_trace_dest.get()
         if not target:
             return
             
-        # If user entered a name, try to resolve to ID
-        nodes = self.mesh_interface.get_nodes()
-        target_id = None
-        
-        # Try as int
-        try:
-            target_id = int(target) # e.g. !1234
-        except:
-             # Try as name
-             for nid, data in nodes.items():
-                 user = data.get('user', {})
-                 if user.get('longName') == target or user.get('shortName') == target:
-                     target_id = nid
-                     break
-        
-        # If still not found, assumes it might be ID string like '!1234' which python can't int() directly
-        # Actually meshtastic uses numeric IDs internally mostly but '!' notation is common string rep.
-        # Let's just pass whatever we found or string.
-        # If target_id is None, maybe use target string directly if it starts with '!'?
-        
-        if not target_id:
-            # Simple check if looks like ID
-            if target.startswith('!'):
-                 # Convert hex to int? Or just assume it's lost and pass as is?
-                 # Assuming meshtastic serial interface might handle it?
-                 target_id = target # Interface usually expects Number.
-                 # Let's warn if not resolved.
-            else:
-                # Could be a raw number entered as string
-                try:
-                    target_id = int(target)
-                except:
-                     pass
-
-        if target_id:
+        # An id (!1234abcd or number), a short or long name, or the start of one
+        target_id = self.mesh_interface.directory.resolve(target)
+
+        if target_id is not None:
+            # Select it too, so its route shows up in the report
+            self.trace_selected_node = target_id
+            self.panels.invalidate('trace')
+            self.lbl_trace_status.configure(text=f"Target: {self.mesh_interface.directory.short_name(target_id)}")
             self.trace_display.configure(state="normal")
             self.trace_display.insert("end", f"Sending trace to {target} ({target_id})...\n")
             self.trace_display.configure(state="disabled")
@@ -723,6 +832,7 @@ class App(customtkinter.CTk):
             # Or just update display periodically.
             # Ideally we have a 'trace_in_progress' state.
         else:
+             self.lbl_trace_status.configure(text=f"No node matches \"{target}\"")
              print("Could not resolve node for trace")
 
     def update_channel_settings_tab(self):
@@ -795,6 +905,7 @@ class App(customtkinter.CTk):
 
 
     def on_closing(self):
+        self.chess_frame.close()
         self.mesh_interface.close()
         self.destroy()
 
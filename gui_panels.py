@@ -0,0 +1,87 @@
+"""Refresh scheduling for the GUI's panels.
+
+Each panel says which main tab it lives on (None = always visible), which
+MeshInterface data domains it draws (see MeshInterface.versions) and how
+often it may redraw. A panel on a hidden tab is skipped entirely and
+catches up the moment its tab is shown.
+
+refresh() may be a plain function or a generator that yields after each
+unit of work (a node row, a map marker); a generator is advanced at most
+max_work steps per tick and resumed on the next one, so one big redraw
+can't freeze a frame.
+"""
+import time
+import types
+
+
+class Panel:
+    __slots__ = ('name', 'refresh', 'tab', 'domains', 'interval', 'max_age', 'max_work',
+                 'drawn', 'last_run', 'work')
+
+    def __init__(self, name, refresh, tab, domains, interval, max_age, max_work):
+        self.name = name
+        self.refresh = refresh
+        self.tab = tab
+        self.domains = domains
+        self.interval = interval # Min seconds between redraws
+        self.max_age = max_age # Redraw this often even without changes (None = never)
+        self.max_work = max_work # Generator steps per tick
+        self.drawn = None # Data versions last drawn
+        self.last_run = -float('inf')
+        self.work = None # Generator of a redraw in progress
+
+
+class PanelScheduler:
+    def __init__(self, tab_view, versions, clock=time.monotonic):
+        """versions(*domains) -> hashable version of that data (MeshInterface.version)."""
+        self.tab_view = tab_view
+        self.versions = versions
+        self.clock = clock
+        self.panels = []
+
+    def add(self, name, refresh, tab=None, domains=(), interval=0.0, max_age=None, max_work=50):
+        self.panels.append(Panel(name, refresh, tab, domains, interval, max_age, max_work))
+
+    def invalidate(self, name):
+        """Redraw this panel on its next tick, changed or not."""
+        for panel in self.panels:
+            if panel.name == name:
+                panel.drawn = None
+
+    def tick(self):
+        now = self.clock()
+        visible = self.tab_view.get()
+        for panel in self.panels:
+            if panel.tab is not None and panel.tab != visible:
+                continue # Caught up when shown
+            if panel.work is None:
+                version = self.versions(*panel.domains) if panel.domains else None
+                stale = version != panel.drawn or (panel.max_age is not None and now - panel.last_run >= panel.max_age)
+                if not stale or now - panel.last_run < panel.interval:
+                    continue
+                panel.drawn = version
+                panel.last_run = now
+                try:
+                    result = panel.refresh()
+                except Exception as e:
+                    print(f"Refreshing {panel.name} failed: {e}")
+                    continue
+                if not isinstance(result, types.GeneratorType):
+                    continue
+                panel.work = result
+            self._advance(panel)
+
+    def _advance(self, panel):
+        try:
+            for _ in range(panel.max_work):
+                next(panel.work)
+        except StopIteration:
+            panel.work = None
+        except Exception as e:
+            print(f"Refreshing {panel.name} failed: {e}")
+            panel.work = None
+
+    def busy(self):
+        """True while some visible panel has a redraw in progress."""
+        visible = self.tab_view.get()
+        return any(panel.work is not None and panel.tab in (None, visible) for panel in self.panels)
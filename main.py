@@ -1,9 +1,23 @@
+import argparse
+import multiprocessing
 from gui import App
 
 if __name__ == "__main__":
+    # Frozen builds need this so the chess search worker process can start
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Meshtastic Desktop Node")
+    parser.add_argument("--capture", metavar="FILE", help="Record received packets to FILE (see mesh_capture)")
+    parser.add_argument("--replay", metavar="FILE", help="Play a capture instead of connecting to a radio")
+    parser.add_argument("--speed", default="1", help="Replay speed: 1, 10, ... or max")
+    args = parser.parse_args()
     try:
         app = App()
         app.protocol("WM_DELETE_WINDOW", app.on_closing)
+        if args.capture:
+            app.mesh_interface.start_capture(args.capture)
+        if args.replay:
+            app.var_port.set(f"replay:{args.replay}@{args.speed}")
+            app.toggle_connection()
         app.mainloop()
     except KeyboardInterrupt:
         print("Exiting...")
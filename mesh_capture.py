@@ -0,0 +1,219 @@
+"""Packet capture to a file, and replay of captures in place of a radio.
+
+A capture is an append-only file: a magic header, then records of
+
+    byte 0     record type (PACKET, NODE, SNAPSHOT)
+    bytes 1-8  wall clock time (big endian double)
+    bytes 9-12 length n
+    bytes 13.. the value as UTF-8 JSON (n bytes)
+
+PACKET is a received packet dict as pubsub handed it to us (minus the
+protobuf 'raw' field), NODE a node info update and SNAPSHOT the node list,
+our own node and the channels at connect time. Values are plain JSON
+(bytes become {"$b": base64}), so reading a capture never runs code and
+works across Python versions.
+
+ReplayInterface stands in for meshtastic's SerialInterface: it publishes
+the captured packets on the same pubsub topics at the recorded pace, N
+times faster, or as fast as possible, and swallows sends. MeshInterface
+uses it for ports named "replay:<file>[@speed]" (speed 1, 10, ... or max).
+
+    python main.py --capture session.meshcap
+    python main.py --replay session.meshcap --speed 10
+    python mesh_capture.py info session.meshcap
+"""
+import argparse
+import base64
+import json
+import struct
+import threading
+import time
+from types import SimpleNamespace
+
+from pubsub import pub
+
+MAGIC = b"MESHCAP\x02" # \x01 was the old marshal format
+PACKET = 1
+NODE = 2
+SNAPSHOT = 3
+
+_RECORD = struct.Struct(">BdI")
+
+
+def _plain(value):
+    """Packet dict -> something JSON can store (protobuf objects become
+    their string form, bytes a {"$b": base64} object; 'raw' duplicates
+    the rest and is dropped)."""
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items() if k != 'raw'}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, bytes):
+        return {"$b": base64.b64encode(value).decode('ascii')}
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
+
+
+def _unplain(obj):
+    # json object_hook: undo the bytes wrapping of _plain
+    if len(obj) == 1 and "$b" in obj:
+        return base64.b64decode(obj["$b"])
+    return obj
+
+
+class CaptureWriter:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def write(self, kind, value, when=None):
+        data = json.dumps(_plain(value), separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(_RECORD.pack(kind, time.time() if when is None else when, len(data)))
+            self._file.write(data)
+            self._file.flush() # A crash should keep everything up to the bug
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path):
+    """Yield (kind, time, value) for each record; stops quietly at a
+    truncated tail (capture killed mid-write)."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a packet capture")
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            kind, when, n = _RECORD.unpack(head)
+            data = f.read(n)
+            if len(data) < n:
+                return
+            yield kind, when, json.loads(data, object_hook=_unplain)
+
+
+def parse_replay_port(port):
+    """'replay:file.meshcap@10' -> ('file.meshcap', 10.0); speed 0 = max."""
+    spec = port[len("replay:"):]
+    path, _, speed = spec.rpartition("@")
+    if not path or not (speed == "max" or speed.replace(".", "", 1).isdigit()):
+        return spec, 1.0
+    return path, 0.0 if speed == "max" else float(speed)
+
+
+class _LocalNode:
+    def __init__(self, channels):
+        # Same attribute shape MeshInterface.get_channels reads off the protobufs
+        self.channels = [SimpleNamespace(index=c['index'], role=c['role'],
+                                         settings=SimpleNamespace(name=c['name'], uplink_enabled=c.get('uplink', True),
+                                                                  downlink_enabled=c.get('downlink', True)))
+                         for c in channels]
+
+
+class ReplayInterface:
+    """Enough of meshtastic.mesh_interface.MeshInterface for our app."""
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self.nodes = {}
+        self.myInfo = None
+        self._my_node = {}
+        self.localNode = _LocalNode([])
+        self.sent = [] # (portNum, destinationId, data) of everything we were asked to send
+        self.replayed = 0
+        self._stop = threading.Event()
+        # The snapshot comes first in a capture - take it now so the node
+        # list is there as soon as connect() returns
+        for kind, _, value in read_capture(path):
+            if kind == SNAPSHOT:
+                self._apply_snapshot(value)
+            break
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _apply_snapshot(self, value):
+        self.nodes = dict(value.get('nodes') or {})
+        self._my_node = value.get('my_node') or {}
+        self.localNode = _LocalNode(value.get('channels') or [])
+
+    def getMyNodeInfo(self):
+        return self._my_node
+
+    def sendData(self, data, destinationId="^all", portNum=None, wantAck=False, wantResponse=False,
+                 onResponse=None, channelIndex=0, hopLimit=None, **kwargs):
+        self.sent.append((portNum, destinationId, data))
+        return SimpleNamespace(id=len(self.sent))
+
+    def sendText(self, text, destinationId="^all", channelIndex=0, **kwargs):
+        return self.sendData(text.encode('utf-8'), destinationId, channelIndex=channelIndex)
+
+    def onResponseTraceRoute(self, packet):
+        pass
+
+    def close(self):
+        self._stop.set()
+
+    def _run(self):
+        pub.sendMessage("meshtastic.connection.established", interface=self)
+        start = time.monotonic()
+        first = None
+        for kind, when, value in read_capture(self.path):
+            if self._stop.is_set():
+                return
+            if first is None:
+                first = when
+            if self.speed > 0:
+                delay = (when - first) / self.speed - (time.monotonic() - start)
+                if delay > 0 and self._stop.wait(delay):
+                    return
+            if kind == PACKET:
+                self.replayed += 1
+                pub.sendMessage("meshtastic.receive", packet=value, interface=self)
+            elif kind == NODE:
+                node_id = value.get('user', {}).get('id')
+                if node_id:
+                    self.nodes[node_id] = value
+                pub.sendMessage("meshtastic.node.updated", node=value, interface=self)
+            elif kind == SNAPSHOT:
+                self._apply_snapshot(value)
+        print(f"Replay of {self.path} finished: {self.replayed} packets in {time.monotonic() - start:.1f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Packet capture tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="Summarise a capture file")
+    info.add_argument("path")
+    args = parser.parse_args(argv)
+
+    ports = {}
+    counts = {PACKET: 0, NODE: 0, SNAPSHOT: 0}
+    first = last = None
+    for kind, when, value in read_capture(args.path):
+        counts[kind] = counts.get(kind, 0) + 1
+        first = when if first is None else first
+        last = when
+        if kind == PACKET:
+            port = value.get('decoded', {}).get('portnum', 'encrypted')
+            ports[port] = ports.get(port, 0) + 1
+    span = (last - first) if first is not None else 0
+    print(f"{counts[PACKET]} packets, {counts[NODE]} node updates, {counts[SNAPSHOT]} snapshots over {span:.0f} s")
+    for port, n in sorted(ports.items(), key=lambda kv: -kv[1]):
+        print(f"  {port}: {n}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
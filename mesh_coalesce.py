@@ -0,0 +1,166 @@
+"""Coalescing of small outbound payloads.
+
+Small packets to the same destination (a move and the ack for the
+opponent's last move, a few quick chat lines) are held for up to `window`
+seconds and sent as one bundle on BUNDLE_PORTNUM:
+
+    byte 0   bundle version
+    then per record:
+      bytes 0-1  portnum the record belongs to (big endian)
+      byte  2    length n
+      bytes 3..  payload (n bytes)
+
+A bundle is flushed when its window expires or when the next record would
+not fit, so the added latency is at most `window`. A batch that ends up
+holding a single record goes out as a normal packet on its own port. The
+receiver unpacks bundles and handles each record as if it had arrived on
+its own (MeshInterface._on_bundle).
+"""
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+# Next to the chess port, in the private range
+BUNDLE_PORTNUM = 301
+BUNDLE_VERSION = 1
+
+COALESCE_WINDOW = 0.3 # seconds
+MAX_BUNDLE = 200 # bytes; Meshtastic payloads top out around 233
+MAX_RECORD = 64 # Bigger payloads skip coalescing
+
+_RECORD = struct.Struct(">HB")
+
+
+def pack(records):
+    """[(portnum, payload), ...] -> bundle bytes"""
+    out = bytearray([BUNDLE_VERSION])
+    for portnum, payload in records:
+        out += _RECORD.pack(portnum, len(payload))
+        out += payload
+    return bytes(out)
+
+
+def unpack(data):
+    """bundle bytes -> [(portnum, payload), ...]; [] if malformed"""
+    if not data or data[0] != BUNDLE_VERSION:
+        return []
+    records = []
+    pos = 1
+    while pos + _RECORD.size <= len(data):
+        portnum, n = _RECORD.unpack_from(data, pos)
+        pos += _RECORD.size
+        if pos + n > len(data):
+            return [] # Truncated - drop the lot rather than guess
+        records.append((portnum, data[pos:pos + n]))
+        pos += n
+    return records
+
+
+class _Batch:
+    __slots__ = ('records', 'futures', 'size', 'priority', 'deadline')
+
+    def __init__(self, deadline):
+        self.records = []
+        self.futures = []
+        self.size = 1 # Version byte
+        self.priority = None
+        self.deadline = deadline
+
+
+class Coalescer:
+    """send_single(destination, portnum, payload, channel, priority) and
+    send_bundle(destination, data, channel, priority) do the real sends
+    (both return Futures); add() returns a Future per record that follows
+    the packet it ended up in."""
+
+    def __init__(self, send_single, send_bundle, window=COALESCE_WINDOW, clock=time.monotonic):
+        self.send_single = send_single
+        self.send_bundle = send_bundle
+        self.window = window
+        self.clock = clock
+        self.batches = {} # (destination, channel) -> _Batch
+        self.bundles_sent = 0
+        self.records_sent = 0
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def accepts(self, payload):
+        return self.window > 0 and len(payload) <= MAX_RECORD
+
+    def add(self, destination, portnum, payload, channel=0, priority=0):
+        future = Future()
+        key = (destination, channel)
+        full = None
+        with self._cond:
+            batch = self.batches.get(key)
+            if batch and batch.size + _RECORD.size + len(payload) > MAX_BUNDLE:
+                full = self.batches.pop(key) # Send what we have, start over
+                batch = None
+            if batch is None:
+                batch = self.batches[key] = _Batch(self.clock() + self.window)
+                self._cond.notify()
+            batch.records.append((portnum, payload))
+            batch.futures.append(future)
+            batch.size += _RECORD.size + len(payload)
+            batch.priority = priority if batch.priority is None else min(batch.priority, priority)
+        if full:
+            self._flush(key, full)
+        return future
+
+    def flush(self, destination, channel=0):
+        """Send anything held for destination now - call before a packet
+        that skips coalescing so it can't overtake earlier ones."""
+        with self._cond:
+            batch = self.batches.pop((destination, channel), None)
+        if batch:
+            self._flush((destination, channel), batch)
+
+    def flush_all(self):
+        with self._cond:
+            batches = list(self.batches.items())
+            self.batches.clear()
+        for key, batch in batches:
+            self._flush(key, batch)
+
+    def close(self):
+        self.flush_all()
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _flush(self, key, batch):
+        destination, channel = key
+        if len(batch.records) == 1:
+            portnum, payload = batch.records[0]
+            sent = self.send_single(destination, portnum, payload, channel, batch.priority)
+        else:
+            sent = self.send_bundle(destination, pack(batch.records), channel, batch.priority)
+            self.bundles_sent += 1
+        self.records_sent += len(batch.records)
+
+        def done(f, futures=batch.futures):
+            for future in futures:
+                if f.exception():
+                    future.set_exception(f.exception())
+                else:
+                    future.set_result(f.result())
+        sent.add_done_callback(done)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = self.clock()
+                due = [(k, b) for k, b in self.batches.items() if b.deadline <= now]
+                for key, _ in due:
+                    del self.batches[key]
+                if not due:
+                    wake = min((b.deadline for b in self.batches.values()), default=None)
+                    self._cond.wait(None if wake is None else wake - now)
+                    continue
+            for key, batch in due:
+                self._flush(key, batch)
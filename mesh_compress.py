@@ -0,0 +1,191 @@
+"""Preset-dictionary compression for text messages.
+
+A compressed payload is one marker byte followed by raw deflate data primed
+with DICTIONARY:
+
+    byte 0   MARKER (0xFF - never appears in UTF-8, so plain text can't be
+             mistaken for it)
+    bytes 1.. deflate stream (zlib, no header, zdict=DICTIONARY)
+
+Short chat lines barely compress on their own - deflate has nothing to back-
+reference - so the dictionary carries the words and phrases mesh chat is
+made of. Both ends must use the exact same bytes: changing DICTIONARY means
+a new marker (0xFE is the next free one), not an edit in place.
+
+compress_text() only uses the compressed form when it is actually smaller.
+Receivers without this module see the marker as undecodable text, so
+sending compressed is opt-in (MeshInterface.compress_text) except for
+messages too long to go out as one plain packet at all.
+
+    python mesh_compress.py [--corpus messages.txt]   # ratio / CPU benchmark
+"""
+import argparse
+import time
+import zlib
+
+MARKER = 0xFF
+
+# Meshtastic's Data payload limit (DATA_PAYLOAD_LEN)
+MAX_PAYLOAD = 233
+# Cap on decompressed size, so a bad packet can't balloon. Has to cover
+# the longest text we send: MeshInterface.send_message refuses anything
+# bigger, and a whole fragmented message (mesh_fragment.MAX_MESSAGE, 16 KB)
+# must decompress within it.
+MAX_TEXT_BYTES = 64 * 1024
+
+# Rarest first: deflate reaches the end of the dictionary most cheaply.
+DICTIONARY = (
+    b"battery voltage channel utilization airtime firmware update rebroadcast "
+    b"router client repeater antenna gain elevation coverage tower ridge summit "
+    b"solar panel enclosure weatherproof LongFast MediumSlow ShortFast "
+    b"traceroute telemetry position GPS satellites altitude "
+    b"frequency preset region EU868 US915 "
+    b"castle queen bishop knight rook pawn checkmate stalemate resign draw "
+    b"rematch your move my move good game well played "
+    b"Anyone hear me? Anyone out there? Can you hear me? Copy that. "
+    b"Roger that. Signal report please. Radio check. "
+    b"Testing, testing. This is a test message. "
+    b"Good morning everyone! Good evening everyone! Good night all. "
+    b"How far away are you? How many hops? What's your location? "
+    b"I'm heading home now. I'll be there in about 10 minutes. "
+    b"On my way back to the car. Meet at the trailhead. "
+    b"See you tomorrow. Talk to you later. Thanks for the help! "
+    b"Welcome to the mesh! New node online. Just set up a new node. "
+    b"I can see your node on the map. Node is back online. "
+    b"The signal is weak here. Getting a good signal now. "
+    b"SNR RSSI hops away received from message packet node mesh "
+    b"about around where what when which would should could there their "
+    b"thanks thank you please sorry okay yes no maybe today tonight "
+    b"tomorrow later minutes hours miles km meters north south east west "
+    b" the and that this with have from your you are for not but was "
+    b" is it in to of on at be we me my so if do up it's I'm "
+)
+
+
+def compress(data):
+    c = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, DICTIONARY)
+    return bytes([MARKER]) + c.compress(data) + c.flush()
+
+
+def decompress(data):
+    """Marker-prefixed payload -> original bytes. Raises ValueError if the
+    payload is not ours or is damaged."""
+    if not data or data[0] != MARKER:
+        raise ValueError("Not a compressed payload")
+    d = zlib.decompressobj(-15, DICTIONARY)
+    try:
+        out = d.decompress(data[1:], MAX_TEXT_BYTES)
+    except zlib.error as e:
+        raise ValueError(f"Bad compressed payload: {e}")
+    if d.unconsumed_tail:
+        raise ValueError("Compressed payload too large")
+    return out
+
+
+def compress_text(text):
+    """Bytes for the smaller of plain UTF-8 and compressed, and whether it
+    was compressed."""
+    plain = text.encode('utf-8')
+    packed = compress(plain)
+    if len(packed) < len(plain):
+        return packed, True
+    return plain, False
+
+
+def decode_text(payload):
+    """Text from a received payload, compressed or not."""
+    if payload[:1] == bytes([MARKER]):
+        try:
+            payload = decompress(payload)
+        except ValueError as e:
+            print(f"Dropping compressed text: {e}")
+            return ""
+    return payload.decode('utf-8', 'replace')
+
+
+# Made-up but typical traffic; deliberately not lifted from DICTIONARY
+SAMPLE_CORPUS = [
+    "hi",
+    "ok",
+    "Anyone on tonight?",
+    "Good morning from the north side",
+    "hearing you 3 hops away, SNR -7",
+    "Can anyone hear me from the valley?",
+    "Copy, loud and clear",
+    "Battery at 40%, going to swap it soon",
+    "My node is on the roof now, should cover the whole street",
+    "What preset are you using? I'm on LongFast",
+    "Just got the new antenna up, let me know if the signal improved",
+    "Heading out for a hike, will be checking in from the summit around noon",
+    "Traceroute to your node goes through the repeater on the ridge",
+    "Thanks for setting up the solar node, coverage is way better now",
+    "Is the router at the library still online? I haven't seen it in a couple of hours",
+    "good game! rematch?",
+    "your move",
+    "nice queen sacrifice, didn't see that coming",
+    "Sorry, had to step away. Back now",
+    "Meet at the trailhead at 9, bring water",
+    "I'll be there in 15 minutes",
+    "Position shows you about 12 km east of me",
+    "Welcome! You're the 20th node on the map",
+    "Testing the new firmware, so far no problems with the update",
+    "Weather is turning, the ridge node might go quiet if the sun doesn't come out tomorrow",
+    "Please don't rebroadcast on the secondary channel, it's for the club only",
+    "Received your message with RSSI -112, that's about the edge of range here",
+    "Is anyone around the harbor? Looking for a signal report from down there, thanks in advance",
+    ("Long update for the group: the tower node is back after the storm, the repeater on the hill needs "
+     "a new enclosure, and we are planning a meetup next Saturday to install two more nodes so the mesh "
+     "reaches the other side of the river. Let me know if you can help or have spare parts."),
+]
+
+
+def benchmark(messages, repeat=200):
+    """Per-message size and timing for plain, deflate and deflate+dictionary."""
+    raw = [m.encode('utf-8') for m in messages]
+
+    def deflate_only(data):
+        c = zlib.compressobj(9, zlib.DEFLATED, -15)
+        return c.compress(data) + c.flush()
+
+    plain = sum(len(r) for r in raw)
+    rows = [("plain", plain, plain, 0.0, 0.0)]
+    no_dict = [deflate_only(r) for r in raw]
+    rows.append(("deflate", sum(len(c) + 1 for c in no_dict), sum(min(len(c) + 1, len(r)) for c, r in zip(no_dict, raw)), _time(deflate_only, raw, repeat), None))
+    packed = [compress(r) for r in raw]
+    assert [decompress(p) for p in packed] == raw
+    rows.append(("deflate+dict", sum(len(p) for p in packed), sum(min(len(p), len(r)) for p, r in zip(packed, raw)),
+                 _time(compress, raw, repeat), _time(decompress, packed, repeat)))
+    return rows
+
+
+def _time(fn, items, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            fn(item)
+    return (time.perf_counter() - t0) / (repeat * len(items))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark text compression on a message corpus")
+    parser.add_argument("--corpus", help="File with one message per line (default: built-in sample)")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    messages = SAMPLE_CORPUS
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as f:
+            messages = [line.rstrip('\n') for line in f if line.strip()]
+
+    plain = sum(len(m.encode('utf-8')) for m in messages)
+    print(f"{len(messages)} messages, {plain} bytes, dictionary {len(DICTIONARY)} bytes")
+    print(f"{'method':<14}{'always':>9}{'ratio':>8}{'if smaller':>12}{'ratio':>8}{'compress':>12}{'decompress':>12}")
+    for name, always, best, t_comp, t_decomp in benchmark(messages, args.repeat):
+        comp = f"{t_comp * 1e6:.1f} us" if t_comp else "-"
+        decomp = f"{t_decomp * 1e6:.1f} us" if t_decomp else "-"
+        print(f"{name:<14}{always:>9}{always / plain:>8.2f}{best:>12}{best / plain:>8.2f}{comp:>12}{decomp:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
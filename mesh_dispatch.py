@@ -0,0 +1,124 @@
+"""Incoming packet dispatch by portnum.
+
+Handlers register for a portnum and get a Packet view; ports nobody
+registered for cost one dict lookup and nothing else. Handler time is
+accumulated per handler so a slow one shows up in report().
+
+Meshtastic hands us known ports by enum name ('TEXT_MESSAGE_APP') and
+private ones as plain numbers, so each handler is filed under both forms
+and the hot path never has to normalise.
+"""
+import time
+
+from meshtastic.protobuf import portnums_pb2
+
+import mesh_compress
+
+BROADCAST_NUM = 0xFFFFFFFF
+
+
+def _port_keys(portnum):
+    keys = [portnum]
+    try:
+        keys.append(portnums_pb2.PortNum.Name(portnum))
+    except ValueError:
+        pass # Private port - only ever seen as a number
+    return keys
+
+
+class Packet:
+    """A received packet. Fields are pulled from the meshtastic dict (and
+    text decoded) only when a handler asks for them."""
+    __slots__ = ('raw', '_text')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._text = None
+
+    @property
+    def decoded(self):
+        return self.raw['decoded']
+
+    @property
+    def sender(self):
+        return self.raw.get('from')
+
+    @property
+    def to(self):
+        return self.raw.get('to')
+
+    @property
+    def is_broadcast(self):
+        return self.raw.get('to') == BROADCAST_NUM
+
+    @property
+    def channel(self):
+        return self.raw.get('channel', 0)
+
+    @property
+    def rx_time(self):
+        return self.raw.get('rxTime', time.time())
+
+    @property
+    def payload(self):
+        return self.raw['decoded'].get('payload', b'')
+
+    @property
+    def text(self):
+        if self._text is None:
+            decoded = self.raw['decoded']
+            text = decoded.get('text')
+            if text is None:
+                # Not valid UTF-8 - compressed, or just garbage
+                text = mesh_compress.decode_text(decoded.get('payload', b''))
+            self._text = text
+        return self._text
+
+
+class Dispatcher:
+    def __init__(self):
+        self.handlers = {} # portnum (int and name) -> [(handler, stat), ...]
+        self.stats = {} # handler name -> [calls, seconds]
+
+    def register(self, portnum, handler):
+        stat = self.stats.setdefault(_name(handler), [0, 0.0])
+        for key in _port_keys(portnum):
+            self.handlers.setdefault(key, []).append((handler, stat))
+
+    def unregister(self, portnum, handler):
+        for key in _port_keys(portnum):
+            handlers = [h for h in self.handlers.get(key, []) if h[0] != handler]
+            if handlers:
+                self.handlers[key] = handlers
+            else:
+                self.handlers.pop(key, None)
+
+    def dispatch(self, raw):
+        decoded = raw.get('decoded')
+        if decoded is None:
+            return # Encrypted for someone else
+        handlers = self.handlers.get(decoded.get('portnum'))
+        if not handlers:
+            return
+        packet = Packet(raw)
+        for handler, stat in handlers:
+            t0 = time.perf_counter()
+            try:
+                handler(packet)
+            except Exception as e:
+                print(f"Packet handler {_name(handler)} failed: {e}")
+            stat[0] += 1
+            stat[1] += time.perf_counter() - t0
+
+    def report(self):
+        """Lines of 'handler: calls, total ms, avg ms', slowest total first."""
+        lines = []
+        for name, (calls, seconds) in sorted(self.stats.items(), key=lambda kv: -kv[1][1]):
+            if not calls:
+                continue
+            lines.append(f"{name}: {calls} calls, {seconds * 1000:.1f} ms total, {seconds * 1000 / calls:.3f} ms avg")
+        return lines
+
+
+def _name(handler):
+    return getattr(handler, '__qualname__', repr(handler))
@@ -0,0 +1,61 @@
+"""Handoff from background threads to the Tk main loop.
+
+The meshtastic reader thread (and our own worker threads) must not touch
+app state or Tk widgets. They post events here instead - a tuple of
+(kind, args) they don't touch again, so the library's packet and node
+dicts go in as snapshot() copies - and the Tk thread drains the queue
+from an `after` loop, handling at most max_events or `budget` seconds'
+worth per call so a burst of traffic can't stall a frame.
+"""
+import queue
+import time
+
+PACKET = 1 # (packet dict,)
+NODE_UPDATED = 2 # (node dict,)
+CALL = 3 # (fn, args)
+
+MAX_BATCH = 200
+FRAME_BUDGET = 0.02 # seconds of event handling per drain
+
+
+def snapshot(value):
+    """Copy of a packet or node dict down to its second level ('decoded',
+    'user', 'position', ...), which is as deep as the library edits them."""
+    return {k: dict(v) if isinstance(v, dict) else v for k, v in value.items()}
+
+
+class EventQueue:
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self.handled = 0
+
+    def post(self, kind, *args):
+        """Any thread."""
+        self._queue.put((kind, args))
+
+    def call_soon(self, fn, *args):
+        """Run fn(*args) on the thread that drains the queue."""
+        self._queue.put((CALL, (fn, args)))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def drain(self, handle, max_events=MAX_BATCH, budget=FRAME_BUDGET):
+        """handle(kind, args) for queued events until the queue is empty or
+        a limit is hit. Returns how many were handled."""
+        deadline = time.perf_counter() + budget
+        n = 0
+        while n < max_events:
+            try:
+                kind, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                handle(kind, args)
+            except Exception as e:
+                print(f"Event {kind} failed: {e}")
+            n += 1
+            if time.perf_counter() > deadline:
+                break
+        self.handled += n
+        return n
@@ -0,0 +1,293 @@
+"""Fragmentation and reassembly for payloads bigger than one packet.
+
+A large payload for some app port is split into numbered fragments sent on
+FRAGMENT_PORTNUM:
+
+    byte 0     version
+    byte 1     DATA or REQUEST
+    bytes 2-3  message id (per sender)
+    DATA:      bytes 4-5  portnum of the whole message
+               byte  6    fragment index
+               byte  7    fragment count
+               bytes 8..  chunk
+    REQUEST:   bytes 4..  bitmap of fragments still missing (bit i = byte
+                          i // 8, bit i % 8); empty means "got it all"
+
+The receiver fills a fixed list of slots per message, so reassembly is
+O(fragments), and hands the joined payload up as if it had arrived on its
+own port. When fragments stop arriving for GAP_TIMEOUT it asks the sender
+for just the missing ones (up to MAX_REQUESTS times) and otherwise drops
+the message after REASSEMBLY_TIMEOUT. Partial buffers are capped in count
+and bytes; the oldest is dropped to make room.
+
+The sender keeps what it sent for KEEP_SENT so it can answer requests, or
+until a DM's receiver reports it complete.
+"""
+import random
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+from mesh_scheduler import PRIORITY_CONTROL
+
+# After chess (300) and bundles (301)
+FRAGMENT_PORTNUM = 302
+FRAGMENT_VERSION = 1
+
+DATA = 1
+REQUEST = 2
+
+_HEADER = struct.Struct(">BBH")
+_DATA = struct.Struct(">HBB")
+
+CHUNK_SIZE = 180 # Payload bytes per fragment; stays well under the 233 limit
+MAX_FRAGMENTS = 255
+MAX_MESSAGE = 16 * 1024
+
+# Fragments go out at bulk priority and get paced by the airtime budget, so
+# on a slow preset they can be 15 s or more apart
+GAP_TIMEOUT = 60.0
+MAX_REQUESTS = 3
+REASSEMBLY_TIMEOUT = 600.0
+KEEP_SENT = 600.0
+
+MAX_PARTIALS = 16
+MAX_BUFFERED = 64 * 1024 # Bytes held across all partial messages
+MAX_COMPLETED = 256 # Remembered message ids, to drop late duplicates
+
+
+def split(msg_id, portnum, data, size=CHUNK_SIZE):
+    """Payload -> list of DATA packets"""
+    count = max(1, -(-len(data) // size))
+    if count > MAX_FRAGMENTS or len(data) > MAX_MESSAGE:
+        raise ValueError(f"Payload too large to fragment ({len(data)} bytes)")
+    head = _HEADER.pack(FRAGMENT_VERSION, DATA, msg_id)
+    return [head + _DATA.pack(portnum, i, count) + data[i * size:(i + 1) * size] for i in range(count)]
+
+
+def request(msg_id, missing):
+    bitmap = bytearray()
+    for i in missing:
+        while len(bitmap) <= i // 8:
+            bitmap.append(0)
+        bitmap[i // 8] |= 1 << (i % 8)
+    return _HEADER.pack(FRAGMENT_VERSION, REQUEST, msg_id) + bytes(bitmap)
+
+
+class _Partial:
+    __slots__ = ('sender', 'portnum', 'parts', 'have', 'size', 'first_seen', 'last_seen', 'requests', 'broadcast', 'context')
+
+    def __init__(self, sender, portnum, count, now, broadcast):
+        self.sender = sender # As the radio gave it, to send requests back
+        self.portnum = portnum
+        self.parts = [None] * count
+        self.have = 0
+        self.size = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.requests = 0
+        self.broadcast = broadcast
+        self.context = None
+
+    def missing(self):
+        return [i for i, part in enumerate(self.parts) if part is None]
+
+
+class _Sent:
+    __slots__ = ('destination', 'channel', 'priority', 'fragments', 'time')
+
+    def __init__(self, destination, channel, priority, fragments, now):
+        self.destination = destination
+        self.channel = channel
+        self.priority = priority
+        self.fragments = fragments
+        self.time = now
+
+
+class Fragmenter:
+    """send_fragment(destination, data, channel, priority) puts one packet
+    on FRAGMENT_PORTNUM (destination None = broadcast) and returns a Future;
+    deliver(portnum, data, context) gets each reassembled message, where
+    context is whatever was passed to receive() with its last fragment.
+
+    peer_key(node) -> comparable node id, so a request from the integer
+    sender of a packet matches a DM we addressed as '!deadbeef' (pass
+    mesh_interface.node_num)."""
+
+    def __init__(self, send_fragment, deliver, clock=time.monotonic, peer_key=str):
+        self.send_fragment = send_fragment
+        self.deliver = deliver
+        self.clock = clock
+        self.peer_key = peer_key
+        self.partials = {} # (sender, msg_id) -> _Partial, oldest first
+        self.buffered = 0
+        self.completed = {} # (sender, msg_id) -> None, oldest first
+        self.sent = {} # msg_id -> _Sent
+        self._next_id = random.getrandbits(16)
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send(self, destination, portnum, data, channel=0, priority=0):
+        """Split and queue data. The Future completes when every fragment
+        has been handed to the radio."""
+        with self._cond:
+            msg_id = self._next_id
+            self._next_id = (self._next_id + 1) & 0xFFFF
+            fragments = split(msg_id, portnum, data)
+            self.sent[msg_id] = _Sent(destination, channel, priority, fragments, self.clock())
+            self._cond.notify()
+        futures = [self.send_fragment(destination, f, channel, priority) for f in fragments]
+        return _all_of(futures)
+
+    def receive(self, sender, data, broadcast=False, context=None):
+        """Feed every packet from FRAGMENT_PORTNUM here."""
+        if len(data) < _HEADER.size:
+            return
+        version, kind, msg_id = _HEADER.unpack_from(data)
+        if version != FRAGMENT_VERSION:
+            return
+        if kind == REQUEST:
+            self._on_request(sender, msg_id, data[_HEADER.size:])
+        elif kind == DATA and len(data) >= _HEADER.size + _DATA.size:
+            self._on_data(sender, msg_id, data, broadcast, context)
+
+    def _on_data(self, sender, msg_id, data, broadcast, context):
+        portnum, index, count = _DATA.unpack_from(data, _HEADER.size)
+        chunk = data[_HEADER.size + _DATA.size:]
+        key = (str(sender), msg_id)
+        message = None
+        with self._cond:
+            if key in self.completed:
+                if not broadcast:
+                    self._ack(sender, msg_id) # Our "got it all" was lost - say it again
+                return
+            partial = self.partials.get(key)
+            if partial is None:
+                if count == 0 or count > MAX_FRAGMENTS:
+                    return
+                partial = self.partials[key] = _Partial(sender, portnum, count, self.clock(), broadcast)
+                self._cond.notify()
+            if index >= len(partial.parts) or partial.parts[index] is not None:
+                return # Out of range or a duplicate
+            if partial.size + len(chunk) > MAX_MESSAGE:
+                self._drop(key)
+                return
+            partial.parts[index] = chunk
+            partial.have += 1
+            partial.size += len(chunk)
+            partial.last_seen = self.clock()
+            partial.context = context
+            self.buffered += len(chunk)
+            if partial.have == len(partial.parts):
+                self._drop(key)
+                self._remember(key)
+                message = b"".join(partial.parts)
+                if not broadcast:
+                    self._ack(sender, msg_id)
+            else:
+                self._enforce_caps(key)
+        if message is not None:
+            self.deliver(partial.portnum, message, partial.context)
+
+    def _on_request(self, sender, msg_id, bitmap):
+        with self._cond:
+            sent = self.sent.get(msg_id)
+            if sent is None:
+                return
+            if sent.destination is not None and self.peer_key(sender) != self.peer_key(sent.destination):
+                return # Only a DM's recipient gets its fragments resent
+            if not bitmap:
+                del self.sent[msg_id] # Receiver has it all
+                return
+            wanted = [sent.fragments[i] for i in range(min(len(bitmap) * 8, len(sent.fragments)))
+                      if bitmap[i // 8] >> (i % 8) & 1]
+        for fragment in wanted:
+            self.send_fragment(sent.destination, fragment, sent.channel, sent.priority)
+
+    def _ack(self, sender, msg_id):
+        self.send_fragment(sender, request(msg_id, []), 0, PRIORITY_CONTROL)
+
+    def _drop(self, key):
+        partial = self.partials.pop(key, None)
+        if partial:
+            self.buffered -= partial.size
+
+    def _remember(self, key):
+        self.completed[key] = None
+        if len(self.completed) > MAX_COMPLETED:
+            del self.completed[next(iter(self.completed))]
+
+    def _enforce_caps(self, keep):
+        # Oldest partial messages go first; never the one just added to
+        while len(self.partials) > MAX_PARTIALS or self.buffered > MAX_BUFFERED:
+            oldest = next((k for k in self.partials if k != keep), None)
+            if oldest is None:
+                break
+            print(f"Fragment buffer full, dropping partial message {oldest}")
+            self._drop(oldest)
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _check(self, now):
+        """Under the lock: requests to send for stalled messages, and expiry."""
+        requests = []
+        for key, partial in list(self.partials.items()):
+            if now - partial.first_seen > REASSEMBLY_TIMEOUT:
+                print(f"Giving up on partial message {key}")
+                self._drop(key)
+            elif now - partial.last_seen > GAP_TIMEOUT:
+                if partial.requests >= MAX_REQUESTS:
+                    print(f"Giving up on partial message {key}")
+                    self._drop(key)
+                    continue
+                partial.requests += 1
+                partial.last_seen = now # Give the resends a gap's time to arrive
+                requests.append((partial.sender, key[1], partial.missing()))
+        for msg_id, sent in list(self.sent.items()):
+            if now - sent.time > KEEP_SENT:
+                del self.sent[msg_id]
+        return requests
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                if not self.partials and not self.sent:
+                    self._cond.wait()
+                    continue
+                requests = self._check(self.clock())
+                if not requests:
+                    self._cond.wait(GAP_TIMEOUT / 4)
+                    continue
+            for sender, msg_id, missing in requests:
+                try:
+                    self.send_fragment(sender, request(msg_id, missing), 0, PRIORITY_CONTROL)
+                except Exception as e:
+                    print(f"Fragment request failed: {e}")
+
+
+def _all_of(futures):
+    """One Future for a list of them: the last result, or the first error."""
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(f):
+        with lock:
+            remaining[0] -= 1
+            if combined.done():
+                return
+            if f.exception():
+                combined.set_exception(f.exception())
+            elif remaining[0] == 0:
+                combined.set_result(f.result())
+    for f in futures:
+        f.add_done_callback(done)
+    return combined
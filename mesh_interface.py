@@ -1,12 +1,154 @@
 import meshtastic.serial_interface
 import meshtastic.protobuf.mesh_pb2
+from meshtastic.protobuf import portnums_pb2
 import serial.tools.list_ports
+import bisect
 import threading
 import time
+from concurrent.futures import Future
 import math
-import json
+import sqlite3
 from datetime import datetime
 from pubsub import pub
+from chat_history import ChatHistory, PAGE_SIZE
+from chat_store import ChatStore, ChatMessage
+from mesh_dispatch import Dispatcher
+from mesh_scheduler import OutboundScheduler, PRIORITY_CHAT, PRIORITY_GAME, PRIORITY_BULK
+import mesh_capture
+import mesh_coalesce
+import mesh_compress
+import mesh_events
+import mesh_fragment
+import mesh_positions
+
+
+def node_num(node_id):
+    """A node id in any of the forms we meet - 3735928559 (packet 'from'),
+    '!deadbeef' (node list keys, user id) or '3735928559' - as the node
+    number, the one form used everywhere else. None if it isn't a node id."""
+    if isinstance(node_id, bool):
+        return None
+    if isinstance(node_id, int):
+        return node_id
+    if isinstance(node_id, str):
+        text = node_id.strip()
+        if text.startswith('!'):
+            try:
+                return int(text[1:], 16)
+            except ValueError:
+                return None
+        if text.isdigit():
+            return int(text)
+    return None
+
+
+class NodeDirectory:
+    """Known nodes by node number, with indexes on short and long name.
+
+    Kept up to date one node at a time as node info arrives (GUI thread
+    only), so turning an id or a name into a node never scans the node
+    list. Node dicts are the library's own, which it keeps updating in
+    place (position, metrics), so only name changes need reporting here.
+    """
+
+    def __init__(self):
+        self.nodes = {} # num -> node dict
+        self._names = {} # num -> (short, long) as indexed
+        self._by_name = {} # lowercase short or long name -> num (latest wins)
+        self._sorted = [] # (lowercase name, num) for prefix search
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node_id):
+        return node_num(node_id) in self.nodes
+
+    def update(self, node, node_id=None):
+        """Add or refresh a node dict. Returns its number (None if it has
+        no usable id)."""
+        user = node.get('user') or {}
+        num = node.get('num')
+        if not isinstance(num, int):
+            num = node_num(user.get('id'))
+        if num is None:
+            num = node_num(node_id)
+        if num is None:
+            return None
+        self.nodes[num] = node
+        names = (user.get('shortName') or '', user.get('longName') or '')
+        old = self._names.get(num)
+        if old != names:
+            if old:
+                self._unindex(num, old)
+            self._names[num] = names
+            for name in set(names):
+                if name:
+                    key = name.lower()
+                    self._by_name[key] = num
+                    bisect.insort(self._sorted, (key, num))
+        return num
+
+    def _unindex(self, num, names):
+        for name in set(names):
+            if not name:
+                continue
+            key = name.lower()
+            if self._by_name.get(key) == num:
+                del self._by_name[key]
+            i = bisect.bisect_left(self._sorted, (key, num))
+            if i < len(self._sorted) and self._sorted[i] == (key, num):
+                del self._sorted[i]
+
+    def clear(self):
+        self.__init__()
+
+    def get(self, node_id):
+        return self.nodes.get(node_num(node_id))
+
+    def short_name(self, node_id):
+        short, long = self._names.get(node_num(node_id), ('', ''))
+        return short or long or self._label(node_id)
+
+    def long_name(self, node_id):
+        short, long = self._names.get(node_num(node_id), ('', ''))
+        return long or short or self._label(node_id)
+
+    def _label(self, node_id):
+        num = node_num(node_id)
+        return f"!{num:08x}" if num is not None else str(node_id)
+
+    def search(self, prefix, limit=20):
+        """Node numbers whose short or long name starts with prefix
+        (case-insensitive), in name order."""
+        key = prefix.lower()
+        found = []
+        i = bisect.bisect_left(self._sorted, (key,))
+        while i < len(self._sorted) and len(found) < limit:
+            name, num = self._sorted[i]
+            if not name.startswith(key):
+                break
+            if num not in found:
+                found.append(num)
+            i += 1
+        return found
+
+    def resolve(self, text):
+        """What the user typed (an id, a short or long name, or the start of
+        exactly one name) -> node number, or None."""
+        text = text.strip()
+        if not text:
+            return None
+        num = node_num(text)
+        if num is not None and (text.startswith('!') or num in self.nodes):
+            return num
+        num = self._by_name.get(text.lower())
+        if num is not None:
+            return num
+        matches = self.search(text, limit=2)
+        if len(matches) == 1:
+            return matches[0]
+        return node_num(text) # An unknown node's number
+
 
 class MeshInterface:
     def __init__(self):
@@ -15,19 +157,71 @@ class MeshInterface:
         self.my_node_info = {}
         self.connected = False
         
-        # Chat storage: 
-        # 'channels': { index: [ {from, text, time}, ... ] }
-        # 'dms': { node_id: [ {from, text, time}, ... ] }
-        self.chats = {
-            'channels': {},
-            'dms': {}
-        }
+        # Chat storage (capped per conversation, see chat_store):
+        # chats.channels: { index: Conversation of ChatMessage }
+        # chats.dms: { node_id: Conversation of ChatMessage }
+        self.chats = ChatStore()
         self.traces = {} # dest_id: [hops...]
         
+        # Change counters, bumped (on the GUI thread) whenever that kind of
+        # data changes, so panels can skip redraws when nothing moved.
+        # Each chat conversation also has its own Conversation.version.
+        self.versions = {'chats': 0, 'nodes': 0, 'traces': 0, 'channels': 0, 'telemetry': 0}
+        
+        # Chat, trace and node history on disk (see chat_history). Only the
+        # list of conversations is read now; messages are paged in by the GUI.
+        self.known_nodes = {} # Last seen node info, for when we're offline
+        # Id and name lookups (see NodeDirectory); node numbers are the
+        # canonical id, DM conversations are keyed by them too
+        self.directory = NodeDirectory()
+        # Where they all are, for distance sorting (see mesh_positions)
+        self.positions = mesh_positions.PositionTable()
+        try:
+            self.history = ChatHistory()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Chat history disabled: {e}")
+            self.history = None
+        if self.history:
+            for kind, conv in self.history.conversations():
+                self.chats.get(kind, conv, create=True)
+            self.traces.update(self.history.latest_traces())
+            self.known_nodes = self.history.nodes()
+            for node_id, node in self.known_nodes.items():
+                self._index_node(node, node_id)
+        
+        # All sends go through one paced queue (see mesh_scheduler)
+        self.outbound = OutboundScheduler()
+        # Small app payloads to the same node share a packet (see mesh_coalesce).
+        # Set window to 0 to turn it off.
+        self.coalescer = mesh_coalesce.Coalescer(self._send_single, self._send_bundle)
+        # Chat DMs too? Only for peers running this app - stock clients
+        # can't read bundles
+        self.coalesce_text = False
+        # Compress all outgoing text (mesh_compress)? Same caveat - stock
+        # clients show compressed messages as garbage. Text too long for one
+        # packet is compressed regardless.
+        self.compress_text = False
+        # Payloads bigger than one packet are split and reassembled here
+        self.fragmenter = mesh_fragment.Fragmenter(self._send_fragment, self._dispatch_inner, peer_key=node_num)
+        
+        self.capture = None # mesh_capture.CaptureWriter while capturing
+        # Radio events waiting for the GUI thread (see process_events)
+        self.events = mesh_events.EventQueue()
+        
+        # Incoming packets go to handlers by port; anything else is ignored
+        self.dispatcher = Dispatcher()
+        self.dispatcher.register(portnums_pb2.PortNum.TEXT_MESSAGE_APP, self._on_text)
+        self.dispatcher.register(portnums_pb2.PortNum.TRACEROUTE_APP, self._on_traceroute)
+        self.dispatcher.register(mesh_coalesce.BUNDLE_PORTNUM, self._on_bundle)
+        self.dispatcher.register(mesh_fragment.FRAGMENT_PORTNUM, self._on_fragment)
+        for port in (portnums_pb2.PortNum.POSITION_APP, portnums_pb2.PortNum.NODEINFO_APP, portnums_pb2.PortNum.TELEMETRY_APP):
+            self.dispatcher.register(port, self._on_node_data)
+        
         # We start disconnected. User must select port.
         pub.subscribe(self.on_meshtastic_message, "meshtastic.receive")
         pub.subscribe(self.on_connection, "meshtastic.connection.established")
         pub.subscribe(self.on_lost, "meshtastic.connection.lost")
+        pub.subscribe(self.on_node_updated, "meshtastic.node.updated")
 
     def get_available_ports(self):
         """Returns a list of available serial ports."""
@@ -44,16 +238,27 @@ class MeshInterface:
             # If explicit baud rate looping is needed, we'd have to handle it at the stream level, 
             # but SerialInterface manages the stream creation.
             # We'll rely on SerialInterface's robust connection logic first.
-            self.interface = meshtastic.serial_interface.SerialInterface(devPath=port)
+            if port.startswith("replay:"):
+                # A capture file standing in for the radio (see mesh_capture)
+                path, speed = mesh_capture.parse_replay_port(port)
+                self.interface = mesh_capture.ReplayInterface(path, speed)
+            else:
+                self.interface = meshtastic.serial_interface.SerialInterface(devPath=port)
             self.connected = True
             
             # Re-subscribe if needed, though usually pubsub persists. 
             # But we might need to refresh node list.
             self.nodes = self.interface.nodes
+            for node_id, node in list((self.nodes or {}).items()):
+                self._index_node(node, node_id)
+                self._save_node(node_id, node)
             try:
                 self.my_node_info = self.interface.getMyNodeInfo()
             except:
                 self.my_node_info = {}
+            if self.capture:
+                self._capture_snapshot()
+            self._bump_all()
                 
             print(f"Connected to {port}")
             return True
@@ -75,160 +280,322 @@ class MeshInterface:
         self.connected = False
         self.nodes = {}
         self.my_node_info = {}
+        self._bump_all()
         print("Disconnected")
 
     def on_meshtastic_message(self, packet, interface):
-        # Handle incoming messages
-        if 'decoded' in packet:
-            decoded = packet['decoded']
-            if 'text' in decoded:
-                try:
-                    text = decoded['text']
-                    sender = packet.get('from')
-                    to = packet.get('to')
-                    portnum = decoded.get('portnum') # TEXT_MESSAGE_APP = 1
-                    
-                    # Determine if it's a DM or Broadcast
-                    # In Meshtastic, broadcasts are usually to ^all or a channel index is implied?
-                    # If 'to' is a specific node ID, it's a DM.
-                    # If 'to' is ^all (broadcast address), it's a broadcast.
-                    # Actually, packet 'to' field is a node ID. 
-                    # Broadcast ID is 0xFFFFFFFF (4294967295)
-                    
-                    is_broadcast = (to == 4294967295)
-                    
-                    timestamp = packet.get('rxTime', time.time())
-                    
-                    msg_obj = {
-                        'from': sender,
-                        'to': to,
-                        'text': text,
-                        'time': timestamp,
-                        'is_self': False # Incoming
-                    }
-                    
-                    if is_broadcast:
-                        # For simplicity, assign to channel 0 ("Primary") if channel index not explicitly found
-                        # In real packets, 'channel' key might be present in packet top level or decoded?
-                        # Using 0 for now as main chat.
-                        channel_idx = 0 
-                        if 'channel' in packet:
-                            channel_idx = packet['channel']
-                            
-                        if channel_idx not in self.chats['channels']:
-                            self.chats['channels'][channel_idx] = []
-                        self.chats['channels'][channel_idx].append(msg_obj)
-                        
-                    else:
-                        # Direct Message
-                        # Store under the sender's ID so we see it in our DM list with them.
-                        # Important: ensure sender is treated consistently (int vs string).
-                        # Sender in packet is usually int.
-                        
-                        # Use my_info to check if I am the sender (shouldn't happen in RX unless echo)
-                        # but just in case. 
-                        
-                        other_node = sender
-                        if other_node not in self.chats['dms']:
-                            self.chats['dms'][other_node] = []
-                        self.chats['dms'][other_node].append(msg_obj)
-                        print(f"DM Received from {other_node}: {text}") # Debug log
-                        
-                    # Detect Chess Packet (JSON)
-                    # Try parse
-                    if text.strip().startswith('{') and '"chess":' in text:
-                         try:
-                             payload = json.loads(text)
-                             if 'chess' in payload:
-                                 # Publish chess event
-                                 pub.sendMessage('chess.packet', payload=payload, sender=other_node)
-                                 print(f"Chess packet detected from {other_node}")
-                         except json.JSONDecodeError:
-                             pass
-                        
-                except KeyError:
-                    pass
-
-        # Handle Traceroute responses
-        if 'decoded' in packet:
-            decoded = packet['decoded']
-            # DEBUG: Dump keys to identify trace packet
-            # print(f"DEBUG RX Packet Decoded: {decoded}") 
-            
-            # Check for ROUTING_APP (PortNum=34) or ADMIN_APP?
-            # TraceRoute is often portnum=3? Or part of ROUTING?
-            # Meshtastic lib usually handles parsing into 'route' if it's a valid trace response.
-            
-            if 'requestId' in decoded and 'route' in decoded:
-                 # This is a trace response
-                 route = decoded['route']
-                 sender = packet.get('from')
-                 self.traces[sender] = route
-                 print(f"Trace received from {sender}: {route}")
+        # Runs on the meshtastic reader thread: only queue it up. The GUI
+        # thread handles it in process_events().
+        capture = self.capture
+        if capture:
+            capture.write(mesh_capture.PACKET, packet)
+        self.events.post(mesh_events.PACKET, mesh_events.snapshot(packet))
+
+    def process_events(self, max_events=mesh_events.MAX_BATCH, budget=mesh_events.FRAME_BUDGET):
+        """Handle queued radio events. Call from the GUI thread only - this
+        is where chats, traces and nodes change and where handlers (see
+        mesh_dispatch) run. Returns how many events were handled."""
+        return self.events.drain(self._handle_event, max_events, budget)
+
+    def _handle_event(self, kind, args):
+        if kind == mesh_events.PACKET:
+            self.dispatcher.dispatch(args[0])
+            self._track_node(args[0].get('from'))
+        elif kind == mesh_events.NODE_UPDATED:
+            node = args[0]
+            node_id = node.get('user', {}).get('id') or node.get('num')
+            if node_id is not None:
+                self._index_node(node, node_id)
+                self._save_node(node_id, node)
+            self._bump('nodes')
+        elif kind == mesh_events.CALL:
+            fn, fn_args = args
+            fn(*fn_args)
+
+    def call_soon(self, fn, *args):
+        """For other threads: run fn(*args) on the GUI thread."""
+        self.events.call_soon(fn, *args)
+
+    def _dispatch_inner(self, portnum, payload, raw):
+        # A packet carried inside another (bundle record, reassembled
+        # fragments) - handle it as if it came alone
+        decoded = dict(raw['decoded'], portnum=portnum, payload=payload)
+        decoded.pop('text', None) # Packet.text decodes the inner payload
+        self.dispatcher.dispatch(dict(raw, decoded=decoded))
+
+    def _on_bundle(self, packet):
+        for record_port, payload in mesh_coalesce.unpack(packet.payload):
+            self._dispatch_inner(record_port, payload, packet.raw)
+
+    def _on_fragment(self, packet):
+        self.fragmenter.receive(packet.sender, packet.payload, packet.is_broadcast, packet.raw)
+
+    def _on_text(self, packet):
+        text = packet.text
+        if not text:
+            return # Empty or an undecodable compressed payload
+        sender = packet.sender
+        to = packet.to
+        
+        # Determine if it's a DM or Broadcast
+        # If 'to' is a specific node ID, it's a DM.
+        # Broadcast ID is 0xFFFFFFFF (4294967295)
+        is_broadcast = packet.is_broadcast
+        
+        msg_obj = ChatMessage(sender, to, text, packet.rx_time, is_self=False) # Incoming
+        
+        if is_broadcast:
+            # Channel index comes on the packet; 0 ("Primary") if missing
+            channel_idx = packet.channel
+            self._store_chat('channel', channel_idx, msg_obj)
             
-            # Fallback debug: check for portnum 3 (TRACEROUTE) or 34 (ROUTING)
-            portnum = decoded.get('portnum')
-            if portnum in [3, 34]:
-                 print(f"DEBUG: Routing/Trace packet from {packet.get('from')}: {decoded}")
+        else:
+            # Direct Message
+            # Store under the sender's ID so we see it in our DM list with them.
+            # Important: ensure sender is treated consistently (int vs string).
+            # Sender in packet is usually int.
+            other_node = sender
+            self._store_chat('dm', other_node, msg_obj)
+            print(f"DM Received from {other_node}: {text}") # Debug log
 
+    def _on_traceroute(self, packet):
+        # Trace responses carry the route (older library versions put it
+        # straight in decoded, newer ones under 'traceroute')
+        decoded = packet.decoded
+        route = decoded.get('route')
+        if route is None:
+            route = decoded.get('traceroute', {}).get('route')
+        if 'requestId' in decoded and route is not None:
+             sender = packet.sender
+             self.traces[sender] = route
+             self._bump('traces')
+             if self.history:
+                 self.history.add_trace(sender, route, time.time())
+             print(f"Trace received from {sender}: {route}")
 
     def on_connection(self, interface, topic=pub.AUTO_TOPIC):
         self.connected = True
+        self.call_soon(self._bump_all)
         print("Connected to Meshtastic device")
 
     def on_lost(self, interface, topic=pub.AUTO_TOPIC):
         self.connected = False
+        self.call_soon(self._bump_all)
         print("Lost connection to Meshtastic device")
 
+    def _bump(self, domain):
+        self.versions[domain] += 1
+
+    def _bump_all(self):
+        for domain in self.versions:
+            self.versions[domain] += 1
+
+    def version(self, *domains):
+        """Current versions of the given domains; compare with what a panel
+        last drew to see if it needs redrawing."""
+        return tuple(self.versions[d] for d in domains)
+
+    def _on_node_data(self, packet):
+        # The library has already folded this position/user/telemetry
+        # packet into its node list. A new name only shows up in the node
+        # list, though - index it.
+        user = packet.decoded.get('user')
+        if user:
+            node = (getattr(self.interface, 'nodes', None) or {}).get(user.get('id'))
+            if node is None: # Not in the library's list (replay, odd id) - keep our own
+                node = dict(self.directory.get(packet.sender) or {}, num=packet.sender, user=user)
+            self._index_node(node)
+        self._bump('nodes')
+        if packet.sender == self.my_node_info.get('num'):
+            self._bump('telemetry')
+
+    def on_node_updated(self, node, interface=None):
+        # Reader thread, like on_meshtastic_message
+        capture = self.capture
+        if capture:
+            capture.write(mesh_capture.NODE, node)
+        self.events.post(mesh_events.NODE_UPDATED, mesh_events.snapshot(node))
+
+    def start_capture(self, path):
+        """Append every received packet (and node updates) to a capture
+        file that ReplayInterface can play back later."""
+        self.stop_capture()
+        self.capture = mesh_capture.CaptureWriter(path)
+        if self.interface:
+            self._capture_snapshot()
+        print(f"Capturing packets to {path}")
+
+    def stop_capture(self):
+        if self.capture:
+            capture, self.capture = self.capture, None
+            capture.close()
+            print(f"Capture stopped: {capture.count} records in {capture.path}")
+
+    def _capture_snapshot(self):
+        self.capture.write(mesh_capture.SNAPSHOT, {
+            'nodes': dict(self.nodes or {}),
+            'my_node': self.my_node_info or {},
+            'channels': self.get_channels(),
+        })
+
+    def _index_node(self, node, node_id=None):
+        num = self.directory.update(node, node_id)
+        if num is not None:
+            self.positions.update(num, node)
+        return num
+
+    def _track_node(self, num):
+        # Any packet can come with a new position or SNR for its sender (the
+        # library has already updated its node entry)
+        live = getattr(self.interface, 'nodesByNum', None) or {}
+        node = live.get(num)
+        if node is not None and node is not self.directory.get(num):
+            self._index_node(node) # First we've heard of it, or we only had last session's copy
+            return
+        node = self.directory.get(num)
+        if node is not None:
+            self.positions.update(num, node)
+
+    def _save_node(self, node_id, node):
+        self.known_nodes[node_id] = node
+        if self.history:
+            self.history.save_node(node_id, node, time.time())
+
+    def _store_chat(self, kind, key, msg):
+        # kind is 'channel' or 'dm'
+        if kind == 'dm' and node_num(key) is not None:
+            key = node_num(key) # One conversation per node whatever id form we were given
+        self.chats.add(self.chats.conversations(kind), key, msg)
+        self._bump('chats')
+        if self.history:
+            self.history.add_message(kind, key, msg)
+
+    def search_messages(self, text):
+        """Ranked hits across all channels and DMs (see chat_history.search)."""
+        if not self.history:
+            return []
+        return self.history.search(text)
+
+    def load_older(self, kind, key, count=PAGE_SIZE):
+        """Page up to `count` older messages of a conversation in from the
+        history file. Returns how many were added (0 = no more)."""
+        if not self.history:
+            return 0
+        return self.chats.load_older(self.history, kind, key, count)
+
     def send_message(self, text, destinationId=None, channelIndex=0):
         """
         Send a message. 
         destinationId: Node ID for DM. None for Broadcast.
         channelIndex: Channel index for Broadcast.
+        Returns a Future for the send (queued, see mesh_scheduler).
         """
         if self.interface:
+            if len(text.encode('utf-8')) > mesh_compress.MAX_TEXT_BYTES:
+                # The receiver would drop it - don't store it as sent
+                return self._failed(ValueError(f"Message too long (max {mesh_compress.MAX_TEXT_BYTES} bytes)"))
+            data = self._text_payload(text)
+            if len(data) > mesh_fragment.MAX_MESSAGE:
+                return self._failed(ValueError(f"Message too long ({len(data)} bytes compressed, max {mesh_fragment.MAX_MESSAGE})"))
             if destinationId:
                 # Direct Message
-                self.interface.sendText(text, destinationId=destinationId)
+                if self.coalesce_text and self.coalescer.accepts(data):
+                    future = self.coalescer.add(destinationId, portnums_pb2.PortNum.TEXT_MESSAGE_APP, data, 0, PRIORITY_CHAT)
+                else:
+                    self.coalescer.flush(destinationId)
+                    future = self._send_text(destinationId, data, 0)
                 # Store locally
-                msg_obj = {
-                    'from': self.my_node_info.get('user', {}).get('id'), # Should be my ID
-                    'to': destinationId,
-                    'text': text,
-                    'time': time.time(),
-                    'is_self': True
-                }
+                msg_obj = ChatMessage(self.my_node_info.get('user', {}).get('id'), # Should be my ID
+                                      destinationId, text, time.time(), is_self=True)
                 # For DMs, we assume destinationId is an integer if passed from GUI, or string?
                 # Serial interface expects numeric node ID usually, or string?
                 # It handles both, but let's be safe.
                 
                 # Store under the *other* person's ID
-                if destinationId not in self.chats['dms']:
-                    self.chats['dms'][destinationId] = []
-                self.chats['dms'][destinationId].append(msg_obj)
+                self._store_chat('dm', destinationId, msg_obj)
                 
             else:
                 # Broadcast
-                self.interface.sendText(text, channelIndex=channelIndex)
+                future = self._send_text(None, data, channelIndex)
                 # Store locally
-                msg_obj = {
-                    'from': self.my_node_info.get('user', {}).get('id'),
-                    'to': 'Broadcast',
-                    'text': text,
-                    'time': time.time(),
-                    'is_self': True
-                }
-                if channelIndex not in self.chats['channels']:
-                    self.chats['channels'][channelIndex] = []
-                self.chats['channels'][channelIndex].append(msg_obj)
+                msg_obj = ChatMessage(self.my_node_info.get('user', {}).get('id'),
+                                      'Broadcast', text, time.time(), is_self=True)
+                self._store_chat('channel', channelIndex, msg_obj)
+            return future
+        return self._not_connected()
+
+    def _text_payload(self, text):
+        # Compress when asked to, or when the plain text wouldn't fit in a
+        # packet anyway (see mesh_compress)
+        data = text.encode('utf-8')
+        if self.compress_text or len(data) > mesh_compress.MAX_PAYLOAD:
+            data, _ = mesh_compress.compress_text(text)
+        return data
+
+    def _send_text(self, destinationId, data, channelIndex):
+        if len(data) > mesh_compress.MAX_PAYLOAD:
+            # Still too long after compression - send it in pieces
+            return self.fragmenter.send(destinationId, portnums_pb2.PortNum.TEXT_MESSAGE_APP, data, channelIndex, PRIORITY_CHAT)
+        return self._send_single(destinationId, portnums_pb2.PortNum.TEXT_MESSAGE_APP, data, channelIndex, PRIORITY_CHAT)
+
+    def send_data(self, data, destinationId, portNum, channelIndex=0, priority=PRIORITY_GAME, coalesce=True):
+        """Send raw bytes to an app port (not stored as chat). Returns a Future.
+        Small payloads may wait up to coalescer.window to share a packet;
+        ones too big for a packet go out as bulk fragments (mesh_fragment)."""
+        if not self.interface:
+            return self._not_connected()
+        if coalesce and self.coalescer.accepts(data):
+            return self.coalescer.add(destinationId, portNum, data, channelIndex, priority)
+        self.coalescer.flush(destinationId, channelIndex)
+        if len(data) > mesh_compress.MAX_PAYLOAD:
+            return self.fragmenter.send(destinationId, portNum, data, channelIndex, PRIORITY_BULK)
+        return self._send_single(destinationId, portNum, data, channelIndex, priority)
+
+    def _send_single(self, destinationId, portNum, data, channelIndex, priority):
+        # destinationId None = broadcast on channelIndex
+        if destinationId is None:
+            return self.outbound.submit(
+                lambda: self.interface.sendData(data, portNum=portNum, channelIndex=channelIndex),
+                ('channel', channelIndex), len(data), priority)
+        return self.outbound.submit(
+            lambda: self.interface.sendData(data, destinationId=destinationId, portNum=portNum, channelIndex=channelIndex),
+            destinationId, len(data), priority)
+
+    def _send_bundle(self, destinationId, data, channelIndex, priority):
+        return self._send_single(destinationId, mesh_coalesce.BUNDLE_PORTNUM, data, channelIndex, priority)
+
+    def _send_fragment(self, destinationId, data, channelIndex, priority):
+        return self._send_single(destinationId, mesh_fragment.FRAGMENT_PORTNUM, data, channelIndex, priority)
 
     def send_trace_route(self, dest_node_id):
-        """Sends a trace route request to the destination node."""
-        if self.interface:
-            self.interface.sendTraceRoute(dest_node_id, hopLimit=7) # Default hop limit
+        """Sends a trace route request to the destination node. Returns a Future."""
+        if not self.interface:
+            return self._not_connected()
+        return self.outbound.submit(lambda: self._send_trace_route(dest_node_id), dest_node_id, 0, PRIORITY_BULK)
+
+    def _send_trace_route(self, dest_node_id):
+        # Same request as interface.sendTraceRoute(), minus its blocking wait
+        # for the reply - that would stall the whole send queue. The reply
+        # arrives through on_meshtastic_message like any other packet.
+        return self.interface.sendData(
+            meshtastic.protobuf.mesh_pb2.RouteDiscovery(),
+            destinationId=dest_node_id,
+            portNum=portnums_pb2.PortNum.TRACEROUTE_APP,
+            wantResponse=True,
+            onResponse=self.interface.onResponseTraceRoute,
+            hopLimit=7) # Default hop limit
+
+    def _not_connected(self):
+        return self._failed(ConnectionError("Not connected"))
+
+    def _failed(self, error):
+        future = Future()
+        future.set_exception(error)
+        return future
 
     def get_trace(self, node_id):
-        return self.traces.get(node_id, [])
+        # Traces are filed under the replying node's number
+        return self.traces.get(node_id) or self.traces.get(node_num(node_id), [])
 
     def get_telemetry(self, node_id):
         """Retrieves telemetry (battery, chutil, etc) for a node."""
@@ -308,8 +675,19 @@ class MeshInterface:
 
     def get_nodes(self):
         if self.interface:
-            return self.interface.nodes
-        return {}
+            # A copy: the reader thread keeps updating the live dict
+            return dict(self.interface.nodes or {})
+        return self.known_nodes
+
+    def nodes_by_distance(self, limit=None):
+        """Known nodes nearest first, as (num, meters, bearing, snr) tuples;
+        meters is inf when we or they have no position."""
+        self.positions.set_origin(self._my_position())
+        return self.positions.nearest(limit)
+
+    def _my_position(self):
+        return (mesh_positions.node_position(self.my_node_info or {})
+                or self.positions.position(self.my_node_info.get('num') if self.my_node_info else None))
 
     def get_my_info(self):
         if self.interface:
@@ -333,6 +711,14 @@ class MeshInterface:
 
 
     def close(self):
+        for line in self.dispatcher.report():
+            print(f"Packet handler time - {line}")
+        self.coalescer.close()
+        self.fragmenter.close()
+        self.outbound.close()
+        if self.history:
+            self.history.close()
+        self.stop_capture()
         if self.interface:
             try:
                 self.interface.close()
@@ -0,0 +1,152 @@
+"""Distance and bearing from us to every node, computed with NumPy.
+
+PositionTable keeps one row per node (latitude, longitude, SNR) in flat
+arrays, updated a node at a time as packets arrive. Distances and bearings
+to all rows are one vectorized haversine over the arrays, done only when
+our own position or some node's position has changed since the last call,
+and the near-to-far order is an argsort of the result. A long MQTT-bridged
+session can see thousands of nodes; the trace tab still sorts them in well
+under a millisecond.
+"""
+import numpy as np
+
+EARTH_RADIUS = 6371000.0 # meters
+NO_SNR = -100.0
+
+COMPASS_POINTS = ("N", "NE", "E", "SE", "S", "SW", "W", "NW")
+
+
+def haversine(lat, lon, lats, lons):
+    """Meters from (lat, lon) to each of lats/lons (degrees, arrays)."""
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons - lon)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def bearing(lat, lon, lats, lons):
+    """Initial bearing in degrees (0 = north, clockwise) from (lat, lon) to each point."""
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dlambda = np.radians(lons - lon)
+    y = np.sin(dlambda) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlambda)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def compass(degrees):
+    """Bearing -> "N", "NE", ..."""
+    return COMPASS_POINTS[int((degrees + 22.5) // 45) % 8]
+
+
+def node_position(node):
+    """(lat, lon) from a node dict, or None. 0/0 means the node never had a fix."""
+    pos = node.get('position') or {}
+    lat = pos.get('latitude')
+    lon = pos.get('longitude')
+    if lat is None or lon is None or (lat == 0 and lon == 0):
+        return None
+    return lat, lon
+
+
+class PositionTable:
+    def __init__(self, capacity=256):
+        self.rows = {} # node num -> row
+        self.nums = [] # row -> node num
+        self.lat = np.full(capacity, np.nan)
+        self.lon = np.full(capacity, np.nan)
+        self.snr = np.full(capacity, NO_SNR)
+        self.origin = None # Our (lat, lon)
+        self._distance = None # Cached results, None = recompute
+        self._bearing = None
+        self._order = None
+
+    def __len__(self):
+        return len(self.nums)
+
+    def update(self, num, node):
+        """Take a node's position and SNR from its node dict."""
+        row = self.rows.get(num)
+        if row is None:
+            row = len(self.nums)
+            if row == len(self.lat):
+                self._grow()
+            self.rows[num] = row
+            self.nums.append(num)
+            self._order = None
+        pos = node_position(node)
+        lat, lon = pos if pos else (np.nan, np.nan)
+        if not (_same(self.lat[row], lat) and _same(self.lon[row], lon)):
+            self.lat[row] = lat
+            self.lon[row] = lon
+            self._distance = self._bearing = self._order = None
+        snr = node.get('snr')
+        snr = NO_SNR if snr is None else snr
+        if self.snr[row] != snr:
+            self.snr[row] = snr
+            self._order = None # Ties on distance are broken by SNR
+
+    def _grow(self):
+        extra = len(self.lat)
+        self.lat = np.concatenate((self.lat, np.full(extra, np.nan)))
+        self.lon = np.concatenate((self.lon, np.full(extra, np.nan)))
+        self.snr = np.concatenate((self.snr, np.full(extra, NO_SNR)))
+        # Cached results are per row - a new row needs them recomputed
+        self._distance = self._bearing = self._order = None
+
+    def position(self, num):
+        row = self.rows.get(num)
+        if row is None or np.isnan(self.lat[row]):
+            return None
+        return float(self.lat[row]), float(self.lon[row])
+
+    def set_origin(self, origin):
+        """Our own (lat, lon), or None if we don't know it."""
+        if origin != self.origin:
+            self.origin = origin
+            self._distance = self._bearing = self._order = None
+
+    def distances(self):
+        """Meters to each row (inf where either end has no position)."""
+        if self._distance is None or len(self._distance) != len(self.nums):
+            n = len(self.nums)
+            if self.origin is None:
+                self._distance = np.full(n, np.inf)
+            else:
+                d = haversine(self.origin[0], self.origin[1], self.lat[:n], self.lon[:n])
+                self._distance = np.where(np.isnan(d), np.inf, d)
+        return self._distance
+
+    def bearings(self):
+        """Degrees to each row (nan where unknown)."""
+        if self._bearing is None or len(self._bearing) != len(self.nums):
+            n = len(self.nums)
+            if self.origin is None:
+                self._bearing = np.full(n, np.nan)
+            else:
+                self._bearing = bearing(self.origin[0], self.origin[1], self.lat[:n], self.lon[:n])
+        return self._bearing
+
+    def order(self):
+        """Rows nearest first; unknown distances last, by SNR best first."""
+        if self._order is None or len(self._order) != len(self.nums):
+            n = len(self.nums)
+            by_snr = np.argsort(-self.snr[:n], kind='stable')
+            self._order = by_snr[np.argsort(self.distances()[by_snr], kind='stable')]
+        return self._order
+
+    def nearest(self, limit=None):
+        """[(num, meters, degrees, snr), ...] nearest first; meters inf and
+        degrees nan for nodes (or us) without a position."""
+        rows = self.order()[:limit]
+        distance = self.distances()[rows]
+        heading = self.bearings()[rows]
+        snr = self.snr[rows]
+        return [(self.nums[row], float(d), float(b), float(s))
+                for row, d, b, s in zip(rows.tolist(), distance, heading, snr)]
+
+
+def _same(a, b):
+    return a == b or (np.isnan(a) and np.isnan(b))
@@ -0,0 +1,185 @@
+"""Outbound send queue for MeshInterface.
+
+Every send goes through one scheduler thread instead of a thread per send:
+
+- per-destination FIFO: messages to the same node (or channel) leave in
+  the order they were queued
+- priority between destinations: acks before game moves before chat
+  before bulk (traces, big transfers); a destination's turn comes at the
+  best priority it has queued
+- airtime token bucket: each packet's LoRa time-on-air is estimated and
+  charged against a duty-cycle budget, so bursts are paced instead of
+  hammering the channel (and regional limits like EU868's 10% hold)
+
+submit() returns a concurrent.futures.Future for the send call's result.
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+PRIORITY_CONTROL = 0 # Acks
+PRIORITY_GAME = 1
+PRIORITY_CHAT = 2
+PRIORITY_BULK = 3 # Traces, fragments
+
+# Fraction of time we may transmit, and how much airtime a burst may use
+DUTY_CYCLE = 0.10
+BURST_AIRTIME = 10.0 # seconds
+
+# Meshtastic header (16 bytes) plus the protobuf Data wrapper around the payload
+PACKET_OVERHEAD = 20
+
+
+def lora_airtime(payload_len, sf=11, bw=250000, cr=5, preamble=16):
+    """Seconds on air for one packet (Semtech AN1200.13 formula). Defaults
+    are the LongFast preset: SF11, 250 kHz, coding rate 4/5."""
+    ts = (1 << sf) / bw
+    de = 1 if ts > 0.016 else 0 # Low data rate optimisation
+    n = 8 * (payload_len + PACKET_OVERHEAD) - 4 * sf + 28 + 16 # CRC on, explicit header
+    symbols = 8 + max(math.ceil(n / (4 * (sf - 2 * de))) * cr, 0)
+    return (preamble + 4.25 + symbols) * ts
+
+
+class AirtimeBucket:
+    """Token bucket in seconds of airtime, refilled at duty_cycle per second."""
+
+    def __init__(self, duty_cycle=DUTY_CYCLE, burst=BURST_AIRTIME, clock=time.monotonic):
+        self.rate = duty_cycle
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost):
+        """Seconds until `cost` can be spent (0 = now)."""
+        self._refill()
+        need = min(cost, self.burst) # A packet bigger than the bucket waits for a full one
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) / self.rate
+
+    def consume(self, cost):
+        self._refill()
+        self.tokens -= cost
+
+
+class _Job:
+    __slots__ = ('send', 'airtime', 'priority', 'seq', 'future')
+
+    def __init__(self, send, airtime, priority, seq):
+        self.send = send
+        self.airtime = airtime
+        self.priority = priority
+        self.seq = seq
+        self.future = Future()
+
+
+class OutboundScheduler:
+    def __init__(self, duty_cycle=DUTY_CYCLE, burst=BURST_AIRTIME, clock=time.monotonic):
+        self.bucket = AirtimeBucket(duty_cycle, burst, clock)
+        self.queues = {} # destination -> deque of _Job
+        self._heads = [] # heap of (priority, seq, destination), one live entry per destination
+        self._scheduled = {} # destination -> its live (priority, seq)
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._running = True
+        self.sent = 0
+        self.airtime_used = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, send, destination=None, size=0, priority=PRIORITY_CHAT):
+        """Queue send() (the actual interface call) for a packet of `size`
+        payload bytes. Returns a Future for its return value."""
+        with self._cond:
+            job = _Job(send, lora_airtime(size), priority, next(self._counter))
+            if not self._running:
+                job.future.set_exception(RuntimeError("Send queue closed"))
+                return job.future
+            q = self.queues.get(destination)
+            if q is None:
+                q = self.queues[destination] = deque()
+            q.append(job)
+            live = self._scheduled.get(destination)
+            if live is None or priority < live[0]:
+                # (Re)schedule the destination at its best queued priority;
+                # a superseded heap entry is skipped when it comes up
+                entry = (priority, q[0].seq)
+                self._scheduled[destination] = entry
+                heapq.heappush(self._heads, (entry[0], entry[1], destination))
+            self._cond.notify()
+        return job.future
+
+    def pending(self):
+        with self._cond:
+            return sum(len(q) for q in self.queues.values())
+
+    def close(self):
+        """Stop the thread; anything still queued fails."""
+        with self._cond:
+            self._running = False
+            for q in self.queues.values():
+                for job in q:
+                    job.future.set_exception(RuntimeError("Send queue closed"))
+            self.queues.clear()
+            self._heads.clear()
+            self._scheduled.clear()
+            self._cond.notify()
+
+    def _next_job(self):
+        """Under the lock: the job due next and its destination, or (None, None)."""
+        while self._heads:
+            priority, seq, destination = self._heads[0]
+            if self._scheduled.get(destination) != (priority, seq):
+                heapq.heappop(self._heads) # Superseded
+                continue
+            return self.queues[destination][0], destination
+        return None, None
+
+    def _take(self, destination):
+        heapq.heappop(self._heads)
+        q = self.queues[destination]
+        job = q.popleft()
+        if q:
+            entry = (min(j.priority for j in q), q[0].seq)
+            self._scheduled[destination] = entry
+            heapq.heappush(self._heads, (entry[0], entry[1], destination))
+        else:
+            del self.queues[destination]
+            del self._scheduled[destination]
+        return job
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                job, destination = self._next_job()
+                if job is None:
+                    self._cond.wait()
+                    continue
+                wait = self.bucket.delay(job.airtime)
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                self._take(destination)
+                if not job.future.set_running_or_notify_cancel():
+                    continue # Cancelled while queued
+                self.bucket.consume(job.airtime)
+                self.sent += 1
+                self.airtime_used += job.airtime
+
+            try:
+                job.future.set_result(job.send())
+            except Exception as e:
+                print(f"Send to {destination} failed: {e}")
+                job.future.set_exception(e)
@@ -0,0 +1,61 @@
+"""Paging older history into a conversation (chat_store + chat_history)."""
+from chat_history import ChatHistory
+from chat_store import ChatStore, ChatMessage
+
+
+def _texts(conv):
+    return [m.text for m in conv.range(conv.first)]
+
+
+def _history_with(path, texts, start_time):
+    history = ChatHistory(path)
+    for i, text in enumerate(texts):
+        history.add_message('channel', 0, ChatMessage(5, None, text, start_time + i))
+    history.close() # Writes everything out
+    return ChatHistory(path)
+
+
+def test_full_ring_still_pages_in_history(tmp_path):
+    path = str(tmp_path / "history.db")
+    history = _history_with(path, [f"old{i}" for i in range(30)], 1)
+    store = ChatStore(cap=10)
+    for i in range(10):
+        store.add_channel(0, ChatMessage(5, None, f"new{i}", 100 + i))
+    try:
+        conv = store.get('channel', 0)
+        assert store.load_older(history, 'channel', 0, 5) == 5
+        assert _texts(conv) == [f"old{i}" for i in range(25, 30)] + [f"new{i}" for i in range(10)]
+        while store.load_older(history, 'channel', 0, 5):
+            pass
+        assert _texts(conv) == [f"old{i}" for i in range(30)] + [f"new{i}" for i in range(10)]
+        assert conv.end - conv.first == 40
+        # New messages still push the oldest out of the ring, but paged-in
+        # history stays joined up to it
+        store.add_channel(0, ChatMessage(5, None, "newest", 200))
+        assert _texts(conv) == [f"old{i}" for i in range(30)] + [f"new{i}" for i in range(10)] + ["newest"]
+    finally:
+        history.close()
+
+
+def test_pages_in_this_sessions_overflow_first(tmp_path):
+    # More messages this session than the ring holds: the ones that fell out
+    # have no row id in memory, so the next page must still start with them
+    path = str(tmp_path / "history.db")
+    _history_with(path, [f"old{i}" for i in range(30)], 1).close()
+    history = ChatHistory(path)
+    store = ChatStore(cap=10)
+    for i in range(15):
+        msg = ChatMessage(5, None, f"new{i}", 100 + i)
+        store.add_channel(0, msg)
+        history.add_message('channel', 0, msg)
+    history.close()
+    history = ChatHistory(path)
+    try:
+        conv = store.get('channel', 0)
+        assert _texts(conv) == [f"new{i}" for i in range(5, 15)]
+        assert store.load_older(history, 'channel', 0, 5) == 5
+        assert _texts(conv)[:5] == [f"new{i}" for i in range(5)]
+        assert store.load_older(history, 'channel', 0, 5) == 5
+        assert _texts(conv)[:5] == [f"old{i}" for i in range(25, 30)]
+    finally:
+        history.close()
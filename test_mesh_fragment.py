@@ -0,0 +1,69 @@
+"""Long text: compress, fragment, reassemble, decode."""
+from concurrent.futures import Future
+
+import mesh_compress
+import mesh_fragment
+
+TEXT_PORTNUM = 1
+
+
+def _loopback():
+    """Two fragmenters wired back to back; returns (sender, received texts)."""
+    received = []
+    ends = {}
+
+    def link(to):
+        def send_fragment(destination, data, channel, priority):
+            ends[to].receive('a' if to == 'b' else 'b', data, broadcast=False)
+            future = Future()
+            future.set_result(None)
+            return future
+        return send_fragment
+
+    ends['a'] = mesh_fragment.Fragmenter(link('b'), lambda port, data, context: None)
+    ends['b'] = mesh_fragment.Fragmenter(link('a'), lambda port, data, context: received.append(mesh_compress.decode_text(data)))
+    return ends, received
+
+
+def test_fragmented_text_round_trip():
+    # Long enough to need several fragments even compressed, and well past
+    # the old 4 KB decompression cap
+    text = " ".join(f"Node {i} reports battery {i % 100}% at {i * 7 % 1000} m, signal ok." for i in range(120))
+    assert len(text.encode('utf-8')) > 4096
+    data, compressed = mesh_compress.compress_text(text)
+    assert compressed and len(data) > mesh_compress.MAX_PAYLOAD
+    ends, received = _loopback()
+    try:
+        ends['a'].send('b', TEXT_PORTNUM, data).result(timeout=5)
+        assert received == [text]
+    finally:
+        for end in ends.values():
+            end.close()
+
+
+def test_biggest_fragmented_message_decompresses():
+    assert mesh_compress.MAX_TEXT_BYTES >= mesh_fragment.MAX_MESSAGE
+    text = "x" * mesh_compress.MAX_TEXT_BYTES
+    assert mesh_compress.decode_text(mesh_compress.compress(text.encode('utf-8'))) == text
+
+
+def test_requests_only_answered_for_the_recipient():
+    sent = []
+
+    def send_fragment(destination, data, channel, priority):
+        sent.append(destination)
+        future = Future()
+        future.set_result(None)
+        return future
+
+    fragmenter = mesh_fragment.Fragmenter(send_fragment, lambda port, data, context: None)
+    try:
+        fragmenter.send('b', TEXT_PORTNUM, b"x" * 1000)
+        msg_id = next(iter(fragmenter.sent))
+        count = len(sent)
+        fragmenter.receive('eve', mesh_fragment.request(msg_id, [0, 1]))
+        assert len(sent) == count
+        fragmenter.receive('b', mesh_fragment.request(msg_id, [0, 1]))
+        assert sent[count:] == ['b', 'b']
+    finally:
+        fragmenter.close()
@@ -0,0 +1,33 @@
+"""Perft counts and a throughput floor for chess_engine (see chess_perft)."""
+import io
+
+import pytest
+
+import chess_perft
+from chess_engine import GameState
+
+# Far below what move generation does on a slow machine (well over 1M nps
+# here), so only a real regression trips it
+MIN_NPS = 100000
+
+
+@pytest.mark.parametrize("name,fen,expected", chess_perft.REFERENCE_POSITIONS,
+                         ids=[name for name, _, _ in chess_perft.REFERENCE_POSITIONS])
+def test_perft_counts(name, fen, expected):
+    gs = GameState(fen)
+    for depth in (1, 2):
+        assert chess_perft.perft(gs, depth) == expected[depth - 1]
+
+
+def test_divide_adds_up():
+    name, fen, expected = chess_perft.REFERENCE_POSITIONS[1] # kiwipete
+    results = chess_perft.divide(GameState(fen), 2)
+    assert len(results) == expected[0]
+    assert sum(nodes for _, nodes in results) == expected[1]
+
+
+def test_suite_throughput():
+    out = io.StringIO()
+    ok, nodes, seconds = chess_perft.run_suite(3, out=out)
+    assert ok, out.getvalue()
+    assert nodes / seconds >= MIN_NPS, out.getvalue()